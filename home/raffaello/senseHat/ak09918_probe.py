@@ -1,14 +1,18 @@
-from smbus import SMBus
+# AK09918/AK09916 WHO_AM_I sul bus principale (risponde solo se il mag è in bypass)
+# Bus I2C condiviso con il logger (spacewx_logs/i2c_bus.py): I2C_BACKEND=sim per provarlo senza HAT
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "spacewx_logs"))
+from i2c_bus import get_bus
 
 ADDR = 0x0C
 WHO_AM_I = 0x01  # AK09918C WHO_AM_I
 EXPECT = 0x10    # dovrebbe rispondere 0x10
 
-bus = SMBus(1)
+bus = get_bus()
 try:
     who = bus.read_byte_data(ADDR, WHO_AM_I)
     print("WHO_AM_I:", hex(who))
 except Exception as e:
     print("Errore:", e)
+print(bus.stats.snapshot())
 bus.close()
-
@@ -1,7 +1,9 @@
 #!/usr/bin/env python3
 # Lettura SHTC3 (addr 0x70) - temperatura e umidità
-from smbus import SMBus
-import time
+# Bus I2C condiviso con il logger (spacewx_logs/i2c_bus.py): I2C_BACKEND=sim per provarlo senza HAT
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "spacewx_logs"))
+from i2c_bus import get_bus
 
 ADDR = 0x70
 CMD_WAKE   = 0x3517
@@ -9,7 +11,7 @@ CMD_SLEEP  = 0xB098
 CMD_MEAS_N = 0x7866  # normal power, clock stretching disabled
 
 def write_cmd(bus, cmd):
-    bus.write_i2c_block_data(ADDR, (cmd>>8)&0xFF, [cmd & 0xFF])
+    bus.write_device(ADDR, ((cmd>>8)&0xFF, cmd & 0xFF))
 
 def crc_ok(bytes2, crc):
     # SHTC3 CRC8 poly=0x31 init=0xFF
@@ -22,13 +24,15 @@ def crc_ok(bytes2, crc):
     return rem == crc
 
 def read():
-    bus = SMBus(1)
+    bus = get_bus()
+    write_cmd(bus, CMD_WAKE)
+    bus.sleep(0.001)
     try:
-        write_cmd(bus, CMD_WAKE)
-        time.sleep(0.001)
         write_cmd(bus, CMD_MEAS_N)
-        time.sleep(0.015)
-        data = bus.read_i2c_block_data(ADDR, 0x00, 6)
+        bus.sleep(0.015)
+        data = bus.read_device(ADDR, 6)
+        if len(data) != 6:
+            raise RuntimeError("short read")
         t_raw = data[0:2]; t_crc = data[2]
         h_raw = data[3:5]; h_crc = data[5]
         if not (crc_ok(t_raw, t_crc) and crc_ok(h_raw, h_crc)):
@@ -37,11 +41,11 @@ def read():
         h_code = (h_raw[0]<<8)|h_raw[1]
         t_c = -45 + 175 * (t_code/65535.0)
         rh  = 100 * (h_code/65535.0)
-        write_cmd(bus, CMD_SLEEP)
         return round(t_c,2), round(rh,1)
     finally:
-        bus.close()
+        write_cmd(bus, CMD_SLEEP)
 
 if __name__ == "__main__":
     print(dict(zip(["t_c","rh_pct"], read())))
+    print(get_bus().stats.snapshot())
 
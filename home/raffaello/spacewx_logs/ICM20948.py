@@ -1,8 +1,8 @@
 #!/usr/bin/python
 # -*- coding:utf-8 -*-
 import time
-import smbus
 import math
+from i2c_bus import get_bus
 Gyro  = [0,0,0]
 Accel = [0,0,0]
 Mag   = [0,0,0]
@@ -96,6 +96,7 @@ REG_ADD_I2C_SLV1_ADDR                = 0x07
 REG_ADD_I2C_SLV1_REG                 = 0x08
 REG_ADD_I2C_SLV1_CTRL                = 0x09
 REG_ADD_I2C_SLV1_DO                  = 0x0A
+REG_ADD_I2C_MST_ODR_CONFIG           = 0x00
 
 # define ICM-20948 Register  end
 
@@ -111,27 +112,31 @@ REG_VAL_MAG_MODE_PD                  = 0x00
 REG_VAL_MAG_MODE_SM                  = 0x01
 REG_VAL_MAG_MODE_10HZ                = 0x02
 REG_VAL_MAG_MODE_20HZ                = 0x04
-REG_VAL_MAG_MODE_50HZ                = 0x05
+REG_VAL_MAG_MODE_50HZ                = 0x06   # AK09916: continuous mode 3 = 00110b (0x05 non è un modo valido)
 REG_VAL_MAG_MODE_100HZ               = 0x08
 REG_VAL_MAG_MODE_ST                  = 0x10
 # define ICM-20948 MAG Register  end
 
 MAG_DATA_LEN                         =6
+MAG_BURST_LEN                        =8   # HXL..HZH + TMPS(dummy) + ST2 (la lettura di ST2 sblocca il dato successivo)
+REG_VAL_MAG_ST2_HOFL                 =0x08
 
 class ICM20948(object):
-  def __init__(self,address=I2C_ADD_ICM20948):
+  def __init__(self,address=I2C_ADD_ICM20948,bus=None):
     self._address = address
-    self._bus = smbus.SMBus(1)
+    self._bus = bus or get_bus()          # I2CBus condiviso (smbus o simulatore)
+    self._bank = None                     # banco registri corrente (evita switch ridondanti)
+    self._mag_continuous = False
     bRet=self.icm20948Check()             #Initialization of the device multiple times after power on will result in a return error
     # while true != bRet:
     #   print("ICM-20948 Error\n" )
     #   time.sleep(0.5)
     # print("ICM-20948 OK\n" )
-    time.sleep(0.5)                       #We can skip this detection by delaying it by 500 milliseconds
+    self._bus.sleep(0.5)                       #We can skip this detection by delaying it by 500 milliseconds
     # user bank 0 register 
     self._write_byte( REG_ADD_REG_BANK_SEL , REG_VAL_REG_BANK_0)
     self._write_byte( REG_ADD_PWR_MIGMT_1 , REG_VAL_ALL_RGE_RESET)
-    time.sleep(0.1)
+    self._bus.sleep(0.1)
     self._write_byte( REG_ADD_PWR_MIGMT_1 , REG_VAL_RUN_MODE)  
     #user bank 2 register
     self._write_byte( REG_ADD_REG_BANK_SEL , REG_VAL_REG_BANK_2)
@@ -141,14 +146,14 @@ class ICM20948(object):
     self._write_byte( REG_ADD_ACCEL_CONFIG , REG_VAL_BIT_ACCEL_DLPCFG_6 | REG_VAL_BIT_ACCEL_FS_2g | REG_VAL_BIT_ACCEL_DLPF)
     #user bank 0 register
     self._write_byte( REG_ADD_REG_BANK_SEL , REG_VAL_REG_BANK_0) 
-    time.sleep(0.1)
+    self._bus.sleep(0.1)
     self.icm20948GyroOffset()
     self.icm20948MagCheck()
     self.icm20948WriteSecondary( I2C_ADD_ICM20948_AK09916|I2C_ADD_ICM20948_AK09916_WRITE,REG_ADD_MAG_CNTL2, REG_VAL_MAG_MODE_20HZ)
   def icm20948_Gyro_Accel_Read(self):
-    self._write_byte( REG_ADD_REG_BANK_SEL , REG_VAL_REG_BANK_0)
+    # resta in bank 0 (il demo tornava in bank 2): la lettura del mag che segue non cambia banco
+    self._select_bank(REG_VAL_REG_BANK_0)
     data =self._read_block(REG_ADD_ACCEL_XOUT_H, 12)
-    self._write_byte( REG_ADD_REG_BANK_SEL , REG_VAL_REG_BANK_2)
     Accel[0] = (data[0]<<8)|data[1]
     Accel[1] = (data[2]<<8)|data[3]
     Accel[2] = (data[4]<<8)|data[5]
@@ -182,7 +187,7 @@ class ICM20948(object):
   def icm20948MagRead(self):
     counter=20
     while(counter>0):
-      time.sleep(0.01)
+      self._bus.sleep(0.01)
       self.icm20948ReadSecondary( I2C_ADD_ICM20948_AK09916|I2C_ADD_ICM20948_AK09916_READ , REG_ADD_MAG_ST2, 1)
       if ((pu8data[0] & 0x01)!= 0):
         break
@@ -208,8 +213,46 @@ class ICM20948(object):
       Mag[2]=Mag[2]-65535
     elif Mag[2]<=-32767:
       Mag[2]=Mag[2]+65535
+  def icm20948MagStartContinuous(self,mode=REG_VAL_MAG_MODE_20HZ,mst_odr=0x04):
+    # AK09916 in misura continua + SLV0 dell'I2C master in auto-lettura:
+    # l'ICM copia HXL..ST2 in EXT_SLV_SENS_DATA_00.. ad ogni ciclo del master
+    # (1.1 kHz / 2^mst_odr, 0x04 ≈ 69 Hz ≥ ODR del mag). Da qui in poi una lettura
+    # è un solo block read in bank 0.
+    self.icm20948WriteSecondary( I2C_ADD_ICM20948_AK09916|I2C_ADD_ICM20948_AK09916_WRITE,REG_ADD_MAG_CNTL2, REG_VAL_MAG_MODE_PD)
+    self.icm20948WriteSecondary( I2C_ADD_ICM20948_AK09916|I2C_ADD_ICM20948_AK09916_WRITE,REG_ADD_MAG_CNTL2, mode)
+    self._select_bank(REG_VAL_REG_BANK_3)
+    self._write_byte( REG_ADD_I2C_SLV1_CTRL, 0x00)                 #SLV1 off: niente riscritture di CNTL2 ad ogni ciclo
+    self._write_byte( REG_ADD_I2C_MST_ODR_CONFIG, mst_odr)
+    self._write_byte( REG_ADD_I2C_SLV0_ADDR, I2C_ADD_ICM20948_AK09916|I2C_ADD_ICM20948_AK09916_READ)
+    self._write_byte( REG_ADD_I2C_SLV0_REG,  REG_ADD_MAG_DATA)
+    self._write_byte( REG_ADD_I2C_SLV0_CTRL, REG_VAL_BIT_SLV0_EN|MAG_BURST_LEN)
+    self._select_bank(REG_VAL_REG_BANK_0)
+    u8Temp = self._read_byte(REG_ADD_USER_CTRL)
+    self._write_byte( REG_ADD_USER_CTRL, u8Temp|REG_VAL_BIT_I2C_MST_EN)  #master sempre attivo
+    self._bus.sleep(0.05)                                                   #primo campione del mag
+    self._mag_continuous = True
+  def icm20948MagReadBurst(self):
+    # 1 transazione (2 se un'altra lettura ha lasciato un banco diverso da 0).
+    # Ritorna (x, y, z) in counts con la stessa convenzione di segno di icm20948MagRead,
+    # oppure None se il dato è in overflow magnetico (HOFL).
+    if not self._mag_continuous:
+      self.icm20948MagStartContinuous()
+    self._select_bank(REG_VAL_REG_BANK_0)
+    d = self._read_block(REG_ADD_EXT_SENS_DATA_00, MAG_BURST_LEN)
+    if d[7] & REG_VAL_MAG_ST2_HOFL:
+      return None
+    x = ((d[1]<<8)|d[0]); y = ((d[3]<<8)|d[2]); z = ((d[5]<<8)|d[4])
+    x = x-65536 if x & 0x8000 else x
+    y = y-65536 if y & 0x8000 else y
+    z = z-65536 if z & 0x8000 else z
+    Mag[0], Mag[1], Mag[2] = x, -y, -z
+    return Mag[0], Mag[1], Mag[2]
+  def _select_bank(self,bank):
+    if self._bank != bank:
+      self._write_byte( REG_ADD_REG_BANK_SEL, bank)
   def icm20948ReadSecondary(self,u8I2CAddr,u8RegAddr,u8Len):
     u8Temp=0
+    self._mag_continuous = False          #riconfigura SLV0/MST_EN: la modalità continua va riarmata
     self._write_byte( REG_ADD_REG_BANK_SEL,  REG_VAL_REG_BANK_3) #swtich bank3
     self._write_byte( REG_ADD_I2C_SLV0_ADDR, u8I2CAddr)
     self._write_byte( REG_ADD_I2C_SLV0_REG,  u8RegAddr)
@@ -220,7 +263,7 @@ class ICM20948(object):
     u8Temp = self._read_byte(REG_ADD_USER_CTRL)
     u8Temp |= REG_VAL_BIT_I2C_MST_EN
     self._write_byte( REG_ADD_USER_CTRL, u8Temp)
-    time.sleep(0.01)
+    self._bus.sleep(0.01)
     u8Temp &= ~REG_VAL_BIT_I2C_MST_EN
     self._write_byte( REG_ADD_USER_CTRL, u8Temp)
     
@@ -236,6 +279,7 @@ class ICM20948(object):
     self._write_byte( REG_ADD_REG_BANK_SEL, REG_VAL_REG_BANK_0) #swtich bank0
   def icm20948WriteSecondary(self,u8I2CAddr,u8RegAddr,u8data):
     u8Temp=0
+    self._mag_continuous = False          #riconfigura SLV0/MST_EN: la modalità continua va riarmata
     self._write_byte( REG_ADD_REG_BANK_SEL,  REG_VAL_REG_BANK_3) #swtich bank3
     self._write_byte( REG_ADD_I2C_SLV1_ADDR, u8I2CAddr)
     self._write_byte( REG_ADD_I2C_SLV1_REG,  u8RegAddr)
@@ -247,7 +291,7 @@ class ICM20948(object):
     u8Temp = self._read_byte(REG_ADD_USER_CTRL)
     u8Temp |= REG_VAL_BIT_I2C_MST_EN
     self._write_byte( REG_ADD_USER_CTRL, u8Temp)
-    time.sleep(0.01)
+    self._bus.sleep(0.01)
     u8Temp &= ~REG_VAL_BIT_I2C_MST_EN
     self._write_byte( REG_ADD_USER_CTRL, u8Temp)
 
@@ -267,7 +311,7 @@ class ICM20948(object):
       s32TempGx += Gyro[0]
       s32TempGy += Gyro[1]
       s32TempGz += Gyro[2]
-      time.sleep(0.01)
+      self._bus.sleep(0.01)
     GyroOffset[0] = s32TempGx >> 5
     GyroOffset[1] = s32TempGy >> 5
     GyroOffset[2] = s32TempGz >> 5
@@ -281,7 +325,9 @@ class ICM20948(object):
     return (MSB	<< 8) + LSB
   def _write_byte(self,cmd,val):
     self._bus.write_byte_data(self._address,cmd,val)
-    time.sleep(0.0001)
+    if cmd == REG_ADD_REG_BANK_SEL:
+      self._bank = val
+    self._bus.sleep(0.0001)
   def imuAHRSupdate(self,gx, gy,gz,ax,ay,az,mx,my,mz):    
     norm=0.0
     hx = hy = hz = bx = bz = 0.0
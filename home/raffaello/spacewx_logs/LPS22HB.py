@@ -1,7 +1,6 @@
 #!/usr/bin/python
 # -*- coding:utf-8 -*-
-import time
-import smbus
+from i2c_bus import get_bus
 #i2c address
 LPS22HB_I2C_ADDRESS	  =  0x5C
 #
@@ -30,24 +29,73 @@ LPS_PRESS_OUT_H       =  0x2A
 LPS_TEMP_OUT_L        =  0x2B        #Temperature output registers
 LPS_TEMP_OUT_H        =  0x2C
 LPS_RES               =  0x33        #Filter reset register
+#Bit/valori usati in modalità continua + FIFO
+LPS_ODR_1HZ           =  0x10        #CTRL_REG1 ODR[6:4]
+LPS_ODR_10HZ          =  0x20
+LPS_ODR_25HZ          =  0x30
+LPS_BDU               =  0x02
+LPS_FIFO_EN           =  0x40        #CTRL_REG2
+LPS_IF_ADD_INC        =  0x10
+LPS_FIFO_MODE_DYN_STREAM = 0xC0       #FIFO_CTRL F_MODE=110: Dynamic-Stream (Stream è 010 = 0x40);
+                                     #senza watermark tiene gli ultimi 32 campioni, ogni lettura li toglie
+LPS_FIFO_DEPTH        =  32
+LPS_SAMPLE_LEN        =  5           #PRESS_OUT_XL..TEMP_OUT_H
+LPS_BLOCK_SAMPLES     =  6           #smbus: max 32 byte per block read → 6 campioni (30 byte)
+
+def _decode_sample(b):
+    #pressione 24 bit / 4096 → hPa, temperatura int16 con segno / 100 → °C
+    p=((b[2]<<16)|(b[1]<<8)|b[0])/4096.0
+    t=(b[4]<<8)|b[3]
+    if t&0x8000:
+        t-=0x10000
+    return p,t/100.0
 
 class LPS22HB(object):
-    def __init__(self,address=LPS22HB_I2C_ADDRESS):
+    def __init__(self,address=LPS22HB_I2C_ADDRESS,bus=None):
         self._address = address
-        self._bus = smbus.SMBus(1)
+        self._bus = bus or get_bus()                 #I2CBus condiviso (smbus o simulatore)
+        self._continuous = False
         self.LPS22HB_RESET()                         #Wait for reset to complete
         self._write_byte(LPS_CTRL_REG1 ,0x02)        #Low-pass filter disabled , output registers not updated until MSB and LSB have been read , Enable Block Data Update , Set Output Data Rate to 0 
     def LPS22HB_RESET(self):
-        Buf=self._read_u16(LPS_CTRL_REG2)
+        Buf=self._read_byte(LPS_CTRL_REG2)                #registro a 8 bit: una sola lettura
         Buf|=0x04                                         
         self._write_byte(LPS_CTRL_REG2,Buf)               #SWRESET Set 1
         while Buf:
-            Buf=self._read_u16(LPS_CTRL_REG2)
+            Buf=self._read_byte(LPS_CTRL_REG2)
             Buf&=0x04
     def LPS22HB_START_ONESHOT(self):
-        Buf=self._read_u16(LPS_CTRL_REG2)
+        Buf=self._read_byte(LPS_CTRL_REG2)
         Buf|=0x01                                         #ONE_SHOT Set 1
         self._write_byte(LPS_CTRL_REG2,Buf)
+    def LPS22HB_START_CONTINUOUS(self,odr=LPS_ODR_1HZ):
+        #ODR continuo + FIFO in Dynamic-Stream: il sensore accumula fino a 32 campioni
+        #(oltre sovrascrive i più vecchi), il lettore li scarica con block read auto-increment.
+        #A 1 Hz una lettura al minuto copre solo gli ultimi ~32 s dell'intervallo.
+        self._write_byte(LPS_CTRL_REG1,odr|LPS_BDU)
+        self._write_byte(LPS_FIFO_CTRL,0x00)              #bypass: svuota la FIFO
+        self._write_byte(LPS_CTRL_REG2,LPS_FIFO_EN|LPS_IF_ADD_INC)
+        self._write_byte(LPS_FIFO_CTRL,LPS_FIFO_MODE_DYN_STREAM)
+        self._continuous=True
+    def LPS22HB_READ_FIFO(self):
+        #Ritorna [(press_hpa, temp_c), ...] dei campioni non ancora letti (più vecchio prima).
+        #Costo: 1 lettura FIFO_STATUS + ceil(n/6) block read.
+        n=self._read_byte(LPS_FIFO_STATUS)&0x3F
+        out=[]
+        while n>0:
+            k=min(n,LPS_BLOCK_SAMPLES)
+            buf=self._read_block(LPS_PRESS_OUT_XL,k*LPS_SAMPLE_LEN)   #con FIFO attiva l'indirizzo torna a PRESS_OUT_XL dopo TEMP_OUT_H
+            for i in range(0,k*LPS_SAMPLE_LEN,LPS_SAMPLE_LEN):
+                out.append(_decode_sample(buf[i:i+LPS_SAMPLE_LEN]))
+            n-=k
+        return out
+    def LPS22HB_READ_LAST(self):
+        #STATUS + PRESS_OUT_XL..TEMP_OUT_H in un solo block read (6 byte)
+        buf=self._read_block(LPS_STATUS,1+LPS_SAMPLE_LEN)
+        p,t=_decode_sample(buf[1:])
+        return (p if buf[0]&0x01 else None),(t if buf[0]&0x02 else None)
+    def _read_block(self,cmd,length):
+        return self._bus.read_i2c_block_data(self._address,cmd,length)
     def _read_byte(self,cmd):
         return self._bus.read_byte_data(self._address,cmd)
     def _read_u16(self,cmd):
@@ -65,7 +113,7 @@ if __name__ == '__main__':
     lps22hb=LPS22HB()
     while True:
         try:
-            time.sleep(0.1)
+            lps22hb._bus.sleep(0.1)
             lps22hb.LPS22HB_START_ONESHOT()
             if (lps22hb._read_byte(LPS_STATUS)&0x01)==0x01:  # a new pressure data is generated
                 u8Buf[0]=lps22hb._read_byte(LPS_PRESS_OUT_XL)
@@ -0,0 +1,105 @@
+#!/usr/bin/python
+# -*- coding:utf-8 -*-
+# Driver SGM58031 (ADC 16 bit, 4 ingressi) dal demo Waveshare, portato sul bus condiviso:
+# - registri a 16 bit big-endian letti/scritti con un solo block transfer (il demo leggeva
+#   il byte basso dal puntatore successivo, cioè dal registro di configurazione)
+# - modalità continua: il convertitore gira da solo, ogni lettura è 1 transazione da 2 byte
+from i2c_bus import get_bus
+#i2c address
+SGM_I2C_ADDRESS		              = 0x48
+
+#Pointer Register
+SGM_POINTER_CONVERT               = 0x00
+SGM_POINTER_CONFIG                = 0x01
+SGM_POINTER_LOWTHRESH             = 0x02
+SGM_POINTER_HIGHTHRESH            = 0x03
+
+#Config Register
+SGM_CONFIG_OS_BUSY                  = 0x0000      #Device is currently performing a conversion
+SGM_CONFIG_OS_NOBUSY                = 0x8000      #Device is not currently performing a conversion
+SGM_CONFIG_OS_SINGLE_CONVERT        = 0x8000      #Start a single conversion (when in power-down state)
+SGM_CONFIG_OS_NO_EFFECT             = 0x0000      #No effect
+SGM_CONFIG_MUX_MUL_0_1              = 0x0000      #Input multiplexer,AINP = AIN0 and AINN = AIN1(default)
+SGM_CONFIG_MUX_MUL_0_3              = 0x1000      #Input multiplexer,AINP = AIN0 and AINN = AIN3
+SGM_CONFIG_MUX_MUL_1_3              = 0x2000      #Input multiplexer,AINP = AIN1 and AINN = AIN3
+SGM_CONFIG_MUX_MUL_2_3              = 0x3000      #Input multiplexer,AINP = AIN2 and AINN = AIN3
+SGM_CONFIG_MUX_SINGLE_0             = 0x4000      #SINGLE,AIN0
+SGM_CONFIG_MUX_SINGLE_1             = 0x5000      #SINGLE,AIN1
+SGM_CONFIG_MUX_SINGLE_2             = 0x6000      #SINGLE,AIN2
+SGM_CONFIG_MUX_SINGLE_3             = 0x7000      #SINGLE,AIN3
+SGM_CONFIG_PGA_6144                 = 0x0000      #Gain= +/- 6.144V
+SGM_CONFIG_PGA_4096                 = 0x0200      #Gain= +/- 4.096V
+SGM_CONFIG_PGA_2048                 = 0x0400      #Gain= +/- 2.048V(default)
+SGM_CONFIG_PGA_1024                 = 0x0600      #Gain= +/- 1.024V
+SGM_CONFIG_PGA_512                  = 0x0800      #Gain= +/- 0.512V
+SGM_CONFIG_PGA_256                  = 0x0A00      #Gain= +/- 0.256V
+SGM_CONFIG_MODE_CONTINUOUS          = 0x0000      #Device operating mode:Continuous-conversion mode
+SGM_CONFIG_MODE_NOCONTINUOUS        = 0x0100      #Device operating mode：Single-shot mode or power-down state (default)
+SGM_CONFIG_DR_RATE_7_5              =0x0000       #Data rate=7.5Hz
+SGM_CONFIG_DR_RATE_15               =0x0020       #Data rate=15Hz
+SGM_CONFIG_DR_RATE_30               =0x0040       #Data rate=30Hz
+SGM_CONFIG_DR_RATE_60               =0x0060       #Data rate=60Hz
+SGM_CONFIG_DR_RATE_120              =0x0080       #Data rate=120Hz
+SGM_CONFIG_DR_RATE_240              =0x00A0       #Data rate=240Hz
+SGM_CONFIG_DR_RATE_480              =0x00C0       #Data rate=480Hz
+SGM_CONFIG_DR_RATE_960              =0x00E0       #Data rate=960Hz
+SGM_CONFIG_COMP_MODE_WINDOW         = 0x0010      #Comparator mode：Window comparator
+SGM_CONFIG_COMP_MODE_TRADITIONAL    = 0x0000      #Comparator mode：Traditional comparator (default)
+SGM_CONFIG_COMP_POL_LOW             = 0x0000      #Comparator polarity：Active low (default)
+SGM_CONFIG_COMP_POL_HIGH            = 0x0008      #Comparator polarity：Active high
+SGM_CONFIG_COMP_LAT                 = 0x0004      #Latching comparator
+SGM_CONFIG_COMP_NONLAT              = 0x0000      #Nonlatching comparator (default)
+SGM_CONFIG_COMP_QUE_ONE             = 0x0000      #Assert after one conversion
+SGM_CONFIG_COMP_QUE_TWO             = 0x0001      #Assert after two conversions
+SGM_CONFIG_COMP_QUE_FOUR            = 0x0002      #Assert after four conversions
+SGM_CONFIG_COMP_QUE_NON             = 0x0003      #Disable comparator and set ALERT/RDY pin to high-impedance (default)
+
+#Fondo scala (V) per PGA → volt per LSB = fs / 32768
+SGM_PGA_FS = {SGM_CONFIG_PGA_6144: 6.144, SGM_CONFIG_PGA_4096: 4.096, SGM_CONFIG_PGA_2048: 2.048,
+              SGM_CONFIG_PGA_1024: 1.024, SGM_CONFIG_PGA_512: 0.512, SGM_CONFIG_PGA_256: 0.256}
+SGM_MUX_SINGLE = (SGM_CONFIG_MUX_SINGLE_0, SGM_CONFIG_MUX_SINGLE_1,
+                  SGM_CONFIG_MUX_SINGLE_2, SGM_CONFIG_MUX_SINGLE_3)
+
+class SGM58031(object):
+    def __init__(self,address=SGM_I2C_ADDRESS,bus=None):
+        self._address = address
+        self._bus = bus or get_bus()                 #I2CBus condiviso (smbus o simulatore)
+        self._config = None
+        self.pga = SGM_CONFIG_PGA_4096
+    def SGM58031_SINGLE_READ(self,channel):                    #Read single channel data
+        data=0
+        Config_Set =  ( SGM_CONFIG_MODE_NOCONTINUOUS        |   #mode：Single-shot mode or power-down state    (default)
+                        SGM_CONFIG_PGA_4096                 |   #Gain= +/- 4.096V                              (default)
+                        SGM_CONFIG_COMP_QUE_NON             |   #Disable comparator                            (default)
+                        SGM_CONFIG_COMP_NONLAT              |   #Nonlatching comparator                        (default)
+                        SGM_CONFIG_COMP_POL_LOW             |   #Comparator polarity：Active low               (default)
+                        SGM_CONFIG_COMP_MODE_TRADITIONAL    |   #Traditional comparator                        (default)
+                        SGM_CONFIG_DR_RATE_480             )    #Data rate=480Hz                             (default)
+        Config_Set |= SGM_MUX_SINGLE[channel & 0x03]
+        Config_Set |=SGM_CONFIG_OS_SINGLE_CONVERT
+        self._write_word(SGM_POINTER_CONFIG,Config_Set)
+        self._config = None                                     #la continua va riconfigurata
+        self._bus.sleep(0.02)
+        data=self._read_u16(SGM_POINTER_CONVERT)
+        return data
+    def SGM58031_START_CONTINUOUS(self,channel,pga=SGM_CONFIG_PGA_4096,rate=SGM_CONFIG_DR_RATE_960):
+        #conversione continua sull'ingresso channel (single-ended): da qui in poi
+        #SGM58031_READ_CONVERT() ritorna l'ultimo campione senza avviare nulla.
+        #Cambiare canale = riscrivere la configurazione (1 transazione).
+        Config_Set = ( SGM_CONFIG_MODE_CONTINUOUS | pga | rate | SGM_CONFIG_COMP_QUE_NON |
+                       SGM_MUX_SINGLE[channel & 0x03] )
+        if Config_Set != self._config:
+            self._write_word(SGM_POINTER_CONFIG,Config_Set)
+            self._config = Config_Set
+        self.pga = pga
+    def SGM58031_READ_CONVERT(self):
+        #ultimo risultato di conversione, complemento a 2 (16 bit con segno)
+        data=self._read_u16(SGM_POINTER_CONVERT)
+        return data-0x10000 if data&0x8000 else data
+    def SGM58031_LSB_V(self,pga=None):
+        return SGM_PGA_FS[self.pga if pga is None else pga]/32768.0
+    def _read_u16(self,cmd):
+        MSB, LSB = self._bus.read_i2c_block_data(self._address,cmd,2)
+        return (MSB << 8) + LSB
+    def _write_word(self, cmd, val):
+        self._bus.write_i2c_block_data(self._address,cmd,[val>>8,val&0xff])
@@ -1,7 +1,7 @@
 #!/usr/bin/python
 # -*- coding:utf-8 -*-
-import time
-import lgpio as sbc
+from i2c_bus import get_bus
+from i2c_sched import run_job
 
 SHTC3_I2C_ADDRESS   = 0x70
 
@@ -13,67 +13,99 @@ SHTC3_Software_RES  = 0x805D
 SHTC3_NM_CD_ReadTH  = 0x7866
 SHTC3_NM_CD_ReadRH  = 0x58E0
 
+SHTC3_WAKEUP_S      = 0.001   # t_wakeup max 240 us
+SHTC3_MEAS_S        = 0.013   # normal mode: 12.1 ms max
+
+def _crc8_table(poly=CRC_POLYNOMIAL & 0xFF):
+    table = []
+    for b in range(256):
+        crc = b
+        for _ in range(8):
+            crc = ((crc << 1) ^ poly) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+        table.append(crc)
+    return bytes(table)
+
+_CRC8 = _crc8_table()
+
+def crc8(data, init=0xFF):
+    crc = init
+    for b in data:
+        crc = _CRC8[crc ^ b]
+    return crc
+
 class SHTC3():
-    def __init__(self,sbc,bus,address,flags = 0):
-        self._sbc = sbc
-        self._fd = self._sbc.i2c_open(bus, address, flags)
+    def __init__(self,bus=None,address=SHTC3_I2C_ADDRESS):
+        self._bus = bus or get_bus()          # I2CBus condiviso (smbus/lgpio o simulatore)
+        self._address = address
+        self.SHTC3_WAKEUP()                   # il reset è accettato solo da sveglio
         self.SHTC_SOFT_RESET()
 
     def SHTC3_CheckCrc(self,data,len,checksum):
-        crc = 0xFF
-        for byteCtr in range(0,len):
-            crc = crc ^ data[byteCtr]
-            for bit in range(0,8):
-                if crc & 0x80:
-                    crc = (crc << 1) ^ CRC_POLYNOMIAL
-                else:
-                    crc = crc << 1
-        if crc == checksum:
-            return True
-        else:
-            return False
+        return crc8(data[:len]) == checksum
     
     def SHTC3_WriteCommand(self,cmd):
-        self._sbc.i2c_write_byte_data(self._fd,cmd >> 8,cmd & 0xFF)
+        self._bus.write_device(self._address,(cmd >> 8,cmd & 0xFF))
     
     def SHTC3_WAKEUP(self):
         self.SHTC3_WriteCommand(SHTC3_WakeUp) # write wake_up command
-        time.sleep(0.01) # Prevent the system from crashing 
+        self._bus.sleep(0.01) # Prevent the system from crashing 
     
     def SHTC3_SLEEP(self):
         self.SHTC3_WriteCommand(SHTC3_Sleep) # Write sleep command
-        time.sleep(0.01)
+        self._bus.sleep(0.01)
     
     def SHTC_SOFT_RESET(self):
         self.SHTC3_WriteCommand(SHTC3_Software_RES) # Write reset command
-        time.sleep(0.01)
+        self._bus.sleep(0.01)
     
     def SHTC3_Read_TH(self): # Read temperature 
         self.SHTC3_WAKEUP()
         self.SHTC3_WriteCommand(SHTC3_NM_CD_ReadTH)
-        time.sleep(0.02)
-        (count,buf) = self._sbc.i2c_read_device(self._fd,3)
-        if self.SHTC3_CheckCrc(buf,2,buf[2]):
+        self._bus.sleep(0.02)
+        buf = self._bus.read_device(self._address,3)
+        if len(buf) == 3 and self.SHTC3_CheckCrc(buf,2,buf[2]):
             return (buf[0]<<8|buf[1]) * 175 / 65536 - 45.0 # Calculate temperature value
         else:
-            return 0 # Error
+            return None # CRC error
     
     def SHTC3_Read_RH(self): # Read humidity 
         self.SHTC3_WAKEUP()
         self.SHTC3_WriteCommand(SHTC3_NM_CD_ReadRH)
-        time.sleep(0.02)
-        (count,buf) = self._sbc.i2c_read_device(self._fd,3)
-        if self.SHTC3_CheckCrc(buf,2,buf[2]) :
+        self._bus.sleep(0.02)
+        buf = self._bus.read_device(self._address,3)
+        if len(buf) == 3 and self.SHTC3_CheckCrc(buf,2,buf[2]) :
             return 100 * (buf[0]<<8|buf[1]) / 65536 # Calculate humidity value
         else:
-            return 0  # Error
+            return None  # CRC error
+
+    def SHTC3_Read_TH_RH(self): # Read temperature + humidity in one measurement
+        return run_job(self.SHTC3_TH_RH_JOB(),self._bus)
+
+    def SHTC3_TH_RH_JOB(self):
+        # wake → misura "T first" → 6 byte (T,CRC,RH,CRC) in una lettura → sleep.
+        # Job per i2c_sched: le attese sono yield, il bus resta libero per gli altri sensori.
+        # Ritorna (t_c, rh_pct); None sul valore il cui CRC non torna.
+        self.SHTC3_WriteCommand(SHTC3_WakeUp)
+        yield SHTC3_WAKEUP_S
+        try:
+            self.SHTC3_WriteCommand(SHTC3_NM_CD_ReadTH)
+            yield SHTC3_MEAS_S
+            buf = self._bus.read_device(self._address,6)
+        finally:
+            self.SHTC3_WriteCommand(SHTC3_Sleep)
+        if len(buf) != 6:
+            return None, None
+        t = (buf[0]<<8|buf[1]) * 175 / 65536 - 45.0 if crc8(buf[0:2]) == buf[2] else None
+        h = 100 * (buf[3]<<8|buf[4]) / 65536 if crc8(buf[3:5]) == buf[5] else None
+        return t, h
 
 if __name__ == "__main__":
     try:
-        shtc3 = SHTC3(sbc, 1, SHTC3_I2C_ADDRESS)
+        shtc3 = SHTC3()
         
         while True:
-            print("Temperature = %6.2f°C , Humidity = %6.2f%%"%(shtc3.SHTC3_Read_TH(),shtc3.SHTC3_Read_RH()))
+            t, h = shtc3.SHTC3_Read_TH_RH()
+            print("Temperature = %s°C , Humidity = %s%%"%(t, h))
     except:
         print ("\nProgram end")
         exit()
\ No newline at end of file
@@ -0,0 +1,224 @@
+#!/usr/bin/python
+# -*- coding:utf-8 -*-
+# Driver TCS34725 (colore/lux) dal demo Waveshare, portato sul bus condiviso:
+# - niente gpiozero nel costruttore: la linea INT è opzionale (vedi light_collector.py)
+# - RGBC letti con un solo block read auto-increment (8 byte) invece di 4 word read
+# - soglie di interrupt scritte con un solo block write (4 byte)
+# - Get_RGBData non dorme più il tempo di integrazione: chi legge controlla AVALID
+from i2c_bus import get_bus
+
+#i2c address
+TCS34725_I2C_ADDRESS = 0x29
+
+TCS34725_R_Coef     = 0.136
+TCS34725_G_Coef     = 1.000
+TCS34725_B_Coef     = -0.444
+TCS34725_GA         = 1.0
+TCS34725_DF         = 310.0
+TCS34725_CT_Coef    = 3810.0
+TCS34725_CT_Offset  = 1391.0
+
+class TCS34725:
+    Gain_t = 0
+    IntegrationTime_t = 0
+
+    TCS34725_CMD_BIT        = 0x80
+    TCS34725_CMD_Read_Byte  = 0x00
+    TCS34725_CMD_Read_Word  = 0x20    # TYPE=01: auto-increment (anche per i block read)
+    TCS34725_CMD_Clear_INT  = 0x66    # TYPE=11 special function: clear RGBC interrupt
+
+    TCS34725_ENABLE         = 0x00
+    TCS34725_ENABLE_AIEN    = 0x10    # RGBC Interrupt Enable
+    TCS34725_ENABLE_WEN     = 0x08     # Wait enable - Writing 1 activates the wait timer
+    TCS34725_ENABLE_AEN     = 0x02     # RGBC Enable - Writing 1 actives the ADC, 0 disables it
+    TCS34725_ENABLE_PON     = 0x01    # Power on - Writing 1 activates the internal oscillator, 0 disables it
+    TCS34725_ATIME          = 0x01    # Integration time
+    TCS34725_WTIME          = 0x03    # Wait time (if TCS34725_ENABLE_WEN is asserted)
+    TCS34725_WTIME_2_4MS    = 0xFF    # WLONG0 = 2.4ms   WLONG1 = 0.029s
+    TCS34725_WTIME_204MS    = 0xAB    # WLONG0 = 204ms   WLONG1 = 2.45s
+    TCS34725_WTIME_614MS    = 0x00    # WLONG0 = 614ms   WLONG1 = 7.4s
+    TCS34725_AILTL          = 0x04    # Clear channel lower interrupt threshold
+    TCS34725_AILTH          = 0x05
+    TCS34725_AIHTL          = 0x06    # Clear channel upper interrupt threshold
+    TCS34725_AIHTH          = 0x07
+    TCS34725_PERS           = 0x0C    # Persistence register - basic SW filtering mechanism for interrupts
+    TCS34725_PERS_NONE      = 0b0000  # Every RGBC cycle generates an interrupt
+    TCS34725_PERS_1_CYCLE   = 0b0001  # 1 clean channel value outside threshold range generates an interrupt
+    TCS34725_PERS_2_CYCLE   = 0b0010  # 2 clean channel values outside threshold range generates an interrupt
+    TCS34725_PERS_3_CYCLE   = 0b0011  # 3 clean channel values outside threshold range generates an interrupt
+    TCS34725_PERS_5_CYCLE   = 0b0100  # 5 clean channel values outside threshold range generates an interrupt
+    TCS34725_PERS_10_CYCLE  = 0b0101  # 10 clean channel values outside threshold range generates an interrupt
+    TCS34725_PERS_15_CYCLE  = 0b0110  # 15 clean channel values outside threshold range generates an interrupt
+    TCS34725_PERS_20_CYCLE  = 0b0111  # 20 clean channel values outside threshold range generates an interrupt
+    TCS34725_PERS_25_CYCLE  = 0b1000  # 25 clean channel values outside threshold range generates an interrupt
+    TCS34725_PERS_30_CYCLE  = 0b1001  # 30 clean channel values outside threshold range generates an interrupt
+    TCS34725_PERS_35_CYCLE  = 0b1010  # 35 clean channel values outside threshold range generates an interrupt
+    TCS34725_PERS_40_CYCLE  = 0b1011  # 40 clean channel values outside threshold range generates an interrupt
+    TCS34725_PERS_45_CYCLE  = 0b1100  # 45 clean channel values outside threshold range generates an interrupt
+    TCS34725_PERS_50_CYCLE  = 0b1101  # 50 clean channel values outside threshold range generates an interrupt
+    TCS34725_PERS_55_CYCLE  = 0b1110  # 55 clean channel values outside threshold range generates an interrupt
+    TCS34725_PERS_60_CYCLE  = 0b1111  # 60 clean channel values outside threshold range generates an interrupt
+    TCS34725_CONFIG         = 0x0D
+    TCS34725_CONFIG_WLONG   = 0x02    # Choose between short and long (12x) wait times via TCS34725_WTIME
+    TCS34725_CONTROL        = 0x0F    # Set the gain level for the sensor
+    TCS34725_ID             = 0x12    # 0x44 = TCS34721/TCS34725, 0x4D = TCS34723/TCS34727
+    TCS34725_STATUS         = 0x13
+    TCS34725_STATUS_AINT    = 0x10    # RGBC Clean channel interrupt
+    TCS34725_STATUS_AVALID  = 0x01    # Indicates that the RGBC channels have completed an integration cycle
+    TCS34725_CDATAL         = 0x14    # Clear channel data
+    TCS34725_CDATAH         = 0x15
+    TCS34725_RDATAL         = 0x16    # Red channel data
+    TCS34725_RDATAH         = 0x17
+    TCS34725_GDATAL         = 0x18    # Green channel data
+    TCS34725_GDATAH         = 0x19
+    TCS34725_BDATAL         = 0x1A    # Blue channel data
+    TCS34725_BDATAH         = 0x1B
+
+    #Integration Time
+    TCS34725_INTEGRATIONTIME_2_4MS  = 0xFF   #<  2.4ms - 1 cycle    - Max Count: 1024
+    TCS34725_INTEGRATIONTIME_24MS   = 0xF6   #<  24ms  - 10 cycles  - Max Count: 10240
+    TCS34725_INTEGRATIONTIME_50MS   = 0xEB   #<  50ms  - 20 cycles  - Max Count: 20480
+    TCS34725_INTEGRATIONTIME_101MS  = 0xD5   #<  101ms - 42 cycles  - Max Count: 43008
+    TCS34725_INTEGRATIONTIME_154MS  = 0xC0   #<  154ms - 64 cycles  - Max Count: 65535
+    TCS34725_INTEGRATIONTIME_700MS  = 0x00   #<  700ms - 256 cycles - Max Count: 65535
+
+    #Gain
+    TCS34725_GAIN_1X                = 0x00   #<  No gain  */
+    TCS34725_GAIN_4X                = 0x01   #<  4x gain  */
+    TCS34725_GAIN_16X               = 0x02   #<  16x gain */
+    TCS34725_GAIN_60X               = 0x03   #<  60x gain */
+    GAIN_X = {0x00: 1, 0x01: 4, 0x02: 16, 0x03: 60}
+
+    def __init__(self, address=TCS34725_I2C_ADDRESS, debug=False, bus=None):
+        self._bus = bus or get_bus()          # I2CBus condiviso (smbus o simulatore)
+        self.address = address
+        self.debug = debug
+        self.C = self.R = self.G = self.B = 0
+
+    def Write_Byte(self, reg, value):
+        # "Writes an 8-bit value to the specified register/address"
+        reg = reg | self.TCS34725_CMD_BIT;#Register addressing highest bit is set to 1
+        self._bus.write_byte_data(self.address, reg, value)
+        if (self.debug):
+          print("I2C: Write 0x%02X to register 0x%02X" % (value, reg))
+
+    def Read_Byte(self, reg):
+        # "Read an unsigned byte from the I2C device"
+        reg = reg | self.TCS34725_CMD_BIT
+        result = self._bus.read_byte_data(self.address, reg)
+        if (self.debug):
+          print("I2C: Device 0x%02X returned 0x%02X from reg 0x%02X" % (self.address, result & 0xFF, reg))
+        return result
+
+    def Set_Gain(self, gain):
+        self.Write_Byte(self.TCS34725_CONTROL, gain)
+        self.Gain_t = gain
+
+    def Set_Integration_Time(self, time):
+        # Update the timing register
+        self.Write_Byte(self.TCS34725_ATIME, time)
+        self.IntegrationTime_t = time
+
+    def Set_Wait_Time(self, wtime, wlong=False):
+        # Tra un'integrazione e l'altra il chip resta in attesa (meno corrente, meno cicli)
+        self.Write_Byte(self.TCS34725_WTIME, wtime)
+        self.Write_Byte(self.TCS34725_CONFIG, self.TCS34725_CONFIG_WLONG if wlong else 0x00)
+
+    def Enable(self, wait=False):
+        self.Write_Byte(self.TCS34725_ENABLE, self.TCS34725_ENABLE_PON)
+        self._bus.sleep(0.01)
+        en = self.TCS34725_ENABLE_PON | self.TCS34725_ENABLE_AEN
+        if wait:
+            en |= self.TCS34725_ENABLE_WEN
+        self.Write_Byte(self.TCS34725_ENABLE, en)
+        self._bus.sleep(0.01)
+
+    def Disable(self):
+        #Turn the device off to save power
+        reg = self.Read_Byte(self.TCS34725_ENABLE)
+        self.Write_Byte(self.TCS34725_ENABLE, reg & ~(self.TCS34725_ENABLE_PON | self.TCS34725_ENABLE_AEN))
+
+    def Interrupt_Enable(self):
+        reg = self.Read_Byte(self.TCS34725_ENABLE)
+        self.Write_Byte(self.TCS34725_ENABLE, reg | self.TCS34725_ENABLE_AIEN)
+
+    def Interrupt_Disable(self):
+        reg = self.Read_Byte(self.TCS34725_ENABLE)
+        self.Write_Byte(self.TCS34725_ENABLE, reg & (~self.TCS34725_ENABLE_AIEN))
+
+    def Set_Interrupt_Persistence_Reg(self, PER):
+        if(PER < 0x10):
+            self.Write_Byte(self.TCS34725_PERS, PER)
+        else :
+            self.Write_Byte(self.TCS34725_PERS, self.TCS34725_PERS_60_CYCLE)
+
+    def Set_Interrupt_Threshold(self, Threshold_H,  Threshold_L):
+        # AILTL..AIHTH contigui: una sola transazione auto-increment
+        Threshold_H = max(0, min(0xFFFF, int(Threshold_H)))
+        Threshold_L = max(0, min(0xFFFF, int(Threshold_L)))
+        self._bus.write_i2c_block_data(self.address,
+            self.TCS34725_CMD_BIT | self.TCS34725_CMD_Read_Word | self.TCS34725_AILTL,
+            [Threshold_L & 0xff, Threshold_L >> 8, Threshold_H & 0xff, Threshold_H >> 8])
+
+    def Clear_Interrupt_Flag(self):
+        # special function: il solo byte di comando, senza dati
+        self._bus.write_device(self.address, [self.TCS34725_CMD_BIT | self.TCS34725_CMD_Clear_INT])
+
+    def TCS34725_init(self, gain=TCS34725_GAIN_60X, atime=TCS34725_INTEGRATIONTIME_154MS, wait=False):
+
+        ID = self.Read_Byte(self.TCS34725_ID)
+        if(ID != 0x44 and ID != 0x4D):
+            return 1
+        self.Set_Integration_Time(atime)
+        self.Set_Gain(gain)
+        self.Enable(wait)
+        self.Interrupt_Enable()
+        return 0
+
+    def Read_ID(self):
+        return self.Read_Byte(self.TCS34725_ID)
+
+    def Read_Status(self):
+        return self.Read_Byte(self.TCS34725_STATUS)
+
+    def Get_RGBData(self):
+        # CDATAL..BDATAH in un solo block read (8 byte, auto-increment)
+        b = self._bus.read_i2c_block_data(self.address,
+            self.TCS34725_CMD_BIT | self.TCS34725_CMD_Read_Word | self.TCS34725_CDATAL, 8)
+        self.C = b[0] | (b[1] << 8)
+        self.R = b[2] | (b[3] << 8)
+        self.G = b[4] | (b[5] << 8)
+        self.B = b[6] | (b[7] << 8)
+
+    def Max_Count(self):
+        # fondo scala del canale clear per l'ATIME corrente (saturazione)
+        return min(65535, (256 - self.IntegrationTime_t) * 1024)
+
+    def Get_Lux(self):
+        atime_ms = ((256 - self.IntegrationTime_t) * 2.4)
+        if(self.R + self.G + self.B > self.C):
+            ir =  (self.R + self.G + self.B - self.C) / 2
+        else:
+            ir = 0
+        r_comp = self.R - ir
+        g_comp = self.G - ir
+        b_comp = self.B - ir
+        Gain_temp = self.GAIN_X.get(self.Gain_t, 1)
+
+        cpl = (atime_ms * Gain_temp) / (TCS34725_GA * TCS34725_DF)
+        lux = (TCS34725_R_Coef * (float)(r_comp) + TCS34725_G_Coef * \
+            (float)(g_comp) +  TCS34725_B_Coef * (float)(b_comp)) / cpl
+        return max(0.0, lux)
+
+    def Get_ColorTemp(self):
+        ir=1.0
+        if(self.R + self.G + self.B > self.C):
+            ir =  (self.R + self.G + self.B - self.C - 1) / 2
+        else:
+            ir = 0
+        r_comp = self.R - ir
+        b_comp = self.B - ir
+        if r_comp <= 0:
+            return None                        # buio/saturazione: CCT non definita
+        cct=TCS34725_CT_Coef * (float)(b_comp) / (float)(r_comp) + TCS34725_CT_Offset
+        return cct
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+# Blocchi colonnari compressi (stile Gorilla) per lo storico freddo dell'archivio.
+# Un blocco = una colonna di un giorno, righe nell'ordine di raw (ts_ms, modo, canale):
+# - 'T' interi quasi regolari (ts_ms): run di valori uguali (un ciclo = più righe), valori
+#   dei run in delta-of-delta, lunghezze dei run impacchettate
+# - 'F' numeri (REAL/INTEGER, None = NaN): XOR col valore precedente; una bitmap dice quali
+#   XOR sono diversi da zero (valore ripetuto = 1 bit), i non nulli perdono gli zeri finali
+#   comuni al blocco e sono impacchettati alla larghezza del blocco
+# - 'N' numeri con valori mancanti: bitmap dei presenti (None/NaN) e 'F' sui soli presenti.
+#   Colonne intercalate (noise_dbm solo nelle righe SURVEY) non pagano più due XOR pieni
+#   per ogni buco; 'F' resta per i blocchi già scritti
+# - 'E' testi a pochi valori (modo, banda, fix, sorgenti): RLE su un dizionario
+# - 'Z' testi liberi (ts_iso, sketch): zlib
+# Come in Gorilla si toglie la ridondanza tra valori vicini, ma con larghezze per blocco invece
+# che per valore: la decodifica con NumPy è vettoriale (unpackbits, cumsum, xor.accumulate).
+# Interi impacchettati "patched FOR": larghezza W scelta sul blocco, i pochi valori più larghi
+# (un ciclo saltato, un salto di Kp) vanno in una lista di eccezioni (indice, valore).
+# Senza NumPy (opzionale) encode/decode girano in Python puro, più lenti.
+
+import json
+import math
+import struct
+import zlib
+
+try:
+    import numpy as np
+    _HAS_NUMPY = True
+except Exception:
+    _HAS_NUMPY = False
+
+_HDR = struct.Struct("<cI")           # tipo, numero di valori
+_EXC = struct.Struct("<IQ")           # eccezione: indice, valore
+
+
+# --- interi non negativi impacchettati a larghezza fissa, con eccezioni ---
+def _pack(vals):
+    n = len(vals)
+    if not n:
+        return b"\x00" + struct.pack("<I", 0)
+    lens = sorted(v.bit_length() for v in vals)
+    # W che minimizza n*W + 96 bit per eccezione
+    best_w, best = lens[-1], n * lens[-1]
+    for i in range(n):
+        w = lens[i]
+        cost = n * w + (n - 1 - i) * 96
+        if cost < best:
+            best_w, best = w, cost
+    w = best_w
+    lim = 1 << w
+    exc = [(i, v) for i, v in enumerate(vals) if v >= lim]
+    if exc:
+        vals = list(vals)
+        for i, _ in exc:
+            vals[i] = 0
+    out = [struct.pack("<BI", w, len(exc))]
+    if w:
+        nbytes = (n * w + 7) // 8
+        bits = "".join(format(v, f"0{w}b") for v in vals).ljust(nbytes * 8, "0")
+        out.append(int(bits, 2).to_bytes(nbytes, "big"))
+    out.extend(_EXC.pack(i, v) for i, v in exc)
+    return b"".join(out)
+
+def _unpack(buf, pos, n):
+    """→ (valori, nuova posizione); array uint64 con NumPy, lista altrimenti."""
+    w, k = struct.unpack_from("<BI", buf, pos)
+    pos += 5
+    nbytes = (n * w + 7) // 8
+    raw = buf[pos:pos + nbytes]
+    pos += nbytes
+    if _HAS_NUMPY:
+        if w:
+            bits = np.unpackbits(np.frombuffer(raw, np.uint8))[:n * w].reshape(n, w)
+            vals = bits.astype(np.uint64) @ (np.uint64(1) << np.arange(w - 1, -1, -1, dtype=np.uint64))
+        else:
+            vals = np.zeros(n, np.uint64)
+    else:
+        if w:
+            s = bin(int.from_bytes(raw, "big"))[2:].zfill(nbytes * 8)
+            vals = [int(s[i * w:(i + 1) * w], 2) for i in range(n)]
+        else:
+            vals = [0] * n
+    for _ in range(k):
+        i, v = _EXC.unpack_from(buf, pos)
+        pos += _EXC.size
+        vals[i] = v
+    return vals, pos
+
+def _zz(v):
+    return (v << 1) ^ (v >> 63) if v < 0 else v << 1
+
+def _unzz(v):
+    return (v >> 1) ^ -(v & 1)
+
+
+# --- 'T': interi (ts_ms) ---
+def _enc_ts(vals):
+    runs, lens = [], []
+    for v in vals:
+        if runs and runs[-1] == v:
+            lens[-1] += 1
+        else:
+            runs.append(v)
+            lens.append(1)
+    head = struct.pack("<Iqq", len(runs), runs[0] if runs else 0,
+                       runs[1] - runs[0] if len(runs) > 1 else 0)
+    dods = [_zz((runs[i] - runs[i - 1]) - (runs[i - 1] - runs[i - 2])) for i in range(2, len(runs))]
+    return head + _pack(dods) + _pack(lens)
+
+def _dec_ts(buf, pos, n):
+    k, v0, d0 = struct.unpack_from("<Iqq", buf, pos)
+    pos += 20
+    dods, pos = _unpack(buf, pos, max(k - 2, 0))
+    lens, pos = _unpack(buf, pos, k)
+    if _HAS_NUMPY:
+        dd = np.asarray(dods, np.uint64).astype(np.int64)
+        dd = (dd >> 1) ^ -(dd & 1)
+        deltas = np.concatenate((np.array([d0] if k > 1 else [], np.int64), d0 + np.cumsum(dd)))
+        runs = np.concatenate((np.array([v0] if k else [], np.int64), v0 + np.cumsum(deltas)))
+        return np.repeat(runs, np.asarray(lens, np.int64))
+    runs, d = ([v0] if k else []), d0
+    if k > 1:
+        runs.append(v0 + d0)
+    for z in dods:
+        d += _unzz(int(z))
+        runs.append(runs[-1] + d)
+    out = []
+    for v, m in zip(runs, lens):
+        out.extend([v] * int(m))
+    return out
+
+
+# --- 'F': numeri (float64, None = NaN) ---
+def _f2u(x):
+    return struct.unpack("<Q", struct.pack("<d", float("nan") if x is None else float(x)))[0]
+
+def _enc_float(vals):
+    prev, nz, bitmap = 0, [], bytearray((len(vals) + 7) // 8)
+    for i, x in enumerate(vals):
+        u = _f2u(x)
+        d = u ^ prev
+        prev = u
+        if d:
+            bitmap[i >> 3] |= 0x80 >> (i & 7)
+            nz.append(d)
+    tz = min(((d & -d).bit_length() - 1 for d in nz), default=0)
+    return bytes(bitmap) + struct.pack("<B", tz) + _pack([d >> tz for d in nz])
+
+def _dec_float(buf, pos, n):
+    nb = (n + 7) // 8
+    bitmap = buf[pos:pos + nb]
+    tz = buf[pos + nb]
+    pos += nb + 1
+    if _HAS_NUMPY:
+        mask = np.unpackbits(np.frombuffer(bitmap, np.uint8))[:n].astype(bool)
+        nz, pos = _unpack(buf, pos, int(mask.sum()))
+        x = np.zeros(n, np.uint64)
+        x[mask] = np.asarray(nz, np.uint64) << np.uint64(tz)
+        return np.bitwise_xor.accumulate(x).view(np.float64)
+    idx = [i for i in range(n) if bitmap[i >> 3] & (0x80 >> (i & 7))]
+    nz, pos = _unpack(buf, pos, len(idx))
+    out, prev, j = [], 0, 0
+    it = iter(idx)
+    nxt = next(it, None)
+    for i in range(n):
+        if i == nxt:
+            prev ^= nz[j] << tz
+            j += 1
+            nxt = next(it, None)
+        out.append(struct.unpack("<d", struct.pack("<Q", prev))[0])
+    return out
+
+
+# --- 'N': numeri con mancanti a parte ---
+_ALL, _SOME, _NONE = 0, 1, 2          # presenti: tutti, secondo la bitmap, nessuno
+
+def _enc_num(vals):
+    pres = [x for x in vals if x is not None and not math.isnan(x)]
+    if len(pres) == len(vals):
+        return struct.pack("<B", _ALL) + _enc_float(pres)
+    if not pres:
+        return struct.pack("<B", _NONE)
+    bitmap = bytearray((len(vals) + 7) // 8)
+    for i, x in enumerate(vals):
+        if x is not None and not math.isnan(x):
+            bitmap[i >> 3] |= 0x80 >> (i & 7)
+    return struct.pack("<B", _SOME) + bytes(bitmap) + _enc_float(pres)
+
+def _dec_num(buf, pos, n):
+    how = buf[pos]
+    pos += 1
+    if how == _ALL:
+        return _dec_float(buf, pos, n)
+    if how == _NONE:
+        return np.full(n, np.nan) if _HAS_NUMPY else [float("nan")] * n
+    nb = (n + 7) // 8
+    bitmap = buf[pos:pos + nb]
+    pos += nb
+    if _HAS_NUMPY:
+        mask = np.unpackbits(np.frombuffer(bitmap, np.uint8))[:n].astype(bool)
+        out = np.full(n, np.nan)
+        out[mask] = _dec_float(buf, pos, int(mask.sum()))
+        return out
+    idx = [i for i in range(n) if bitmap[i >> 3] & (0x80 >> (i & 7))]
+    out = [float("nan")] * n
+    for i, v in zip(idx, _dec_float(buf, pos, len(idx))):
+        out[i] = v
+    return out
+
+
+# --- 'E': testi a pochi valori (RLE su dizionario) ---
+def _enc_enum(vals):
+    words, codes, lens = {}, [], []
+    for v in vals:
+        c = words.setdefault(v, len(words))
+        if codes and codes[-1] == c:
+            lens[-1] += 1
+        else:
+            codes.append(c)
+            lens.append(1)
+    d = json.dumps(list(words)).encode()
+    return struct.pack("<II", len(d), len(codes)) + d + _pack(codes) + _pack(lens)
+
+def _dec_enum(buf, pos, n):
+    nd, k = struct.unpack_from("<II", buf, pos)
+    pos += 8
+    words = json.loads(buf[pos:pos + nd])
+    pos += nd
+    codes, pos = _unpack(buf, pos, k)
+    lens, pos = _unpack(buf, pos, k)
+    if _HAS_NUMPY:
+        return np.array(words, dtype=object)[np.repeat(np.asarray(codes, np.int64),
+                                                        np.asarray(lens, np.int64))]
+    out = []
+    for c, m in zip(codes, lens):
+        out.extend([words[int(c)]] * int(m))
+    return out
+
+
+# --- 'Z': testi liberi ---
+def _enc_text(vals):
+    return zlib.compress(json.dumps(list(vals), separators=(",", ":")).encode(), 9)
+
+def _dec_text(buf, pos, n):
+    vals = json.loads(zlib.decompress(buf[pos:]))
+    return np.array(vals, dtype=object) if _HAS_NUMPY else vals
+
+
+_CODECS = {b"T": (_enc_ts, _dec_ts), b"F": (_enc_float, _dec_float),
+           b"N": (_enc_num, _dec_num), b"E": (_enc_enum, _dec_enum), b"Z": (_enc_text, _dec_text)}
+
+
+def encode(kind, vals):
+    """kind: 'T' | 'F' | 'N' | 'E' | 'Z'; vals: sequenza → blocco (bytes)."""
+    kind = kind.encode() if isinstance(kind, str) else kind
+    vals = list(vals)
+    return _HDR.pack(kind, len(vals)) + _CODECS[kind][0](vals)
+
+def decode(buf):
+    """Blocco → valori (array NumPy se disponibile: int64, float64 con NaN, object; lista altrimenti)."""
+    kind, n = _HDR.unpack_from(buf, 0)
+    return _CODECS[kind][1](bytes(buf), _HDR.size, n)
+
+def to_python(vals, integer=False):
+    """Valori decodificati → lista Python con None al posto di NaN (interi se integer)."""
+    out = []
+    for v in (vals.tolist() if _HAS_NUMPY and hasattr(vals, "tolist") else vals):
+        if isinstance(v, float):
+            v = None if math.isnan(v) else (int(v) if integer else v)
+        out.append(v)
+    return out
+
+
+if __name__ == "__main__":
+    import random, time
+    n = 43200
+    ts = [1760000000000 + (i // 30) * 60000 + (7 if i // 30 == 500 else 0) for i in range(n)]
+    kp = [round(2.3 + (i // 5400) * 0.33, 2) for i in range(n)]
+    noise = [None if i % 3 else round(-95 + random.gauss(0, 2), 1) for i in range(n)]
+    band = ["24" if (i % 30) < 20 else "58" for i in range(n)]
+    for name, kind, vals in (("ts_ms", "T", ts), ("kp", "N", kp), ("noise_dbm", "F", noise),
+                             ("noise_dbm", "N", noise), ("band", "E", band),
+                             ("empty", "N", [None] * n)):
+        t0 = time.perf_counter()
+        blk = encode(kind, vals)
+        t1 = time.perf_counter()
+        back = to_python(decode(blk), integer=(kind == "T"))
+        t2 = time.perf_counter()
+        assert back == vals, name
+        print(f"{name:10s} {kind} {len(blk):7d} B  ({len(blk) * 8 / n:5.2f} bit/val)  "
+              f"enc {1e3 * (t1 - t0):6.1f} ms  dec {1e3 * (t2 - t1):6.1f} ms")
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# Indice sparso minuto → offset dei CSV giornalieri, in un file accanto (<file>.idx).
+# - il logger, quando un ciclo apre un minuto nuovo e prima di scriverne le righe, aggiunge
+#   "minuto_epoch offset": offset in byte della prima riga di quel minuto nel .csv
+# - alla compressione del giorno il .csv.gz è scritto a membri gzip concatenati, uno ogni
+#   CSV_GZ_MEMBER_MIN minuti (resta un gzip normale per zcat/gzip.open/pandas) e l'indice
+#   diventa "minuto_epoch offset_membro skip offset": membro nel .gz, byte da scartare nel
+#   membro decompresso, offset nel CSV originale
+# Chi legge un intervallo salta all'offset giusto e passa al parser solo quelle righe
+# (per un .gz al più un membro decompresso in più). Le righe del primo e dell'ultimo minuto
+# vanno comunque filtrate sul tempo dal chiamante.
+# Senza indice (file vecchi) o con minuti non crescenti (orologio tornato indietro)
+# read_range ritorna None: il chiamante legge il file intero come prima.
+
+import bisect
+import gzip
+import os
+from datetime import datetime
+
+CSV_GZ_MEMBER_MIN = int(os.environ.get("CSV_GZ_MEMBER_MIN", "60"))   # minuti per membro gzip
+IDX_EXT = ".idx"
+_CHUNK = 1 << 20
+
+
+def idx_path(path):
+    return path + IDX_EXT
+
+
+def _load(path):
+    """Righe dell'indice come tuple di interi; None se manca o non è ordinato."""
+    try:
+        with open(path, "r") as f:
+            ent = []
+            for line in f:
+                try:
+                    ent.append(tuple(int(x) for x in line.split()))
+                except ValueError:
+                    continue                  # riga troncata (crash a metà scrittura)
+    except OSError:
+        return None
+    ent = [e for e in ent if len(e) in (2, 4)]
+    if not ent or any(b[0] <= a[0] or b[-1] < a[-1] for a, b in zip(ent, ent[1:])):
+        return None
+    return ent
+
+
+class IndexWriter(object):
+    """Lato logger: un'istanza per file giornaliero aperto in append."""
+
+    def __init__(self, csv_path, fresh=False):
+        self.path = idx_path(csv_path)
+        self.last = None
+        if fresh:
+            open(self.path, "w").close()      # CSV nuovo: un indice rimasto non vale più
+        else:
+            ent = _load(self.path)
+            self.last = ent[-1][0] if ent else None
+
+    def mark(self, f, ts_iso):
+        """Da chiamare prima delle righe del ciclo con timestamp ts_iso (file f in append)."""
+        try:
+            minute = int(datetime.fromisoformat(ts_iso).timestamp()) // 60 * 60
+        except (TypeError, ValueError):
+            return
+        if self.last is not None and minute <= self.last:
+            return
+        f.flush()
+        off = os.fstat(f.fileno()).st_size   # append: la prossima riga parte dalla fine
+        with open(self.path, "a") as fi:
+            fi.write(f"{minute} {off}\n")
+        self.last = minute
+
+
+def compress(path_csv, member_min=CSV_GZ_MEMBER_MIN):
+    """.csv (+ .idx) → .csv.gz a membri (+ .csv.gz.idx), poi rimuove gli originali."""
+    gz = path_csv + ".gz"
+    ent = _load(idx_path(path_csv)) or []
+    ent = [e for e in ent if len(e) == 2]
+    step = 60 * max(1, member_min)
+    cuts, cur = [0], None                     # il primo membro ha anche l'header
+    for m, off in ent:
+        if cur is not None and m // step != cur and off > cuts[-1]:
+            cuts.append(off)
+        cur = m // step
+    size = os.path.getsize(path_csv)
+    starts = []
+    with open(path_csv, "rb") as f_in, open(gz, "wb") as f_out:
+        for a, b in zip(cuts, cuts[1:] + [size]):
+            starts.append(f_out.tell())
+            with gzip.GzipFile(fileobj=f_out, mode="wb") as z:
+                left = b - a
+                while left > 0:
+                    buf = f_in.read(min(_CHUNK, left))
+                    if not buf:
+                        break
+                    z.write(buf)
+                    left -= len(buf)
+    if ent:
+        with open(idx_path(gz), "w") as fi:
+            for m, off in ent:
+                k = bisect.bisect_right(cuts, off) - 1
+                fi.write(f"{m} {starts[k]} {off - cuts[k]} {off}\n")
+    os.remove(path_csv)
+    try:
+        os.remove(idx_path(path_csv))
+    except OSError:
+        pass
+
+
+def read_range(path, t0, t1):
+    """
+    Header + righe dei minuti che coprono [t0, t1] (epoch s) di un .csv o .csv.gz, in bytes;
+    None se il file non ha un indice utilizzabile.
+    """
+    ent = _load(idx_path(path))
+    if ent is None:
+        return None
+    gzipped = path.endswith(".gz")
+    if gzipped != (len(ent[0]) == 4):
+        return None
+    minutes = [e[0] for e in ent]
+    i = bisect.bisect_right(minutes, int(t0) // 60 * 60) - 1
+    j = bisect.bisect_right(minutes, int(t1) // 60 * 60)
+    if not gzipped:
+        with open(path, "rb") as f:
+            header = f.readline()
+            a = ent[i][1] if i >= 0 else len(header)
+            f.seek(a)
+            body = f.read(ent[j][1] - a) if j < len(ent) else f.read()
+        return header + body
+    with gzip.open(path, "rb") as g:
+        header = g.readline()
+    if i < 0:
+        member, skip, a = 0, len(header), len(header)
+    else:
+        _, member, skip, a = ent[i]
+    with open(path, "rb") as f:
+        f.seek(member)
+        with gzip.GzipFile(fileobj=f, mode="rb") as g:
+            g.seek(skip)                      # in avanti: decomprime e scarta
+            body = g.read(ent[j][3] - a) if j < len(ent) else g.read()
+    return header + body
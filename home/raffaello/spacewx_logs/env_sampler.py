@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# Campionamento ambientale continuo (Sense HAT B) in un thread dedicato.
+# Legge SHTC3/LPS22HB/ICM20948 a ENV_SAMPLE_HZ (1–5 Hz) e accumula i campioni in
+# ring buffer preallocati (array 'd', nessuna allocazione per campione).
+# Il logger a ogni intervallo chiama collect(): media/min/max/std per canale e reset.
+# È l'unico a toccare l'I2C mentre è attivo: il loop principale non legge più inline.
+# I sensori sono letti insieme in pipeline (sensor_workers.read_all: una snapshot con
+# scadenza, ~ la sola conversione SHTC3); se in un intervallo un canale non ha campioni
+# nuovi, collect() ripiega sull'ultimo valore buono (n=0) con la sua età.
+
+import math
+import os
+import threading
+import time
+from array import array
+
+from sensor_workers import read_all
+
+ENV_SAMPLE_HZ = float(os.environ.get("ENV_SAMPLE_HZ", "1"))   # 0 = disabilitato (letture inline)
+ENV_RING_S = int(os.environ.get("ENV_RING_S", "120"))         # capienza ring: ~2 intervalli di log
+
+# Canali accumulati; t_c è la fusione degli aggregati di t_sht e t_lps (vedi _t_fused)
+CHANNELS = ("t_sht", "t_lps", "rh", "p", "mx", "my", "mz", "mnorm")
+T_WEIGHTS = (("t_sht", 0.7), ("t_lps", 0.3))    # t_c = 0.7*SHTC3 + 0.3*LPS22HB (+ offset)
+
+# Campi aggiunti al CSV (in quest'ordine, vedi env_stats_row())
+ENV_STAT_FIELDS = [
+    "t_c_min","t_c_max","t_c_std",
+    "rh_pct_min","rh_pct_max","rh_pct_std",
+    "p_hpa_std",
+    "mag_norm_min","mag_norm_max","mag_norm_std",
+    "env_n"
+]
+SENSOR_AGE_FIELDS = ["shtc3_age_s", "lps_age_s", "mag_age_s", "sensor_faults"]
+
+
+class Ring(object):
+    """Ring buffer di float a capienza fissa; oltre la capienza sovrascrive i più vecchi."""
+    __slots__ = ("buf", "cap", "n", "i")
+
+    def __init__(self, cap):
+        self.cap = max(1, int(cap))
+        self.buf = array("d", bytes(8 * self.cap))
+        self.n = 0
+        self.i = 0
+
+    def push(self, x):
+        if x is None:
+            return
+        self.buf[self.i] = x
+        self.i = (self.i + 1) % self.cap
+        if self.n < self.cap:
+            self.n += 1
+
+    def stats(self):
+        """dict(mean, min, max, std, n) sui campioni presenti, None se vuoto."""
+        n = self.n
+        if not n:
+            return None
+        vals = self.buf[:n] if n < self.cap else self.buf
+        mean = math.fsum(vals) / n
+        std = math.sqrt(math.fsum((v - mean) ** 2 for v in vals) / (n - 1)) if n > 1 else None
+        return dict(mean=mean, min=min(vals), max=max(vals), std=std, n=n)
+
+    def clear(self):
+        self.n = 0
+        self.i = 0
+
+
+class EnvSampler(threading.Thread):
+    """
+    Thread daemon di campionamento. start() dopo il warmup dei sensori,
+    collect() a ogni intervallo di log, stop() in chiusura.
+    """
+
+    def __init__(self, hz=ENV_SAMPLE_HZ, ring_s=ENV_RING_S, mag_reader=None):
+        super().__init__(name="env-sampler", daemon=True)
+        # reader → (valore, età_s); mag: es. MagPipeline.latest_counts, niente I2C doppio.
+        # None: il mag entra nella snapshot insieme a SHTC3/LPS22HB
+        self.mag_reader = mag_reader
+        self.names = ("shtc3", "lps22hb") + (() if mag_reader else ("icm",))
+        self.period = 1.0 / max(0.1, min(5.0, hz))
+        cap = int(ring_s / self.period) + 1
+        # la FIFO LPS22HB può restituire più campioni per tick (ODR > rate del thread)
+        self._rings = {c: Ring(cap * (4 if c == "p" else 1)) for c in CHANNELS}
+        self._last = {}                     # canale → (ultimo valore buono, monotonic)
+        self._lock = threading.Lock()
+        self._halt = threading.Event()
+
+    def run(self):
+        t_next = time.monotonic()
+        while not self._halt.is_set():
+            try:
+                self.sample()
+            except Exception as e:
+                print(f"[ENV] sample error: {e}")
+            t_next += self.period
+            delay = t_next - time.monotonic()
+            if delay < 0:                   # in ritardo (I2C lento): riallinea senza raffiche
+                t_next = time.monotonic()
+                delay = 0
+            self._halt.wait(delay)
+
+    def _put(self, c, x, now):
+        if x is not None:
+            self._rings[c].push(x)
+            self._last[c] = (x, now)
+
+    def sample(self):
+        vals = read_all(self.names)
+        sht, a_sht = vals["shtc3"]
+        lps, a_lps = vals["lps22hb"]
+        mag, a_mag = self.mag_reader() if self.mag_reader else vals["icm"]
+        # solo i valori letti adesso (età 0) entrano nei ring; quelli in cache no
+        t_sht, rh = sht if sht is not None and a_sht == 0.0 else (None, None)
+        lps = lps if lps and a_lps == 0.0 else []
+        mx, my, mz, mnorm = mag if mag is not None and a_mag == 0.0 else (None,) * 4
+        ts = [t for _, t in lps if t is not None]
+        t_lps = sum(ts) / len(ts) if ts else None
+        now = time.monotonic()
+        with self._lock:
+            self._put("t_sht", t_sht, now); self._put("t_lps", t_lps, now)
+            self._put("rh", rh, now)
+            for p, _ in lps:
+                self._put("p", p, now)
+            self._put("mx", mx, now); self._put("my", my, now); self._put("mz", mz, now)
+            self._put("mnorm", mnorm, now)
+
+    def collect(self):
+        """
+        {canale: dict(mean,min,max,std,n,age) | None} dall'ultimo collect(), poi reset.
+        Canale senza campioni nuovi: ultimo valore buono con n=0 e la sua età in secondi.
+        """
+        now = time.monotonic()
+        with self._lock:
+            out = {}
+            for c, r in self._rings.items():
+                st = r.stats()
+                if st is None and c in self._last:
+                    v, t = self._last[c]
+                    st = dict(mean=v, min=v, max=v, std=None, n=0)
+                if st is not None:
+                    st["age"] = round(now - self._last[c][1], 1) if c in self._last else None
+                out[c] = st
+                r.clear()
+        return out
+
+    def stop(self):
+        self._halt.set()
+
+
+def _g(st, k, nd=2, offset=0.0):
+    return None if not st or st[k] is None else round(st[k] + offset, nd)
+
+def _t_fused(agg):
+    """
+    Aggregato di t_c dai due sensori: T_WEIGHTS su mean/min/max/std dell'intervallo, senza
+    offset. La media pesata delle medie non mescola tick fusi e tick a un solo sensore (il die
+    dell'LPS22HB è più caldo dell'SHTC3); min/max/std con la stessa combinazione, come se i
+    due andassero in fase (stessa scheda: le variazioni lente sono comuni). Un sensore senza
+    campioni nuovi nell'intervallo resta fuori; se nessuno ne ha, ultimi valori buoni (n=0).
+    """
+    parts = [(agg[c], w) for c, w in T_WEIGHTS if agg.get(c)]
+    parts = [(st, w) for st, w in parts if st["n"]] or parts
+    if not parts:
+        return None
+    tw = sum(w for _, w in parts)
+    out = {k: (None if any(st[k] is None for st, _ in parts)
+               else sum(st[k] * w for st, w in parts) / tw)
+           for k in ("mean", "min", "max", "std")}
+    out["n"] = min(st["n"] for st, _ in parts)
+    return out
+
+def env_values(agg, temp_offset_c=0.0):
+    """
+    Valori "classici" del CSV dagli aggregati di collect():
+    (t_c, rh_pct, p_hpa, p_min, p_max, mx, my, mz, mnorm). Offset applicato alla fusione.
+    """
+    return (
+        _g(_t_fused(agg), "mean", 2, temp_offset_c), _g(agg["rh"], "mean", 1),
+        _g(agg["p"], "mean", 2), _g(agg["p"], "min", 2), _g(agg["p"], "max", 2),
+        _g(agg["mx"], "mean", 1), _g(agg["my"], "mean", 1), _g(agg["mz"], "mean", 1),
+        _g(agg["mnorm"], "mean", 1),
+    )
+
+def env_stats_row(agg, temp_offset_c=0.0):
+    """Colonne ENV_STAT_FIELDS; agg=None (campionatore disabilitato) → tutte vuote."""
+    if agg is None:
+        return [None] * len(ENV_STAT_FIELDS)
+    t, rh, p, mn = _t_fused(agg), agg["rh"], agg["p"], agg["mnorm"]
+    return [
+        _g(t, "min", 2, temp_offset_c), _g(t, "max", 2, temp_offset_c), _g(t, "std", 3),
+        _g(rh, "min", 1), _g(rh, "max", 1), _g(rh, "std", 2),
+        _g(p, "std", 3),
+        _g(mn, "min", 1), _g(mn, "max", 1), _g(mn, "std", 2),
+        max((st["n"] for c, st in agg.items() if st and c != "p"), default=0),   # tick del thread
+    ]
+
+def sensor_age_row(ages, n_faults):
+    """Colonne SENSOR_AGE_FIELDS: età (s) del valore più recente di SHTC3/LPS22HB/mag + guasti."""
+    return [ages.get("shtc3"), ages.get("lps22hb"), ages.get("icm"), n_faults]
+
+def agg_ages(agg):
+    """Età per sensore dagli aggregati di collect()."""
+    g = lambda c: agg[c]["age"] if agg.get(c) else None
+    return {"shtc3": g("rh"), "lps22hb": g("p"), "icm": g("mnorm")}
+
+
+if __name__ == "__main__":
+    from sensehat_b_reader import warmup
+    warmup()
+    s = EnvSampler(hz=float(os.environ.get("ENV_SAMPLE_HZ", "5")) or 5)
+    s.start()
+    for _ in range(3):
+        time.sleep(10)
+        for c, st in s.collect().items():
+            print(c, st and {k: (round(v, 3) if isinstance(v, float) else v) for k, v in st.items()})
+        print()
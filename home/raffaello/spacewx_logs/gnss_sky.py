@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# Cattura SKY per-satellite in forma compatta + aggregati per costellazione.
+#
+# Stream binario giornaliero (sky_YYYYMMDD.bin, compresso a fine giornata come il CSV):
+#   record = header "<IB"  (epoch UTC in secondi uint32, n. satelliti uint8)
+#          + n x  "<HBbHe" (PRN uint16, gnss|0x80 se usato uint8, elevazione int8 [°],
+#                           azimut uint16 [°], C/N0 float16 [dB-Hz], NaN se assente)
+#   → 8 byte per satellite, nessun testo ripetuto.
+
+import gzip, json, math, os, struct, time
+
+_HDR = struct.Struct("<IB")
+_SAT = struct.Struct("<HBbHe")
+_USED = 0x80
+
+# gnssid gpsd (u-blox) → sigla
+GNSS_NAMES = {0: "GP", 1: "SB", 2: "GA", 3: "BD", 4: "IM", 5: "QZ", 6: "GL", 7: "IR"}
+# costellazioni aggregate nel CSV (prefisso colonna → gnssid)
+CONSTELLATIONS = (("gps", 0), ("glo", 6), ("gal", 2), ("bds", 3))
+HI_ELEV_DEG = float(os.environ.get("SKY_HI_ELEV_DEG", "30"))
+
+SKY_FIELDS = [f"sky_{c}_{k}" for c, _ in CONSTELLATIONS for k in ("used", "tot", "cn0")] + \
+             ["sky_cn0_lo_el", "sky_cn0_hi_el"]
+
+
+def _gnss_from_prn(prn):
+    # numerazione NMEA "estesa" usata da gpsd quando manca gnssid
+    if 1 <= prn <= 32: return 0
+    if 33 <= prn <= 64 or 120 <= prn <= 158: return 1
+    if 65 <= prn <= 96: return 6
+    if 201 <= prn <= 237 or 401 <= prn <= 437: return 3
+    if 301 <= prn <= 336: return 2
+    if 193 <= prn <= 202: return 5
+    return 255
+
+def _num(v):
+    try:
+        f = float(v)
+        return f if math.isfinite(f) else None
+    except Exception:
+        return None
+
+def sky_sats(sky):
+    """Normalizza i satelliti di un messaggio SKY → [dict(prn,gnss,el,az,cn0,used)]."""
+    sats = sky.get('satellites') or []
+    out = []
+    if not isinstance(sats, list):
+        return out
+    for s in sats:
+        if isinstance(s, str):
+            try: s = json.loads(s)
+            except Exception: s = None
+        if not isinstance(s, dict):
+            continue
+        prn = int(_num(s.get('PRN')) or 0)
+        gnss = s.get('gnssid')
+        gnss = int(gnss) if isinstance(gnss, (int, float)) else _gnss_from_prn(prn)
+        cn0 = s.get('ss') or s.get('cn0') or s.get('cn') or s.get('snr')
+        out.append(dict(
+            prn=prn, gnss=gnss,
+            el=_num(s.get('el')), az=_num(s.get('az')), cn0=_num(cn0),
+            used=s.get('used') in (True, 1, 'true', 'True')
+        ))
+    return out
+
+def _mean(vals):
+    return round(sum(vals) / len(vals), 1) if vals else None
+
+def constellation_row(sats):
+    """Aggregati per costellazione (usati/visti/C/N0 medio) + C/N0 per bassa/alta elevazione."""
+    row = []
+    for _, gid in CONSTELLATIONS:
+        cs = [s for s in sats if s["gnss"] == gid]
+        row += [sum(1 for s in cs if s["used"]), len(cs),
+                _mean([s["cn0"] for s in cs if s["cn0"]])]
+    lo = [s["cn0"] for s in sats if s["cn0"] and s["el"] is not None and s["el"] < HI_ELEV_DEG]
+    hi = [s["cn0"] for s in sats if s["cn0"] and s["el"] is not None and s["el"] >= HI_ELEV_DEG]
+    return row + [_mean(lo), _mean(hi)]
+
+
+def pack_record(epoch_s, sats):
+    sats = sats[:255]
+    buf = [_HDR.pack(int(epoch_s) & 0xFFFFFFFF, len(sats))]
+    for s in sats:
+        el = s["el"]; az = s["az"]
+        buf.append(_SAT.pack(
+            s["prn"] & 0xFFFF,
+            (s["gnss"] & 0x7F) | (_USED if s["used"] else 0),
+            max(-128, min(127, int(round(el)))) if el is not None else -128,
+            int(round(az)) % 360 if az is not None else 0xFFFF,
+            s["cn0"] if s["cn0"] is not None else float("nan"),
+        ))
+    return b"".join(buf)
+
+def read_sky_stream(path):
+    """Generatore (epoch_s, [dict sat]) da uno stream .bin o .bin.gz."""
+    op = gzip.open if path.endswith(".gz") else open
+    with op(path, "rb") as f:
+        data = f.read()
+    off = 0
+    while off + _HDR.size <= len(data):
+        ts, n = _HDR.unpack_from(data, off); off += _HDR.size
+        if off + n * _SAT.size > len(data):
+            break                       # record troncato (crash durante la scrittura)
+        sats = []
+        for _ in range(n):
+            prn, g, el, az, cn0 = _SAT.unpack_from(data, off); off += _SAT.size
+            sats.append(dict(
+                prn=prn, gnss=g & 0x7F, used=bool(g & _USED),
+                el=None if el == -128 else el, az=None if az == 0xFFFF else az,
+                cn0=None if math.isnan(cn0) else round(cn0, 1)
+            ))
+        yield ts, sats
+
+
+class SkyStream(object):
+    """
+    Appende record SKY al file del giorno. Con min_interval_s > 0 scrive al più
+    un record ogni N secondi (gpsd può emettere SKY ad ogni epoca).
+    """
+
+    def __init__(self, path_for_day, min_interval_s=10):
+        self.path_for_day = path_for_day
+        self.min_interval_s = min_interval_s
+        self._path = None
+        self._f = None
+        self._last = 0.0
+
+    def write(self, sats, now=None):
+        now = now or time.time()
+        if not sats or now - self._last < self.min_interval_s:
+            return
+        path = self.path_for_day()
+        if path != self._path:
+            self.close()
+            self._path = path
+            self._f = open(path, "ab")
+        self._f.write(pack_record(now, sats))
+        self._f.flush()
+        self._last = now
+
+    def close(self):
+        if self._f is not None:
+            try: self._f.close()
+            except Exception: pass
+        self._f = None
+
+
+if __name__ == "__main__":
+    import sys
+    for ts, sats in read_sky_stream(sys.argv[1]):
+        used = sum(1 for s in sats if s["used"])
+        print(ts, f"n={len(sats)} used={used}",
+              " ".join(f"{GNSS_NAMES.get(s['gnss'], '?')}{s['prn']}:{s['cn0']}@{s['el']}" for s in sats))
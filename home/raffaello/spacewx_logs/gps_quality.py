@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# Statistiche online (memoria O(1)) sulla qualità GPS calcolate su TUTTI i TPV
+# dell'intervallo di log: jitter di posizione (Welford), eph/epv, conteggi fix,
+# dropout e deriva rispetto a una posizione di riferimento di lungo periodo.
+
+import json, math, os
+
+M_PER_DEG_LAT = 111_320.0   # approssimazione sferica, sufficiente per jitter/deriva locali
+REF_MAX_N = int(os.environ.get("GPS_REF_MAX_N", "100000"))  # oltre: media "a memoria lunga"
+REF_SAVE_M = float(os.environ.get("GPS_REF_SAVE_M", "0.1"))  # riscrive il riferimento oltre questo spostamento
+
+# Campi aggiunti al CSV (in quest'ordine, vedi GpsQuality.row())
+GPS_QUALITY_FIELDS = [
+    "gps_n_tpv","gps_n_3d","gps_n_2d","gps_n_nofix","gps_dropouts",
+    "gps_h_std_m","gps_v_std_m","gps_h_span_m",
+    "gps_eph_mean","gps_eph_max","gps_epv_mean","gps_epv_max",
+    "gps_h_drift_m","gps_v_drift_m"
+]
+
+
+class Welford(object):
+    """Media/varianza/min/max in streaming (algoritmo di Welford)."""
+    __slots__ = ("n", "mean", "m2", "vmin", "vmax")
+
+    def __init__(self):
+        self.n = 0; self.mean = 0.0; self.m2 = 0.0
+        self.vmin = None; self.vmax = None
+
+    def add(self, x):
+        if x is None:
+            return
+        x = float(x)
+        self.n += 1
+        d = x - self.mean
+        self.mean += d / self.n
+        self.m2 += d * (x - self.mean)
+        self.vmin = x if self.vmin is None or x < self.vmin else self.vmin
+        self.vmax = x if self.vmax is None or x > self.vmax else self.vmax
+
+    def std(self):
+        return math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else None
+
+    def avg(self):
+        return self.mean if self.n else None
+
+
+def _num(v):
+    try:
+        f = float(v)
+        return f if math.isfinite(f) else None
+    except Exception:
+        return None
+
+def _r(x, nd=2):
+    return None if x is None else round(x, nd)
+
+
+class GpsQuality(object):
+    """
+    Accumulatore per-intervallo. add_tpv() per ogni TPV ricevuto, row() per i
+    campi CSV, reset() a inizio intervallo. La posizione di riferimento
+    (media di lungo periodo dei fix 3D) è persistita in ref_path.
+    """
+
+    def __init__(self, ref_path=None):
+        self.ref_path = ref_path
+        self.ref = {"n": 0, "lat": 0.0, "lon": 0.0, "alt": 0.0}
+        self._last_mode = None
+        self._load_ref()
+        self._saved = dict(self.ref)
+        self.reset()
+
+    def reset(self):
+        self.n_tpv = 0
+        self.modes = {3: 0, 2: 0, 0: 0}
+        self.dropouts = 0
+        self.lat = Welford(); self.lon = Welford(); self.alt = Welford()
+        self.eph = Welford(); self.epv = Welford()
+
+    def add_tpv(self, tpv):
+        mode = tpv.get("mode")
+        mode = mode if mode in (2, 3) else 0
+        if mode == 0 and self._last_mode in (2, 3):
+            self.dropouts += 1
+        self._last_mode = mode
+        self.n_tpv += 1
+        self.modes[mode] += 1
+        if mode == 0:
+            return
+        lat, lon, alt = _num(tpv.get("lat")), _num(tpv.get("lon")), _num(tpv.get("alt"))
+        if lat is None or lon is None:
+            return
+        self.lat.add(lat); self.lon.add(lon)
+        if mode == 3:
+            self.alt.add(alt)
+            self._update_ref(lat, lon, alt)
+        eph = _num(tpv.get("eph"))
+        if eph is None:
+            epx, epy = _num(tpv.get("epx")), _num(tpv.get("epy"))
+            eph = math.hypot(epx, epy) if (epx is not None and epy is not None) else None
+        self.eph.add(eph)
+        self.epv.add(_num(tpv.get("epv")))
+
+    # --- riferimento di lungo periodo ---
+    def _update_ref(self, lat, lon, alt):
+        r = self.ref
+        n = min(r["n"] + 1, REF_MAX_N)
+        r["lat"] += (lat - r["lat"]) / n
+        r["lon"] += (lon - r["lon"]) / n
+        if alt is not None:
+            r["alt"] += (alt - r["alt"]) / n
+        r["n"] = n
+
+    def _load_ref(self):
+        if not self.ref_path:
+            return
+        try:
+            with open(self.ref_path, "r") as f:
+                self.ref.update(json.load(f))
+        except Exception:
+            pass
+
+    def _ref_moved(self):
+        """Riferimento da riscrivere: spostato di almeno REF_SAVE_M o peso (n) raddoppiato."""
+        r, s = self.ref, self._saved
+        if not s["n"] or r["n"] >= 2 * s["n"]:
+            return True
+        kx = M_PER_DEG_LAT * math.cos(math.radians(r["lat"]))
+        dh = math.hypot((r["lat"] - s["lat"]) * M_PER_DEG_LAT, (r["lon"] - s["lon"]) * kx)
+        return dh >= REF_SAVE_M or abs(r["alt"] - s["alt"]) >= REF_SAVE_M
+
+    def save_ref(self):
+        # chiamata a ogni ciclo: scrive su SD solo se il riferimento è cambiato davvero
+        if not self.ref_path or not self.ref["n"] or not self._ref_moved():
+            return
+        try:
+            with open(self.ref_path, "w") as f:
+                json.dump(self.ref, f)
+            self._saved = dict(self.ref)
+        except Exception:
+            pass
+
+    # --- output ---
+    def _m_per_deg_lon(self):
+        la = self.lat.avg() if self.lat.n else self.ref["lat"]
+        return M_PER_DEG_LAT * math.cos(math.radians(la or 0.0))
+
+    def row(self):
+        kx = self._m_per_deg_lon()
+        h_std = h_span = h_drift = v_drift = None
+        s_lat, s_lon = self.lat.std(), self.lon.std()
+        if s_lat is not None and s_lon is not None:
+            h_std = math.hypot(s_lat * M_PER_DEG_LAT, s_lon * kx)
+        if self.lat.n:
+            h_span = math.hypot((self.lat.vmax - self.lat.vmin) * M_PER_DEG_LAT,
+                                (self.lon.vmax - self.lon.vmin) * kx)
+            if self.ref["n"]:
+                h_drift = math.hypot((self.lat.mean - self.ref["lat"]) * M_PER_DEG_LAT,
+                                     (self.lon.mean - self.ref["lon"]) * kx)
+        if self.alt.n and self.ref["n"]:
+            v_drift = self.alt.mean - self.ref["alt"]
+        return [
+            self.n_tpv, self.modes[3], self.modes[2], self.modes[0], self.dropouts,
+            _r(h_std), _r(self.alt.std()), _r(h_span),
+            _r(self.eph.avg()), _r(self.eph.vmax), _r(self.epv.avg()), _r(self.epv.vmax),
+            _r(h_drift), _r(v_drift)
+        ]
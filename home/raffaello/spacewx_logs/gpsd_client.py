@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# Client gpsd minimale event-driven (sostituisce gps3 nel logger).
+# - selectors (epoll su Linux): il processo dorme finché non arrivano dati
+# - framing sulle newline con buffer di ricezione (niente readline per messaggio)
+# - decodifica JSON SOLO delle classi richieste (default TPV/SKY): gpsd mette
+#   sempre "class" come prima chiave, quindi il filtro è un confronto di prefisso
+# - riconnessione automatica con backoff se gpsd si riavvia
+
+import json, selectors, socket, time
+
+WATCH_CMD = b'?WATCH={"enable":true,"json":true};\n'
+
+
+class GpsdClient(object):
+
+    def __init__(self, host="127.0.0.1", port=2947, classes=("TPV", "SKY"),
+                 connect_timeout=3.0, max_backoff=30.0):
+        self.host = host
+        self.port = port
+        self._prefixes = tuple(('{"class":"%s"' % c).encode() for c in classes)
+        self.connect_timeout = connect_timeout
+        self.max_backoff = max_backoff
+        self._sel = selectors.DefaultSelector()
+        self._sock = None
+        self._buf = b""
+        self._backoff = 1.0
+        self._next_try = 0.0
+
+    # --- connessione ---
+    def connect(self):
+        self.close()
+        s = socket.create_connection((self.host, self.port), timeout=self.connect_timeout)
+        s.setblocking(False)
+        s.sendall(WATCH_CMD)
+        self._sock = s
+        self._buf = b""
+        self._sel.register(s, selectors.EVENT_READ)
+        self._backoff = 1.0
+        print(f"[GPSD] connected {self.host}:{self.port}")
+
+    def close(self):
+        if self._sock is None:
+            return
+        try: self._sel.unregister(self._sock)
+        except Exception: pass
+        try: self._sock.close()
+        except Exception: pass
+        self._sock = None
+
+    def _ensure(self):
+        if self._sock is not None:
+            return True
+        now = time.monotonic()
+        if now < self._next_try:
+            return False
+        try:
+            self.connect()
+            return True
+        except OSError as e:
+            print(f"[GPSD] connect error: {e} (retry in {self._backoff:.0f}s)")
+            self._next_try = now + self._backoff
+            self._backoff = min(self._backoff * 2, self.max_backoff)
+            return False
+
+    # --- lettura ---
+    def poll(self, timeout):
+        """
+        Attende al massimo 'timeout' secondi e ritorna la lista dei messaggi
+        (dict) completi delle classi richieste. Lista vuota se non è arrivato nulla.
+        """
+        if not self._ensure():
+            time.sleep(max(0.0, min(timeout, self._next_try - time.monotonic())))
+            return []
+        if not self._sel.select(timeout):
+            return []
+        try:
+            chunk = self._sock.recv(65536)
+        except BlockingIOError:
+            return []
+        except OSError as e:
+            print(f"[GPSD] read error: {e}")
+            chunk = b""
+        if not chunk:                       # EOF: gpsd chiuso/riavviato
+            self.close()
+            return []
+        self._buf += chunk
+        *lines, self._buf = self._buf.split(b"\n")
+        out = []
+        for line in lines:
+            if not line.startswith(self._prefixes):
+                continue
+            try:
+                out.append(json.loads(line))
+            except ValueError:
+                continue
+        return out
+
+
+if __name__ == "__main__":
+    import os
+    c = GpsdClient(os.environ.get("GPSD_HOST", "127.0.0.1"), int(os.environ.get("GPSD_PORT", "2947")))
+    t_end = time.time() + 10
+    while time.time() < t_end:
+        for m in c.poll(t_end - time.time()):
+            print(m.get("class"), m.get("mode"), m.get("lat"), m.get("lon"), len(m.get("satellites") or []))
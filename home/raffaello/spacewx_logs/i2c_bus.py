@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+# Interfaccia I2C unica per i driver Sense HAT B (SHTC3, LPS22HB, ICM20948) e i probe.
+# - stessa API "a registri" di smbus (read_byte_data, read_i2c_block_data, write_byte_data, ...)
+#   + trasferimenti raw (read_device/write_device) per i sensori a comandi come lo SHTC3
+# - sleep() passa dal bus: nel simulatore il tempo è virtuale
+# - ogni transazione, byte e sleep è contato (totale e per indirizzo) in bus.stats
+# - il lock del bus si prende con timeout (I2C_LOCK_TIMEOUT_S): una chiamata smbus che non
+#   ritorna non blocca per sempre gli altri thread, che ricevono I2CBusError; reopen_bus()
+#   abbandona il bus piantato e ne apre uno nuovo (nuovo fd smbus / handle lgpio)
+#
+# Backend (I2C_BACKEND):
+#   "smbus" (default) → smbus.SMBus per i registri, lgpio per le letture raw
+#   "sim"             → mappa registri simulata (vedi i2c_sim.py), niente hardware
+
+import abc
+import copy
+import os
+import threading
+import time
+
+I2C_BUS_NUM = int(os.environ.get("I2C_BUS", "1"))
+I2C_BACKEND = os.environ.get("I2C_BACKEND", "smbus")
+I2C_LOCK_TIMEOUT_S = float(os.environ.get("I2C_LOCK_TIMEOUT_S", "2.0"))
+
+
+class I2CBusError(OSError):
+    """Bus non utilizzabile: lock non ottenuto entro il timeout, oppure bus abbandonato."""
+
+
+class _BusLock(object):
+    """
+    RLock del bus con acquire a tempo, usato come context manager. Quando il bus viene
+    abbandonato (dead) anche chi era in coda esce con I2CBusError invece di usarlo.
+    """
+    __slots__ = ("_lock", "timeout_s", "dead")
+
+    def __init__(self, timeout_s=I2C_LOCK_TIMEOUT_S):
+        self._lock = threading.RLock()
+        self.timeout_s = timeout_s
+        self.dead = False
+
+    def __enter__(self):
+        if not self._lock.acquire(timeout=self.timeout_s):
+            raise I2CBusError(f"I2C bus lock not acquired in {self.timeout_s:g}s")
+        if self.dead:
+            self._lock.release()
+            raise I2CBusError("I2C bus abandoned (reopened)")
+        return self
+
+    def __exit__(self, *exc):
+        self._lock.release()
+
+    def held(self, timeout):
+        """True se il lock resta occupato per tutto timeout (da un altro thread)."""
+        if not self._lock.acquire(timeout=timeout):
+            return True
+        self._lock.release()
+        return False
+
+
+class I2CStats(object):
+    """
+    Contatori del bus. 'tx' = transazioni (start…stop, anche quelle fallite), 'err' =
+    transazioni fallite (NACK/errore I/O), 'rd'/'wr' = byte dati letti/scritti sul filo
+    (il registro indirizzato conta come byte scritto), sleep in secondi.
+    """
+    __slots__ = ("tx", "err", "rd", "wr", "n_sleep", "sleep_s", "by_addr")
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.tx = 0; self.err = 0; self.rd = 0; self.wr = 0
+        self.n_sleep = 0; self.sleep_s = 0.0
+        self.by_addr = {}
+
+    def _count(self, addr, rd, wr):
+        self.tx += 1; self.rd += rd; self.wr += wr
+        a = self.by_addr.get(addr)
+        if a is None:
+            a = self.by_addr[addr] = [0, 0, 0]
+        a[0] += 1; a[1] += rd; a[2] += wr
+
+    def snapshot(self):
+        return dict(tx=self.tx, err=self.err, rd=self.rd, wr=self.wr, n_sleep=self.n_sleep,
+                    sleep_s=round(self.sleep_s, 4),
+                    by_addr={f"0x{a:02X}": tuple(v) for a, v in sorted(self.by_addr.items())})
+
+    def since(self, snap):
+        """Differenza rispetto a uno snapshot() precedente (costo di un ciclo di lettura)."""
+        cur = self.snapshot()
+        out = {k: (round(cur[k] - snap[k], 4) if k == "sleep_s" else cur[k] - snap[k])
+               for k in ("tx", "err", "rd", "wr", "n_sleep", "sleep_s")}
+        out["by_addr"] = {a: tuple(x - y for x, y in zip(v, snap["by_addr"].get(a, (0, 0, 0))))
+                          for a, v in cur["by_addr"].items()}
+        return out
+
+
+class I2CBus(abc.ABC):
+    """
+    Base comune: serializza le transazioni (i sensori sono letti da più thread) e conta.
+    I backend implementano solo le primitive _rd_reg/_wr_reg/_rd_dev/_wr_dev/_sleep.
+    """
+
+    def __init__(self):
+        self.stats = I2CStats()
+        self._lock = _BusLock()
+
+    def _fail(self, addr, wr):
+        self.stats._count(addr, 0, wr)
+        self.stats.err += 1
+
+    # --- API stile smbus ---
+    def read_byte_data(self, addr, reg):
+        with self._lock:
+            try:
+                v = self._rd_reg(addr, reg, 1)[0]
+            except Exception:               # NACK/errore I/O (smbus OSError, lgpio.error)
+                self._fail(addr, 1); raise
+            self.stats._count(addr, 1, 1)
+        return v
+
+    def read_i2c_block_data(self, addr, reg, length):
+        with self._lock:
+            try:
+                buf = list(self._rd_reg(addr, reg, length))
+            except Exception:
+                self._fail(addr, 1); raise
+            self.stats._count(addr, len(buf), 1)
+        return buf
+
+    def write_byte_data(self, addr, reg, val):
+        with self._lock:
+            try:
+                self._wr_reg(addr, reg, [val & 0xFF])
+            except Exception:
+                self._fail(addr, 2); raise
+            self.stats._count(addr, 0, 2)
+
+    def write_i2c_block_data(self, addr, reg, data):
+        data = [b & 0xFF for b in data]
+        with self._lock:
+            try:
+                self._wr_reg(addr, reg, data)
+            except Exception:
+                self._fail(addr, 1 + len(data)); raise
+            self.stats._count(addr, 0, 1 + len(data))
+
+    # --- trasferimenti raw (sensori a comandi) ---
+    def read_device(self, addr, length):
+        """Ritorna bytes (eventualmente più corti di length se il device fa NACK)."""
+        with self._lock:
+            try:
+                buf = bytes(self._rd_dev(addr, length))
+            except Exception:
+                self._fail(addr, 0); raise
+            self.stats._count(addr, len(buf), 0)
+        return buf
+
+    def write_device(self, addr, data):
+        data = bytes(b & 0xFF for b in data)
+        with self._lock:
+            try:
+                self._wr_dev(addr, data)
+            except Exception:
+                self._fail(addr, len(data)); raise
+            self.stats._count(addr, 0, len(data))
+
+    def sleep(self, s):
+        self.stats.n_sleep += 1
+        self.stats.sleep_s += s
+        self._sleep(s)
+
+    def close(self):
+        pass
+
+    # --- bus piantato ---
+    def wedged(self, timeout=I2C_LOCK_TIMEOUT_S):
+        """True se una transazione tiene il lock da più di timeout (chiamata che non ritorna)."""
+        return self._lock.held(timeout)
+
+    def abandon(self):
+        """Da qui in poi ogni transazione su questo bus fallisce (anche quelle già in coda)."""
+        self._lock.dead = True
+
+    def reopen(self):
+        """
+        Nuova istanza sullo stesso hardware, con lock nuovo e gli stessi contatori;
+        questa viene abbandonata. Di default: stessi device (simulatore, bus di test).
+        """
+        self.abandon()
+        new = copy.copy(self)
+        new._lock = _BusLock(self._lock.timeout_s)
+        return new
+
+    # --- primitive dei backend ---
+    @abc.abstractmethod
+    def _rd_reg(self, addr, reg, length): ...
+
+    @abc.abstractmethod
+    def _wr_reg(self, addr, reg, data): ...
+
+    @abc.abstractmethod
+    def _rd_dev(self, addr, length): ...
+
+    @abc.abstractmethod
+    def _wr_dev(self, addr, data): ...
+
+    def _sleep(self, s):
+        time.sleep(s)
+
+
+class SMBusBackend(I2CBus):
+    """Hardware reale: smbus per gli accessi a registro, lgpio (handle per indirizzo) per i raw."""
+
+    def __init__(self, bus=I2C_BUS_NUM):
+        super().__init__()
+        import smbus
+        self.bus_num = bus
+        self._smbus = smbus.SMBus(bus)
+        self._lgpio = None
+        self._handles = {}
+
+    def _rd_reg(self, addr, reg, length):
+        if length == 1:
+            return [self._smbus.read_byte_data(addr, reg)]
+        return self._smbus.read_i2c_block_data(addr, reg, length)
+
+    def _wr_reg(self, addr, reg, data):
+        if len(data) == 1:
+            self._smbus.write_byte_data(addr, reg, data[0])
+        else:
+            self._smbus.write_i2c_block_data(addr, reg, data)
+
+    def _handle(self, addr):
+        h = self._handles.get(addr)
+        if h is None:
+            if self._lgpio is None:
+                import lgpio
+                self._lgpio = lgpio
+            h = self._handles[addr] = self._lgpio.i2c_open(self.bus_num, addr, 0)
+        return h
+
+    def _rd_dev(self, addr, length):
+        h = self._handle(addr)
+        count, buf = self._lgpio.i2c_read_device(h, length)
+        return bytes(buf[:max(0, count)])
+
+    def _wr_dev(self, addr, data):
+        h = self._handle(addr)
+        self._lgpio.i2c_write_device(h, data)
+
+    def reopen(self):
+        # fd smbus e handle lgpio nuovi; il close dei vecchi in un thread a parte, perché
+        # il thread piantato è ancora dentro una ioctl su quel fd
+        self.abandon()
+        new = SMBusBackend(self.bus_num)
+        new.stats = self.stats
+        threading.Thread(target=self.close, name="i2c-close", daemon=True).start()
+        return new
+
+    def close(self):
+        for h in self._handles.values():
+            try: self._lgpio.i2c_close(h)
+            except Exception: pass
+        self._handles = {}
+        try: self._smbus.close()
+        except Exception: pass
+
+
+_BUS = None
+_BUS_LOCK = threading.Lock()
+
+def get_bus(backend=None):
+    """Bus condiviso del processo (creato alla prima chiamata secondo I2C_BACKEND)."""
+    global _BUS
+    with _BUS_LOCK:
+        if _BUS is None:
+            backend = backend or I2C_BACKEND
+            if backend == "sim":
+                from i2c_sim import SimBus
+                _BUS = SimBus.sense_hat_b(realtime=True)
+            elif backend == "smbus":
+                _BUS = SMBusBackend(I2C_BUS_NUM)
+            else:
+                raise ValueError(f"unknown I2C_BACKEND {backend!r}")
+        return _BUS
+
+def set_bus(bus):
+    """Sostituisce il bus condiviso (es. SimBus nei benchmark); ritorna il precedente."""
+    global _BUS
+    with _BUS_LOCK:
+        prev, _BUS = _BUS, bus
+    return prev
+
+def reopen_bus(stuck):
+    """
+    Abbandona il bus condiviso stuck (piantato: vedi I2CBus.wedged) e ne apre uno nuovo dello
+    stesso backend. Ritorna il bus corrente: se un altro thread l'ha già riaperto, quello.
+    I driver creati sul bus vecchio vanno ricreati (le loro transazioni falliscono).
+    """
+    global _BUS
+    with _BUS_LOCK:
+        if _BUS is stuck:
+            _BUS = stuck.reopen()
+            print(f"[I2C] bus stuck → reopened ({type(_BUS).__name__})")
+        return _BUS
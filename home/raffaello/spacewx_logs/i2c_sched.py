@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# Scheduler delle transazioni sul bus condiviso: più sensori in pipeline in un solo thread.
+# Ogni lettura è un "job" (generatore): fa le sue transazioni e con `yield s` dichiara
+# quanto deve aspettare il device (conversione, wake-up) prima del passo successivo.
+# Il valore del job è quello del `return`.
+#
+#   def job():
+#       bus.write_device(addr, START)    # avvia la conversione
+#       yield 0.013                      # il bus resta libero per gli altri job
+#       return decode(bus.read_device(addr, 6))
+#
+# run_jobs() avvia tutti i job, poi esegue sempre il passo del job con la scadenza più
+# vicina e dorme (bus.sleep, virtuale nel simulatore) solo quando nessuno è pronto:
+# una snapshot dura circa quanto la conversione più lunga invece della somma.
+# A pari scadenza i job restano nell'ordine dato: chi legge banchi registri dello stesso
+# device (ICM20948) va messo di seguito per non ripetere i cambi di banco.
+
+import heapq
+import time
+
+
+def as_job(fn, *args):
+    """Lettura senza attese (FIFO, burst) come job: eseguita nei buchi degli altri."""
+    return fn(*args)
+    yield                                   # noqa: rende la funzione un generatore
+
+
+def run_job(job, bus):
+    """Esegue un solo job in serie (compatibilità con le letture bloccanti dei driver)."""
+    try:
+        while True:
+            bus.sleep(next(job))
+    except StopIteration as e:
+        return e.value
+
+
+def run_jobs(jobs, bus, clock=None):
+    """
+    jobs: {nome: generatore} (o lista di coppie, l'ordine conta a pari scadenza).
+    Ritorna {nome: valore}; un job che solleva eccezione vale None, gli altri proseguono.
+    """
+    clock = clock or ((lambda: bus.now) if hasattr(bus, "now") else time.monotonic)   # SimBus: tempo virtuale
+    items = list(jobs.items()) if hasattr(jobs, "items") else list(jobs)
+    out = {}
+    heap = []
+    t0 = clock()
+    for seq, (name, job) in enumerate(items):
+        heap.append((t0, seq, name, job))
+    heapq.heapify(heap)
+    while heap:
+        due, seq, name, job = heapq.heappop(heap)
+        wait = due - clock()
+        if wait > 0:
+            bus.sleep(wait)
+        try:
+            d = next(job)
+        except StopIteration as e:
+            out[name] = e.value
+            continue
+        except Exception:
+            out[name] = None
+            continue
+        heapq.heappush(heap, (clock() + max(0.0, d or 0.0), seq, name, job))
+    return out
@@ -0,0 +1,497 @@
+#!/usr/bin/env python3
+# Backend I2C simulato: mappa registri dei sensori Sense HAT B, tempo virtuale.
+# Permette di far girare driver/probe senza HAT e di misurare il costo di un ciclo
+# di lettura (transazioni, byte, sleep) in modo deterministico:
+#
+#   I2C_BACKEND=sim python3 wifi_gps_kp_logger.py      # logger senza hardware
+#   python3 i2c_sim.py                                  # costo per ciclo + controllo budget
+#
+# Modelli (solo quanto usato dai driver del repo):
+#   SHTC3     0x70  comandi a 16 bit, misura T+RH con CRC, sleep/wake (NACK se dorme)
+#   LPS22HB   0x5C  reset/one-shot, ODR continuo, FIFO (Dynamic-)Stream da 32 campioni
+#   ICM20948  0x68  4 banchi registri, I2C master (SLV0 lettura / SLV1 scrittura) verso AK09916
+#   TCS34725  0x29  integrazione ATIME/WTIME, guadagno, soglie + persistenza, AINT/clear
+#   SGM58031  0x48  registri 16 bit, mux/PGA, conversione continua, calo periodico su AIN0
+
+import math
+import time
+from collections import deque
+
+from i2c_bus import I2CBus
+
+I2C_HZ = 100_000            # clock del bus simulato: tempo virtuale per transazione
+
+
+def _nack(addr):
+    return OSError(121, f"Remote I/O error (sim addr 0x{addr:02X})")
+
+
+class SimDevice(object):
+    """Device a registri (auto-incremento) con hook per i registri "attivi"."""
+
+    def __init__(self, addr):
+        self.addr = addr
+        self.bus = None
+        self.regs = bytearray(256)
+
+    def now(self):
+        return self.bus.now if self.bus else 0.0
+
+    def read(self, reg, length):
+        return [self.read_reg((reg + i) & 0xFF) for i in range(length)]
+
+    def write(self, reg, data):
+        for i, b in enumerate(data):
+            self.write_reg((reg + i) & 0xFF, b)
+
+    def read_reg(self, reg):
+        return self.regs[reg]
+
+    def write_reg(self, reg, val):
+        self.regs[reg] = val
+
+    def read_raw(self, length):
+        raise _nack(self.addr)
+
+    def write_raw(self, data):
+        raise _nack(self.addr)
+
+
+# ---------------------------------------------------------------- SHTC3 ------
+
+class SimSHTC3(SimDevice):
+    def __init__(self, addr=0x70, t_c=21.0, rh=45.0):
+        super().__init__(addr)
+        self.t_c, self.rh = t_c, rh
+        self.awake = False
+        self._out = b""
+
+    def write_raw(self, data):
+        if len(data) != 2:
+            raise _nack(self.addr)
+        cmd = (data[0] << 8) | data[1]
+        if cmd == 0x3517:                    # wake-up: l'unico comando accettato da addormentato
+            self.awake = True
+            return
+        if not self.awake:
+            raise _nack(self.addr)
+        if cmd == 0xB098:                    # sleep
+            self.awake = False
+        elif cmd == 0x805D:                  # soft reset
+            self._out = b""
+        elif cmd in (0x7866, 0x58E0):        # misura normal mode, T first / RH first
+            from SHTC3 import crc8
+            t = int((self.t_c + 45.0) * 65536 / 175) & 0xFFFF
+            h = int(self.rh * 65536 / 100) & 0xFFFF
+            tb, hb = bytes([t >> 8, t & 0xFF]), bytes([h >> 8, h & 0xFF])
+            words = (tb, hb) if cmd == 0x7866 else (hb, tb)
+            self._out = b"".join(w + bytes([crc8(w)]) for w in words)
+
+    def read_raw(self, length):
+        if not self.awake or not self._out:
+            raise _nack(self.addr)
+        out, self._out = self._out[:length], b""
+        return out
+
+
+# ---------------------------------------------------------------- LPS22HB ----
+
+class SimLPS22HB(SimDevice):
+    _ODR = {1: 1.0, 2: 10.0, 3: 25.0, 4: 50.0, 5: 75.0}
+
+    def __init__(self, addr=0x5C, p_hpa=1013.25, t_c=22.0):
+        super().__init__(addr)
+        self.p_hpa, self.t_c = p_hpa, t_c
+        self.fifo = deque(maxlen=32)
+        self._t_last = 0.0
+        self._reset()
+
+    def _reset(self):
+        self.regs[:] = bytes(256)
+        self.regs[0x0F] = 0xB1
+        self.regs[0x11] = 0x10              # IF_ADD_INC di default
+        self.fifo.clear()
+
+    def _sample(self, t):
+        p = self.p_hpa + 0.05 * math.sin(t / 30.0)
+        raw_p = int(p * 4096) & 0xFFFFFF
+        raw_t = int(round(self.t_c * 100)) & 0xFFFF
+        return bytes([raw_p & 0xFF, (raw_p >> 8) & 0xFF, raw_p >> 16, raw_t & 0xFF, raw_t >> 8])
+
+    def _latch(self, s):
+        self.regs[0x28:0x2D] = s
+        self.regs[0x27] |= 0x03
+
+    def _advance(self):
+        odr = self._ODR.get((self.regs[0x10] >> 4) & 0x07)
+        now = self.now()
+        if not odr:
+            self._t_last = now
+            return
+        period = 1.0 / odr
+        while self._t_last + period <= now:
+            self._t_last += period
+            s = self._sample(self._t_last)
+            self._latch(s)
+            if self.regs[0x11] & 0x40 and self.regs[0x14] & 0xE0:
+                self.fifo.append(s)
+
+    def read(self, reg, length):
+        self._advance()
+        fifo_on = self.regs[0x11] & 0x40 and self.regs[0x14] & 0xE0
+        if reg == 0x28 and fifo_on:
+            out = []
+            while len(out) < length:        # con FIFO attiva: 0x28..0x2C poi ritorna a 0x28
+                s = self.fifo.popleft() if self.fifo else bytes(self.regs[0x28:0x2D])
+                out += s[:length - len(out)]
+            return out
+        return super().read(reg, length)
+
+    def read_reg(self, reg):
+        if reg == 0x26:
+            return min(len(self.fifo), 32) & 0x3F
+        v = self.regs[reg]
+        if reg == 0x2C:                     # lettura di TEMP_OUT_H: dato consumato
+            self.regs[0x27] &= ~0x03
+        return v
+
+    def write_reg(self, reg, val):
+        if reg == 0x11:
+            if val & 0x04:                  # SWRESET: si auto-azzera
+                self._reset()
+                return
+            if val & 0x01:                  # ONE_SHOT
+                self._latch(self._sample(self.now()))
+                val &= ~0x01
+        if reg == 0x14 and not val & 0xE0:  # bypass: svuota la FIFO
+            self.fifo.clear()
+        if reg == 0x10:
+            self._advance()
+        self.regs[reg] = val
+
+
+# ---------------------------------------------------------------- ICM20948 ---
+
+class SimAK09916(object):
+    """Magnetometro dietro all'I2C master dell'ICM (non visibile sul bus principale)."""
+    _ODR = {0x02: 10.0, 0x04: 20.0, 0x06: 50.0, 0x08: 100.0}
+
+    def __init__(self, field=(150, -40, 300)):
+        self.field = field
+        self.regs = bytearray(256)
+        self.regs[0x00], self.regs[0x01] = 0x48, 0x09
+
+    def update(self, t):
+        if self.regs[0x31] not in self._ODR:
+            return
+        k = 1.0 + 0.01 * math.sin(t / 60.0)
+        x, y, z = (int(round(c * k)) & 0xFFFF for c in self.field)
+        self.regs[0x11:0x17] = bytes([x & 0xFF, x >> 8, y & 0xFF, y >> 8, z & 0xFF, z >> 8])
+        self.regs[0x10] |= 0x01             # ST1.DRDY
+
+    def read(self, reg, length):
+        out = bytes(self.regs[reg:reg + length])
+        if reg <= 0x18 < reg + length:      # lettura di ST2: sblocca il campione successivo
+            self.regs[0x10] &= ~0x01
+        return out
+
+
+class SimICM20948(SimDevice):
+    def __init__(self, addr=0x68, mag=None):
+        super().__init__(addr)
+        self.banks = [bytearray(256) for _ in range(4)]
+        self.bank = 0
+        self.mag = mag or SimAK09916()
+        self.banks[0][0x00] = 0xEA
+        self.banks[0][0x31] = 0x40          # accel Z ≈ +1 g (FS 2g)
+
+    def read_reg(self, reg):
+        if reg == 0x7F:
+            return self.bank << 4
+        return self.banks[self.bank][reg]
+
+    def read(self, reg, length):
+        if self.bank == 0 and reg >= 0x3B and self.banks[0][0x03] & 0x20:
+            self._master_cycle(write=False)  # master attivo: EXT_SLV_SENS_DATA sempre aggiornati
+        return super().read(reg, length)
+
+    def write_reg(self, reg, val):
+        if reg == 0x7F:
+            self.bank = (val >> 4) & 0x03
+            return
+        if self.bank == 0 and reg == 0x06 and val & 0x80:
+            val &= ~0x80                    # DEVICE_RESET si auto-azzera
+        self.banks[self.bank][reg] = val
+        if self.bank == 0 and reg == 0x03 and val & 0x20:
+            self._master_cycle(write=True)
+
+    def _master_cycle(self, write):
+        b3 = self.banks[3]
+        if write and b3[0x09] & 0x80 and not b3[0x07] & 0x80 and (b3[0x07] & 0x7F) == 0x0C:
+            self.mag.regs[b3[0x08]] = b3[0x0A]          # SLV1: scrittura di un registro AK
+        self.mag.update(self.now())
+        if b3[0x05] & 0x80 and b3[0x03] & 0x80 and (b3[0x03] & 0x7F) == 0x0C:
+            n = b3[0x05] & 0x0F
+            self.banks[0][0x3B:0x3B + n] = self.mag.read(b3[0x04], n)
+
+
+# ---------------------------------------------------------------- TCS34725 ---
+
+class SimTCS34725(SimDevice):
+    """
+    Sensore di luce: cicli ATIME (+ WTIME se WEN), dati latched a fine integrazione,
+    interrupt del canale clear con soglie e persistenza, clear INT via special function.
+    Il byte di comando (bit 7) porta indirizzo (4:0) e tipo (6:5, 01 = auto-increment).
+    """
+    _PERS = {0: 1, 1: 1, 2: 2, 3: 3}          # PERS ≥ 4: 5·(PERS−3) cicli
+    _GAIN = (1, 4, 16, 60)
+
+    def __init__(self, addr=0x29, lux=300.0):
+        super().__init__(addr)
+        self.lux = lux
+        self.regs[0x12] = 0x44
+        self.regs[0x01] = 0xFF
+        self.regs[0x03] = 0xFF
+        self._t_last = 0.0
+        self._out = 0                         # cicli consecutivi fuori soglia
+
+    def lux_at(self, t):
+        # cielo variabile: lenta oscillazione + "nuvola" periodica
+        k = 1.0 + 0.5 * math.sin(t / 120.0) - (0.6 if int(t / 45.0) % 4 == 3 else 0.0)
+        return max(0.0, self.lux * k)
+
+    def _cycle_s(self):
+        c = (256 - self.regs[0x01]) * 0.0024
+        if self.regs[0x00] & 0x08:            # WEN
+            c += (256 - self.regs[0x03]) * 0.0024 * (12 if self.regs[0x0D] & 0x02 else 1)
+        return c
+
+    def _integrate(self, t):
+        atime = 256 - self.regs[0x01]
+        cpl = atime * 2.4 * self._GAIN[self.regs[0x0F] & 0x03] / 310.0
+        full = min(65535, atime * 1024)
+        c = self.lux_at(t) * cpl / 0.2798     # inverso di Get_Lux con R/G/B = 0.30/0.35/0.25 C
+        r, g, b, c = (min(full, int(v)) for v in (0.30 * c, 0.35 * c, 0.25 * c, c))
+        for i, v in enumerate((c, r, g, b)):
+            self.regs[0x14 + 2 * i] = v & 0xFF
+            self.regs[0x15 + 2 * i] = v >> 8
+        self.regs[0x13] |= 0x01               # AVALID
+        lo = self.regs[0x04] | (self.regs[0x05] << 8)
+        hi = self.regs[0x06] | (self.regs[0x07] << 8)
+        self._out = self._out + 1 if (c < lo or c > hi) else 0
+        pers = self.regs[0x0C] & 0x0F
+        if self._out >= self._PERS.get(pers, 5 * (pers - 3)) and self.regs[0x00] & 0x10:
+            self.regs[0x13] |= 0x10           # AINT (resta finché non viene cancellato)
+
+    def _advance(self):
+        now = self.now()
+        if (self.regs[0x00] & 0x03) != 0x03:  # PON+AEN
+            self._t_last = now
+            return
+        period = self._cycle_s()
+        while self._t_last + period <= now:
+            self._t_last += period
+            self._integrate(self._t_last)
+
+    def read(self, reg, length):
+        self._advance()
+        a = reg & 0x1F
+        if (reg >> 5) & 0x03 == 0x01:         # auto-increment
+            return [self.regs[(a + i) & 0x1F] for i in range(length)]
+        return [self.regs[a]] * length
+
+    def write(self, reg, data):
+        self._advance()
+        a = reg & 0x1F
+        step = 1 if (reg >> 5) & 0x03 == 0x01 else 0
+        for i, b in enumerate(data):
+            self.regs[(a + i * step) & 0x1F] = b
+        if a == 0x00 and (self.regs[0x00] & 0x03) != 0x03:
+            self.regs[0x13] &= ~0x01          # spento: nessun dato valido
+
+    def write_raw(self, data):
+        if len(data) == 1 and data[0] == 0xE6:  # special function: clear RGBC interrupt
+            self._advance()
+            self.regs[0x13] &= ~0x10
+            self._out = 0
+            return
+        raise _nack(self.addr)
+
+
+# ---------------------------------------------------------------- SGM58031 ---
+
+class SimSGM58031(SimDevice):
+    """
+    ADC a registri da 16 bit (big-endian) selezionati dal puntatore. In continua il
+    registro di conversione segue l'ingresso del mux; AIN0 simula il rail 5 V dietro un
+    partitore 1:2 con un breve calo (brownout) periodico.
+    """
+    _FS = {0: 6.144, 1: 4.096, 2: 2.048, 3: 1.024, 4: 0.512, 5: 0.256, 6: 0.256, 7: 0.256}
+
+    def __init__(self, addr=0x48, volts=(2.55, 1.65, 0.0, 0.0), dip_every_s=90.0, dip_s=0.15):
+        super().__init__(addr)
+        self.volts = list(volts)
+        self.dip_every_s, self.dip_s = dip_every_s, dip_s
+        self.cfg = 0x8583                     # default: single-shot, AIN0-AIN1, 2.048 V, 128 SPS
+        self.thr = [0x8000, 0x7FFF]
+
+    def volt_at(self, ch, t):
+        v = self.volts[ch]
+        if ch == 0 and self.dip_every_s and (t % self.dip_every_s) < self.dip_s:
+            v *= 0.9                          # 5.1 V → 4.59 V
+        return v
+
+    def _convert(self):
+        mux = (self.cfg >> 12) & 0x07
+        if mux < 4:                           # differenziali: non usati dai driver del repo
+            return 0
+        fs = self._FS[(self.cfg >> 9) & 0x07]
+        raw = int(round(self.volt_at(mux - 4, self.now()) / fs * 32768))
+        return max(-32768, min(32767, raw)) & 0xFFFF
+
+    def read(self, reg, length):
+        p = reg & 0x03
+        if p == 0x00:
+            w = self._convert()
+        elif p == 0x01:
+            w = self.cfg | 0x8000             # OS=1: nessuna conversione in corso
+        else:
+            w = self.thr[p - 2]
+        return ([w >> 8, w & 0xFF] * length)[:length]
+
+    def write(self, reg, data):
+        p = reg & 0x03
+        if len(data) < 2:
+            return
+        w = (data[0] << 8) | data[1]
+        if p == 0x01:
+            self.cfg = w & 0x7FFF
+        elif p >= 0x02:
+            self.thr[p - 2] = w
+
+
+# ---------------------------------------------------------------- bus --------
+
+class SimBus(I2CBus):
+    """
+    Bus simulato: device per indirizzo, NACK sugli indirizzi vuoti.
+    Tempo virtuale (sleep istantanee, benchmark deterministici) oppure, con
+    realtime=True, agganciato all'orologio reale (logger senza HAT).
+    """
+
+    def __init__(self, devices=(), bus_hz=I2C_HZ, realtime=False):
+        super().__init__()
+        self.realtime = realtime
+        self._t0 = time.monotonic()
+        self._virt = 0.0
+        self.bus_hz = bus_hz
+        self.devices = {}
+        for d in devices:
+            self.attach(d)
+
+    @classmethod
+    def sense_hat_b(cls, realtime=False):
+        return cls([SimSHTC3(), SimLPS22HB(), SimICM20948(), SimTCS34725(),
+                    SimSGM58031()], realtime=realtime)
+
+    @property
+    def now(self):
+        return self._virt + (time.monotonic() - self._t0 if self.realtime else 0.0)
+
+    def reopen(self):
+        new = super().reopen()              # stessi device (stato dei registri), agganciati al nuovo
+        new.devices = {}
+        for d in self.devices.values():
+            new.attach(d)
+        return new
+
+    def attach(self, dev):
+        dev.bus = self
+        self.devices[dev.addr] = dev
+        return dev
+
+    def _dev(self, addr):
+        d = self.devices.get(addr)
+        if d is None:
+            raise _nack(addr)
+        return d
+
+    def _tick(self, nbytes):
+        if not self.realtime:
+            self._virt += (nbytes + 2) * 9 / self.bus_hz   # indirizzo + dati, 9 clock per byte
+
+    def _rd_reg(self, addr, reg, length):
+        self._tick(length + 1)
+        return self._dev(addr).read(reg, length)
+
+    def _wr_reg(self, addr, reg, data):
+        self._tick(len(data) + 1)
+        self._dev(addr).write(reg, data)
+
+    def _rd_dev(self, addr, length):
+        self._tick(length)
+        return self._dev(addr).read_raw(length)
+
+    def _wr_dev(self, addr, data):
+        self._tick(len(data))
+        self._dev(addr).write_raw(data)
+
+    def _sleep(self, s):
+        if self.realtime:
+            time.sleep(s)
+        else:
+            self._virt += s
+
+
+# Costo massimo di UN ciclo di lettura a regime (SHTC3 + FIFO LPS22HB a 1 Hz + mag),
+# pari al valore misurato: se una modifica ai driver lo supera, il benchmark esce con errore.
+#   SHTC3 4 tx (wake, misura, lettura 6 B, sleep) · LPS22HB 2 tx · ICM20948 1 tx
+# Snapshot in pipeline (i2c_sched): LPS22HB e ICM girano durante wake+conversione SHTC3,
+# resta una sola attesa e il ciclo dura ~ la conversione SHTC3 (in serie: 2 attese, 17.9 ms).
+CYCLE_BUDGET = dict(tx=7, err=0, rd=20, wr=9, n_sleep=1, sleep_s=0.013, wall_s=0.017)
+
+
+def bench(cycles=10, interval_s=1.0, serial=False):
+    import i2c_bus
+    bus = SimBus.sense_hat_b()
+    prev = i2c_bus.set_bus(bus)
+    try:
+        import sensehat_b_reader as shb
+        for name, init in (("shtc3", shb._shtc3_init), ("lps22hb", shb._lps_init), ("icm", shb._icm_init)):
+            shb.reset_sensor(name)          # driver legati a questo bus (anche a bench ripetuti)
+            if not shb._ready(name, init):
+                raise RuntimeError(f"sim init failed: {name}")
+        shb.read_lps22hb_samples()          # avvio modalità continua (non a regime)
+        init = bus.stats.snapshot()
+        costs = []
+        for i in range(cycles):
+            bus.sleep(interval_s)
+            snap, t0 = bus.stats.snapshot(), bus.now
+            if serial:                          # riferimento: un sensore dopo l'altro
+                r = dict(shtc3=shb.read_shtc3(), lps22hb=shb.read_lps22hb_samples(),
+                         icm=shb.read_icm20948_mag())
+            else:
+                r = shb.read_snapshot()
+            (t, rh), lps, mag = r["shtc3"], r["lps22hb"], r["icm"]
+            if t is None or not lps or mag[0] is None:
+                raise RuntimeError(f"sim read failed: t={t} lps={lps} mag={mag}")
+            c = bus.stats.since(snap)
+            c["wall_s"] = round(bus.now - t0, 4)
+            costs.append(c)
+        return init, costs
+    finally:
+        i2c_bus.set_bus(prev)
+
+
+if __name__ == "__main__":
+    import sys
+    init, costs = bench()
+    print("init:", {k: v for k, v in init.items() if k != "by_addr"})
+    print("serial wall_s:", max(c["wall_s"] for c in bench(serial=True)[1]))
+    worst = {k: max(c[k] for c in costs) for k in CYCLE_BUDGET}
+    print("cycle:", costs[-1])
+    over = {k: (worst[k], CYCLE_BUDGET[k]) for k in CYCLE_BUDGET if worst[k] > CYCLE_BUDGET[k]}
+    if over:
+        print("OVER BUDGET:", over)
+        sys.exit(1)
+    print("budget ok:", worst)
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# Luce solare (TCS34725 sulla Sense HAT B): lux e temperatura di colore, covariata giorno/notte/nubi.
+# Il sensore integra da solo (ATIME + WTIME); il thread NON campiona a rate fisso:
+# - dopo ogni lettura programma le soglie di interrupt del canale clear a ±LIGHT_BAND_PCT
+#   del valore corrente, con persistenza (LIGHT_PERS cicli fuori finestra) contro i transitori
+# - aspetta l'interrupt: linea INT su GPIO (gpiozero, zero traffico I2C) se disponibile,
+#   altrimenti un byte di STATUS ogni LIGHT_POLL_S (bit AINT)
+# - all'interrupt: 1 block read RGBC + 1 block write soglie + clear INT (3 transazioni)
+# - guadagno automatico 1x/4x/16x/60x (sole pieno satura a 60x, crepuscolo sparisce a 1x)
+# - senza interrupt per LIGHT_REFRESH_S una lettura comunque (CCT può cambiare a lux costante)
+# Tra due letture il valore è costante per costruzione: row() ne fa la media pesata sul tempo.
+
+import os
+import threading
+import time
+
+from TCS34725 import TCS34725
+from i2c_bus import get_bus, I2C_BACKEND
+
+LIGHT_ENABLE = os.environ.get("LIGHT_ENABLE", "1") != "0"
+LIGHT_BAND_PCT = float(os.environ.get("LIGHT_BAND_PCT", "15"))     # finestra soglie attorno al clear
+LIGHT_PERS = int(os.environ.get("LIGHT_PERS", "4"))                # registro PERS: 4 = 5 cicli
+LIGHT_POLL_S = float(os.environ.get("LIGHT_POLL_S", "2"))          # polling STATUS senza linea INT
+LIGHT_REFRESH_S = float(os.environ.get("LIGHT_REFRESH_S", "300"))  # lettura forzata senza interrupt
+LIGHT_INT_GPIO = os.environ.get("LIGHT_INT_GPIO", "26")            # "" = niente GPIO, solo polling
+
+# Campi aggiunti al CSV (in quest'ordine, vedi LightCollector.row())
+LIGHT_FIELDS = ["light_lux", "light_lux_min", "light_lux_max", "light_cct_k", "light_reads"]
+
+_GAINS = (TCS34725.TCS34725_GAIN_1X, TCS34725.TCS34725_GAIN_4X,
+          TCS34725.TCS34725_GAIN_16X, TCS34725.TCS34725_GAIN_60X)
+
+
+def _int_line(pin):
+    """Linea INT del TCS34725 (open-drain, attiva bassa) o None se non usabile."""
+    if not pin or I2C_BACKEND == "sim":
+        return None
+    try:
+        from gpiozero import DigitalInputDevice
+        return DigitalInputDevice(int(pin), pull_up=True)    # attiva = livello basso
+    except Exception:
+        return None
+
+
+class LightCollector(threading.Thread):
+
+    def __init__(self, band_pct=LIGHT_BAND_PCT, pers=LIGHT_PERS, poll_s=LIGHT_POLL_S,
+                 refresh_s=LIGHT_REFRESH_S, int_gpio=LIGHT_INT_GPIO):
+        super().__init__(name="light", daemon=True)
+        self.band = band_pct / 100.0
+        self.pers = pers
+        self.poll_s = poll_s
+        self.refresh_s = refresh_s
+        self.int_gpio = int_gpio
+        self.dev = None
+        self.line = None
+        self._gain_i = len(_GAINS) - 1     # si parte a 60x (notte/interni), scende se satura
+        self._force = True
+        self._next_refresh = 0.0
+        self._lock = threading.Lock()
+        self._halt = threading.Event()
+        # stato dell'intervallo corrente (sample-and-hold)
+        self._held = None                  # (lux, cct) dell'ultima lettura
+        self._held_t = None
+        self._acc = 0.0
+        self._acc_s = 0.0
+        self._min = self._max = None
+        self._reads = 0
+
+    # --- sensore ---
+    def _init(self):
+        dev = TCS34725(bus=get_bus())
+        dev.Set_Wait_Time(TCS34725.TCS34725_WTIME_204MS)       # ciclo ≈ 154 + 204 ms
+        if dev.TCS34725_init(_GAINS[self._gain_i], TCS34725.TCS34725_INTEGRATIONTIME_154MS, wait=True):
+            raise RuntimeError("TCS34725 not found")
+        dev.Set_Interrupt_Persistence_Reg(self.pers)
+        dev.Set_Interrupt_Threshold(0, 0xFFFF)                  # nessun interrupt fino alla prima lettura
+        self.dev = dev
+        if self.line is None:
+            self.line = _int_line(self.int_gpio)
+        self._force = True
+        print(f"[LIGHT] TCS34725 ready (INT {'GPIO' + self.int_gpio if self.line else 'polling'})")
+
+    def _wait_event(self):
+        """True se c'è da leggere: interrupt, refresh periodico o lettura forzata."""
+        if self._force or time.monotonic() >= self._next_refresh:
+            return True
+        if self.line is not None:
+            return bool(self.line.wait_for_active(timeout=1.0))     # 1 s: controlla _halt
+        if self._halt.wait(self.poll_s):
+            return False
+        return bool(self.dev.Read_Status() & TCS34725.TCS34725_STATUS_AINT)
+
+    def _measure(self):
+        dev = self.dev
+        if self._force and not dev.Read_Status() & TCS34725.TCS34725_STATUS_AVALID:
+            self._halt.wait(0.1)            # prima integrazione non ancora conclusa
+            return
+        dev.Get_RGBData()
+        c, full = dev.C, dev.Max_Count()
+        # guadagno automatico: fuori scala o quasi → giù; troppo pochi count → su
+        if c >= 0.9 * full and self._gain_i > 0:
+            self._set_gain(self._gain_i - 1)
+            return
+        if self._gain_i < len(_GAINS) - 1:
+            up = dev.GAIN_X[_GAINS[self._gain_i + 1]] / dev.GAIN_X[_GAINS[self._gain_i]]
+            if c * up < 0.5 * full:
+                self._set_gain(self._gain_i + 1)
+                return
+        lux = dev.Get_Lux()
+        cct = dev.Get_ColorTemp()
+        band = max(self.band * c, 4)        # al buio pochi count: finestra minima assoluta
+        dev.Set_Interrupt_Threshold(c + band, c - band)
+        dev.Clear_Interrupt_Flag()
+        self._force = False
+        self._next_refresh = time.monotonic() + self.refresh_s
+        self._push(lux, cct, time.monotonic())
+
+    def _set_gain(self, i):
+        # la lettura corrente non vale (satura o grezza): si rilegge dopo un ciclo col nuovo guadagno
+        self._gain_i = i
+        self.dev.Set_Gain(_GAINS[i])
+        self.dev.Set_Interrupt_Threshold(0, 0xFFFF)
+        self.dev.Clear_Interrupt_Flag()
+        self._force = True
+        self._halt.wait(0.8)                # ≥ 2 cicli: il primo può essere a cavallo
+
+    def _push(self, lux, cct, now):
+        with self._lock:
+            if self._held is not None:
+                dt = now - self._held_t
+                self._acc += self._held[0] * dt
+                self._acc_s += dt
+            self._held, self._held_t = (lux, cct), now
+            self._min = lux if self._min is None else min(self._min, lux)
+            self._max = lux if self._max is None else max(self._max, lux)
+            self._reads += 1
+
+    def run(self):
+        while not self._halt.is_set():
+            try:
+                if self.dev is None:
+                    self._init()
+                if self._wait_event():
+                    self._measure()
+            except Exception as e:
+                print(f"[LIGHT] error: {e} → reinit in 60 s")
+                self.dev = None
+                self._halt.wait(60)
+
+    # --- API ---
+    def row(self):
+        """Valori LIGHT_FIELDS sull'intervallo dall'ultima chiamata (media pesata sul tempo), poi reset."""
+        now = time.monotonic()
+        with self._lock:
+            if self._held is None:
+                return [None] * (len(LIGHT_FIELDS) - 1) + [self._reads]
+            lux, cct = self._held
+            acc = self._acc + lux * (now - self._held_t)
+            acc_s = self._acc_s + (now - self._held_t)
+            mean = acc / acc_s if acc_s > 0 else lux
+            out = [round(mean, 1), round(self._min, 1), round(self._max, 1),
+                   round(cct) if cct is not None else None, self._reads]
+            # il valore tenuto apre l'intervallo successivo
+            self._held_t, self._acc, self._acc_s = now, 0.0, 0.0
+            self._min = self._max = lux
+            self._reads = 0
+        return out
+
+    def stop(self):
+        self._halt.set()
+        if self.line is not None:
+            try: self.line.close()
+            except Exception: pass
+
+
+if __name__ == "__main__":
+    lc = LightCollector()
+    lc.start()
+    for _ in range(10):
+        time.sleep(6)
+        print(dict(zip(LIGHT_FIELDS, lc.row())))
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+# Pipeline magnetometro ad alta frequenza (AK09916 via ICM20948, 10–100 Hz).
+# - thread dedicato che legge il mag in burst (SLV0 auto-read) a MAG_RATE_HZ
+# - calibrazione hard/soft-iron salvata su file: B[µT] = M · (raw − offset) · ut_per_count
+# - decimazione vettoriale a blocchi (NumPy): blocco da 1 s, FIR Hann su 2 blocchi
+#   (anti-aliasing per l'uscita a 1 Hz), campioni mancanti pesati a zero
+# - serie calibrata a 1 s su stream binario giornaliero (mag1s_YYYYMMDD.bin, come SKY)
+# - serie a 1 min per il CSV (row()): media, std, |B| min/max, dB/dt max/rms dalla serie 1 s
+# - budget CPU fisso: se il thread supera MAG_CPU_PCT la frequenza scende al gradino inferiore
+#
+# Senza NumPy (opzionale) la decimazione ripiega su una media a blocchi in Python puro.
+#
+#   python3 mag_pipeline.py calibrate 60     # 60 s ruotando la HAT → .mag_cal.json
+#   python3 mag_pipeline.py dump FILE        # stampa uno stream mag1s
+
+import gzip, json, math, os, struct, threading, time
+from datetime import datetime, timezone
+
+try:
+    import numpy as np
+    _HAS_NUMPY = True
+except Exception:
+    _HAS_NUMPY = False
+
+from sensehat_b_reader import read_icm20948_mag_raw, MAG_ODR_HZ
+
+MAG_RATE_HZ = int(os.environ.get("MAG_RATE_HZ", "0"))         # 0 = pipeline disabilitata
+MAG_CPU_PCT = float(os.environ.get("MAG_CPU_PCT", "10"))      # % di un core (Pi 3) per il thread
+MAG_CAL_PATH = os.path.join(os.path.expanduser("~/spacewx_logs"), ".mag_cal.json")
+UT_PER_COUNT = 0.15                                           # AK09916: 0.15 µT/LSB
+RATE_STEPS = (100, 50, 20, 10)
+
+# Campi aggiunti al CSV (in quest'ordine, vedi MagPipeline.row())
+MAG_FIELDS = [
+    "mag_bx_ut","mag_by_ut","mag_bz_ut","mag_b_ut","mag_b_std_ut",
+    "mag_b_min_ut","mag_b_max_ut",
+    "mag_dbdt_max_nts","mag_dbdt_rms_nts",
+    "mag_n_1s","mag_rate_hz","mag_cpu_pct"
+]
+
+_REC = struct.Struct("<Ifff")     # epoch UTC s, Bx/By/Bz [µT] float32 → 16 byte/s
+
+
+# ---------------------------------------------------------------- calibrazione
+
+class MagCalibration(object):
+    def __init__(self, offset=(0.0, 0.0, 0.0), matrix=None, ut_per_count=UT_PER_COUNT, fitted=None):
+        self.offset = [float(v) for v in offset]
+        self.matrix = [list(map(float, r)) for r in (matrix or [[1, 0, 0], [0, 1, 0], [0, 0, 1]])]
+        self.ut_per_count = float(ut_per_count)
+        self.fitted = fitted
+
+    @classmethod
+    def load(cls, path=MAG_CAL_PATH):
+        try:
+            with open(path, "r") as f:
+                d = json.load(f)
+            return cls(d.get("offset", (0, 0, 0)), d.get("matrix"), d.get("ut_per_count", UT_PER_COUNT),
+                       d.get("fitted"))
+        except Exception:
+            return cls()
+
+    def save(self, path=MAG_CAL_PATH):
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(dict(offset=self.offset, matrix=self.matrix,
+                           ut_per_count=self.ut_per_count, fitted=self.fitted), f, indent=1)
+        os.replace(tmp, path)
+
+    @classmethod
+    def fit(cls, samples):
+        """
+        Fit semplice su campioni raccolti ruotando il sensore: hard-iron = centro del
+        bounding box, soft-iron = scala diagonale che riporta i tre semiassi al raggio medio.
+        """
+        if len(samples) < 50:
+            raise ValueError("troppi pochi campioni per la calibrazione")
+        lo = [min(s[i] for s in samples) for i in range(3)]
+        hi = [max(s[i] for s in samples) for i in range(3)]
+        off = [(lo[i] + hi[i]) / 2.0 for i in range(3)]
+        rad = [(hi[i] - lo[i]) / 2.0 for i in range(3)]
+        if min(rad) <= 0:
+            raise ValueError("rotazione insufficiente su almeno un asse")
+        r = sum(rad) / 3.0
+        m = [[r / rad[0], 0, 0], [0, r / rad[1], 0], [0, 0, r / rad[2]]]
+        return cls(off, m, UT_PER_COUNT, datetime.now(timezone.utc).isoformat())
+
+    def apply_py(self, x, y, z):
+        v = (x - self.offset[0], y - self.offset[1], z - self.offset[2])
+        k = self.ut_per_count
+        return tuple(k * sum(self.matrix[r][c] * v[c] for c in range(3)) for r in range(3))
+
+
+# ---------------------------------------------------------------- decimazione
+
+class BlockDecimator(object):
+    """
+    Blocchi da N campioni (N = rate, 1 s) → un'uscita per blocco.
+    NumPy: FIR Hann lungo 2N applicato a [blocco precedente | blocco corrente] come
+    prodotto matrice-vettore (pesi · validità) → timestamp al confine tra i due blocchi.
+    """
+
+    def __init__(self, n, cal):
+        self.n = n
+        self.cal = cal
+        if _HAS_NUMPY:
+            self.buf = np.full((2 * n, 3), np.nan)
+            w = np.hanning(2 * n + 2)[1:-1]
+            self.taps = w / w.sum()
+            self.off = np.asarray(cal.offset)
+            self.m = np.asarray(cal.matrix).T * cal.ut_per_count
+        else:
+            self.buf = []
+        self.i = 0
+
+    def push(self, xyz):
+        """Aggiunge un campione raw (o None); ritorna (bx,by,bz) a fine blocco, altrimenti None."""
+        if _HAS_NUMPY:
+            self.buf[self.n + self.i] = xyz if xyz is not None else np.nan
+        elif xyz is not None:
+            self.buf.append(xyz)
+        self.i += 1
+        if self.i < self.n:
+            return None
+        self.i = 0
+        return self._flush()
+
+    def _flush(self):
+        if not _HAS_NUMPY:
+            raw, self.buf = self.buf, []
+            if not raw:
+                return None
+            k = float(len(raw))
+            return self.cal.apply_py(*(sum(s[i] for s in raw) / k for i in range(3)))
+        b = self.buf
+        ok = ~np.isnan(b[:, 0])
+        out = None
+        if ok[self.n:].any():
+            w = self.taps * ok
+            cal = (np.nan_to_num(b) - self.off) @ self.m           # calibrazione vettoriale del blocco
+            out = tuple(float(v) for v in (w @ cal) / w.sum())
+        b[:self.n] = b[self.n:]                                    # il blocco corrente diventa "precedente"
+        b[self.n:] = np.nan
+        return out
+
+
+# ---------------------------------------------------------------- stream 1 s
+
+class Mag1sStream(object):
+    """Appende la serie calibrata a 1 s al file del giorno (compresso a fine giornata dal logger)."""
+
+    def __init__(self, path_for_day):
+        self.path_for_day = path_for_day
+        self._path = None
+        self._f = None
+
+    def write(self, epoch_s, b):
+        path = self.path_for_day()
+        if path != self._path:
+            self.close()
+            self._path = path
+            self._f = open(path, "ab")
+        self._f.write(_REC.pack(int(epoch_s), *b))
+        self._f.flush()
+
+    def close(self):
+        if self._f is not None:
+            try: self._f.close()
+            except Exception: pass
+        self._f = None
+
+def read_mag1s(path):
+    """Generatore (epoch_s, bx, by, bz) da uno stream .bin o .bin.gz."""
+    op = gzip.open if path.endswith(".gz") else open
+    with op(path, "rb") as f:
+        data = f.read()
+    for off in range(0, len(data) - _REC.size + 1, _REC.size):
+        yield _REC.unpack_from(data, off)
+
+
+# ---------------------------------------------------------------- thread
+
+def _r(x, nd=3):
+    return None if x is None else round(x, nd)
+
+
+class MagPipeline(threading.Thread):
+    """
+    start() dopo il warmup, row() a ogni intervallo di log (serie 1 min + reset),
+    latest_counts() per chi vuole l'ultimo campione raw (con la sua età) senza toccare l'I2C.
+    """
+
+    def __init__(self, rate_hz=MAG_RATE_HZ, path_for_day=None, cal_path=MAG_CAL_PATH,
+                 cpu_pct=MAG_CPU_PCT):
+        super().__init__(name="mag-pipeline", daemon=True)
+        self.rate = max(r for r in RATE_STEPS if r <= max(RATE_STEPS[-1], min(rate_hz, MAG_ODR_HZ)))
+        self.cal = MagCalibration.load(cal_path)
+        self.cpu_pct = cpu_pct
+        self.stream = Mag1sStream(path_for_day) if path_for_day else None
+        self._lock = threading.Lock()
+        self._halt = threading.Event()
+        self._last_raw = None
+        self._last_raw_t = None
+        self._sec = []              # [(epoch, bx, by, bz)] della serie 1 s nel minuto
+        self._cpu_last = None       # % CPU del thread sull'ultima finestra di misura
+
+    # --- lettura ---
+    def latest_counts(self):
+        """((mx, my, mz, norm), età_s) come SensorWorker.read(); (None, None) se mai letto."""
+        xyz, t = self._last_raw, self._last_raw_t
+        if xyz is None:
+            return None, None
+        mx, my, mz = xyz
+        age = time.monotonic() - t
+        return (mx, my, mz, round(math.sqrt(mx*mx + my*my + mz*mz), 2)), (0.0 if age < 1.0 else round(age, 1))
+
+    def run(self):
+        self._cpu0, self._wall0 = time.thread_time(), time.monotonic()
+        dec = BlockDecimator(self.rate, self.cal)
+        period = 1.0 / self.rate
+        t_next = time.monotonic()
+        t_block = time.time()
+        while not self._halt.is_set():
+            xyz = read_icm20948_mag_raw()
+            if xyz is not None:
+                self._last_raw, self._last_raw_t = xyz, time.monotonic()
+            b = dec.push(xyz)
+            if dec.i == 0:                                  # fine blocco da 1 s
+                # FIR su 2 blocchi: l'uscita è centrata sul confine tra i blocchi
+                t_out = t_block if _HAS_NUMPY else t_block + 0.5
+                t_block = time.time()
+                if b is not None:
+                    with self._lock:
+                        self._sec.append((t_out,) + tuple(b))
+                    if self.stream is not None:
+                        try: self.stream.write(t_out, b)
+                        except Exception as e: print(f"[MAG] stream error: {e}")
+                new_rate = self._check_budget()
+                if new_rate != self.rate:
+                    print(f"[MAG] CPU over budget ({self._cpu_last:.1f}% > {self.cpu_pct}%): "
+                          f"{self.rate} → {new_rate} Hz")
+                    self.rate = new_rate
+                    dec = BlockDecimator(self.rate, self.cal)
+                    period = 1.0 / self.rate
+            t_next += period
+            delay = t_next - time.monotonic()
+            if delay < 0:
+                t_next = time.monotonic()
+                delay = 0
+            self._halt.wait(delay)
+        if self.stream is not None:
+            self.stream.close()
+
+    def _check_budget(self):
+        # thread_time() è per-thread: va letto solo da qui (finestre da ~10 s)
+        wall = time.monotonic() - self._wall0
+        if wall < 10:
+            return self.rate
+        self._cpu_last = 100.0 * (time.thread_time() - self._cpu0) / wall
+        self._cpu0, self._wall0 = time.thread_time(), time.monotonic()
+        if self._cpu_last <= self.cpu_pct:
+            return self.rate
+        lower = [r for r in RATE_STEPS if r < self.rate]
+        return lower[0] if lower else self.rate
+
+    # --- uscita a 1 min ---
+    def row(self):
+        """Valori MAG_FIELDS sull'intervallo dall'ultima chiamata, poi reset."""
+        with self._lock:
+            sec = self._sec
+            self._sec = []
+        cpu = self._cpu_last
+        if not sec:
+            return [None] * (len(MAG_FIELDS) - 3) + [0, self.rate, _r(cpu, 1)]
+        if _HAS_NUMPY:
+            a = np.asarray(sec)
+            b = a[:, 1:4]
+            mean = b.mean(axis=0)
+            norm = np.sqrt((b * b).sum(axis=1))
+            nstd = float(norm.std(ddof=1)) if len(norm) > 1 else None
+            d = np.diff(b, axis=0) * 1000.0 / np.maximum(np.diff(a[:, 0]), 1e-3)[:, None]   # nT/s
+            dn = np.sqrt((d * d).sum(axis=1))
+            dmax = float(dn.max()) if len(dn) else None
+            drms = float(np.sqrt((dn * dn).mean())) if len(dn) else None
+            mean = [float(v) for v in mean]
+            nmin, nmax = float(norm.min()), float(norm.max())
+        else:
+            n = len(sec)
+            mean = [sum(s[i] for s in sec) / n for i in (1, 2, 3)]
+            norm = [math.sqrt(s[1]**2 + s[2]**2 + s[3]**2) for s in sec]
+            nm = sum(norm) / n
+            nstd = math.sqrt(sum((v - nm)**2 for v in norm) / (n - 1)) if n > 1 else None
+            dn = []
+            for p, q in zip(sec, sec[1:]):
+                dt = max(q[0] - p[0], 1e-3)
+                dn.append(1000.0 * math.sqrt(sum((q[i] - p[i])**2 for i in (1, 2, 3))) / dt)
+            dmax = max(dn) if dn else None
+            drms = math.sqrt(sum(v*v for v in dn) / len(dn)) if dn else None
+            nmin, nmax = min(norm), max(norm)
+        bn = math.sqrt(sum(v*v for v in mean))
+        return [
+            _r(mean[0]), _r(mean[1]), _r(mean[2]), _r(bn), _r(nstd),
+            _r(nmin), _r(nmax),
+            _r(dmax, 1), _r(drms, 1),
+            len(sec), self.rate, _r(cpu, 1)
+        ]
+
+    def stop(self):
+        self._halt.set()
+
+
+# ---------------------------------------------------------------- CLI
+
+def _calibrate(seconds):
+    from sensehat_b_reader import warmup
+    warmup()
+    time.sleep(2)
+    print(f"[MAG] calibrazione: ruota la HAT in tutte le direzioni per {seconds:.0f} s")
+    samples = []
+    t_end = time.time() + seconds
+    while time.time() < t_end:
+        xyz = read_icm20948_mag_raw()
+        if xyz is not None:
+            samples.append(xyz)
+        time.sleep(0.02)
+    cal = MagCalibration.fit(samples)
+    cal.save()
+    print(f"[MAG] n={len(samples)} offset={cal.offset} scale={[cal.matrix[i][i] for i in range(3)]} → {MAG_CAL_PATH}")
+
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) >= 2 and sys.argv[1] == "calibrate":
+        _calibrate(float(sys.argv[2]) if len(sys.argv) > 2 else 60)
+    elif len(sys.argv) >= 3 and sys.argv[1] == "dump":
+        for ts, bx, by, bz in read_mag1s(sys.argv[2]):
+            print(ts, f"{bx:.3f} {by:.3f} {bz:.3f} |B|={math.sqrt(bx*bx+by*by+bz*bz):.3f}")
+    else:
+        from sensehat_b_reader import warmup
+        warmup()
+        p = MagPipeline(MAG_RATE_HZ or MAG_ODR_HZ)
+        p.start()
+        for _ in range(3):
+            time.sleep(20)
+            print(dict(zip(MAG_FIELDS, p.row())))
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# Sketch di quantili "mergeable" (stile t-digest) per gli RSSI dello SCAN.
+# Ogni canale produce uno sketch per minuto; gli sketch si possono fondere
+# (ora/giorno) e interrogare per p10/p50/p90 senza rileggere le righe raw.
+# Solo libreria standard: gira sulla Pi senza NumPy.
+
+import base64
+import struct
+
+SKETCH_COMPRESSION = 50     # ~ numero massimo di centroidi dopo la compressione
+_SCALE = 10.0               # dBm serializzati con risoluzione 0.1 dB (int16)
+_VERSION = 2                # 1: pesi uint16 (troncati a 65535), 2: pesi varint
+
+
+class RssiSketch(object):
+    """
+    Merging digest: lista ordinata di centroidi (media, peso).
+    La dimensione massima di un centroide è ~ 4*n*q*(1-q)/compression, quindi
+    le code (p10/p90) restano precise e il centro si compatta.
+    """
+
+    def __init__(self, compression=SKETCH_COMPRESSION):
+        self.compression = compression
+        self._c = []        # [(mean, weight)] ordinati per mean
+        self._buf = []      # valori non ancora compressi
+        self.n = 0
+        self.vmin = None
+        self.vmax = None
+
+    def add(self, x, w=1):
+        if x is None:
+            return
+        x = float(x)
+        self._buf.append((x, w))
+        self.n += w
+        self.vmin = x if self.vmin is None else min(self.vmin, x)
+        self.vmax = x if self.vmax is None else max(self.vmax, x)
+        if len(self._buf) > 4 * self.compression:
+            self._compress()
+
+    def merge(self, other):
+        if other is None or other.n == 0:
+            return self
+        other._compress()
+        self._buf.extend(other._c)
+        self.n += other.n
+        self.vmin = other.vmin if self.vmin is None else min(self.vmin, other.vmin)
+        self.vmax = other.vmax if self.vmax is None else max(self.vmax, other.vmax)
+        self._compress()
+        return self
+
+    def _compress(self):
+        if not self._buf:
+            return
+        pts = sorted(self._c + self._buf)
+        self._buf = []
+        out = []
+        cum = 0.0
+        n = float(self.n)
+        for m, w in pts:
+            if out:
+                pm, pw = out[-1]
+                q = (cum - pw + (pw + w) / 2.0) / n
+                limit = max(1.0, 4.0 * n * q * (1.0 - q) / self.compression)
+                if pm == m or pw + w <= limit:
+                    out[-1] = ((pm * pw + m * w) / (pw + w), pw + w)
+                    cum += w
+                    continue
+            out.append((m, w))
+            cum += w
+        self._c = out
+
+    def quantile(self, q):
+        """Quantile q in [0,1] con interpolazione tra i centri dei centroidi."""
+        self._compress()
+        if self.n == 0:
+            return None
+        c = self._c
+        if len(c) == 1:
+            return c[0][0]
+        t = q * self.n
+        prev_pos, prev_val = 0.0, self.vmin
+        cum = 0.0
+        for m, w in c:
+            center = cum + w / 2.0
+            if t < center:
+                span = center - prev_pos
+                f = 0.0 if span <= 0 else (t - prev_pos) / span
+                return prev_val + f * (m - prev_val)
+            prev_pos, prev_val = center, m
+            cum += w
+        span = self.n - prev_pos
+        f = 0.0 if span <= 0 else min(1.0, (t - prev_pos) / span)
+        return prev_val + f * (self.vmax - prev_val)
+
+    def percentiles(self, ps=(10, 50, 90)):
+        return [None if self.n == 0 else round(self.quantile(p / 100.0), 1) for p in ps]
+
+    # --- serializzazione compatta: base64 di int16 (valori*10) + varint (pesi) ---
+    # i pesi non hanno limite (uno sketch giornaliero di banda supera i 65535 campioni) e
+    # quelli piccoli, i più comuni negli sketch al minuto, costano un byte
+    def to_str(self):
+        self._compress()
+        if self.n == 0:
+            return ""
+        parts = [struct.pack("<Bhh", _VERSION, _q(self.vmin), _q(self.vmax))]
+        for m, w in self._c:
+            parts.append(struct.pack("<h", _q(m)) + _varint(max(1, int(round(w)))))
+        return base64.urlsafe_b64encode(b"".join(parts)).decode().rstrip("=")
+
+    @classmethod
+    def from_str(cls, s, compression=SKETCH_COMPRESSION):
+        sk = cls(compression)
+        if not s:
+            return sk
+        raw = base64.urlsafe_b64decode(s + "=" * (-len(s) % 4))
+        ver, vmin, vmax = struct.unpack_from("<Bhh", raw, 0)
+        if ver not in (1, _VERSION):
+            raise ValueError(f"unsupported sketch version {ver}")
+        sk.vmin, sk.vmax = vmin / _SCALE, vmax / _SCALE
+        off = 5
+        while off + 2 < len(raw):
+            (m,) = struct.unpack_from("<h", raw, off)
+            if ver == 1:
+                (w,) = struct.unpack_from("<H", raw, off + 2)
+                off += 4
+            else:
+                w, off = _unvarint(raw, off + 2)
+            sk._c.append((m / _SCALE, w))
+            sk.n += w
+        return sk
+
+
+def _q(x):
+    return max(-32768, min(32767, int(round(x * _SCALE))))
+
+
+def _varint(v):
+    out = bytearray()
+    while v > 0x7F:
+        out.append(v & 0x7F | 0x80)
+        v >>= 7
+    out.append(v)
+    return bytes(out)
+
+
+def _unvarint(buf, pos):
+    """→ (valore, nuova posizione)"""
+    v = shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        v |= (b & 0x7F) << shift
+        if b < 0x80:
+            return v, pos
+        shift += 7
+
+
+def sketch_of(values, compression=SKETCH_COMPRESSION):
+    sk = RssiSketch(compression)
+    for v in values:
+        sk.add(v)
+    return sk
+
+
+def merge_strs(strs, compression=SKETCH_COMPRESSION):
+    """Fonde una sequenza di sketch serializzati (None/"" ignorati)."""
+    out = RssiSketch(compression)
+    for s in strs:
+        if s:
+            try:
+                out.merge(RssiSketch.from_str(s, compression))
+            except Exception:
+                continue
+    return out
+
+
+if __name__ == "__main__":
+    import random
+    vals = [round(random.gauss(-75, 8)) for _ in range(5000)]
+    a = sketch_of(vals[:2500]); b = sketch_of(vals[2500:])
+    m = merge_strs([a.to_str(), b.to_str()])
+    ref = sorted(vals)
+    print({"merged": m.percentiles(),
+           "exact": [ref[int(p / 100 * (len(ref) - 1))] for p in (10, 50, 90)],
+           "bytes": len(m.to_str())})
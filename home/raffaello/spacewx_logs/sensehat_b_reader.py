@@ -1,54 +1,92 @@
 #!/usr/bin/env python3
 # Sense HAT B (Waveshare) adapter: SHTC3 (T/RH), LPS22HB (P/T), ICM20948 (mag)
-# Dipendenze: lgpio (per SHTC3), smbus (per LPS22HB/ICM20948)
+# Dipendenze: bus I2C condiviso (i2c_bus: smbus+lgpio, oppure I2C_BACKEND=sim senza HAT)
 
 import math
+import os
+import threading
 import time
 
-# --- SHTC3 (usa lgpio via demo ufficiale) ------------------------------------
+from i2c_bus import get_bus
+from i2c_sched import as_job, run_job, run_jobs
+
+# Un lock per sensore: se l'init è in corso (warmup in background) la lettura
+# salta il ciclo invece di bloccare il logger sui sleep dei costruttori.
+_INIT_LOCKS = {"shtc3": threading.Lock(), "lps22hb": threading.Lock(), "icm": threading.Lock()}
+
+def _ready(name, init):
+    lock = _INIT_LOCKS[name]
+    if not lock.acquire(blocking=False):
+        return False
+    try:
+        return init()
+    finally:
+        lock.release()
+
+# --- SHTC3 (driver del demo ufficiale su bus condiviso) -----------------------
 try:
-    import lgpio as _sbc
     from SHTC3 import SHTC3 as _SHTC3   # usa esattamente l'API del demo
     _HAS_SHTC3 = True
 except Exception:
     _HAS_SHTC3 = False
 
-# --- LPS22HB (usa smbus via demo ufficiale) ----------------------------------
+# --- LPS22HB (driver del demo ufficiale su bus condiviso) ---------------------
 try:
     from LPS22HB import LPS22HB as _LPS22HB
-    import LPS22HB as _LPS22HB_mod      # per registri/bit nel demo
     _HAS_LPS22HB = True
 except Exception:
     _HAS_LPS22HB = False
 
-# --- ICM20948 (usa smbus via demo ufficiale) ---------------------------------
+# ODR continuo LPS22HB (Hz → bit ODR di CTRL_REG1); a 1 Hz la FIFO da 32 copre gli ultimi ~32 s:
+# va scaricata più spesso: col campionatore continuo (EnvSampler) ogni 0.2-1 s, con le letture
+# inline (ENV_SAMPLE_HZ=0) il logger la scarica anche ogni LPS_DRAIN_S durante l'attesa
+_LPS_ODR_BITS = {1: 0x10, 10: 0x20, 25: 0x30, 50: 0x40, 75: 0x50}
+LPS_ODR_HZ = int(os.environ.get("LPS_ODR_HZ", "1"))
+
+# --- ICM20948 (driver del demo ufficiale su bus condiviso) --------------------
 try:
     from ICM20948 import ICM20948 as _ICM20948
-    from ICM20948 import Mag as _MAG_BUF  # lista globale aggiornata da icm20948MagRead()
     _HAS_ICM = True
 except Exception:
     _HAS_ICM = False
 
+# ODR AK09916 in modalità continua (Hz → (CNTL2 mode, I2C_MST_ODR_CONFIG)):
+# il master dell'ICM deve ciclare più veloce del mag (1.1 kHz / 2^odr: 0x04 ≈ 69 Hz, 0x03 ≈ 137 Hz)
+_MAG_MODES = {10: (0x02, 0x04), 20: (0x04, 0x04), 50: (0x06, 0x04), 100: (0x08, 0x03)}
+MAG_ODR_HZ = int(os.environ.get("MAG_ODR_HZ", "20"))
+
 # ---------------------------- SHTC3 ------------------------------------------
 
 _SHTC3_DEV = None
 
+def _shtc3_init():
+    global _SHTC3_DEV
+    if _SHTC3_DEV is not None:
+        return True
+    if not _HAS_SHTC3:
+        return False
+    try:
+        _SHTC3_DEV = _SHTC3(get_bus(), 0x70)  # addr=0x70
+        return True
+    except Exception:
+        _SHTC3_DEV = None
+        return False
+
 def read_shtc3():
     """
     Ritorna (t_c, rh_pct) oppure (None, None) se non disponibile.
-    Usa il driver del demo (lgpio) e le funzioni SHTC3_Read_TH/RH.
+    Una sola misura T+RH (6 byte, CRC a tabella): None sul valore con CRC errato.
     """
-    if not _HAS_SHTC3:
+    return run_job(shtc3_job(), get_bus())
+
+def shtc3_job():
+    """Come read_shtc3() ma come job di i2c_sched: la conversione (~13 ms) non occupa il bus."""
+    if not _ready("shtc3", _shtc3_init):
         return None, None
-    global _SHTC3_DEV
     try:
-        if _SHTC3_DEV is None:
-            _SHTC3_DEV = _SHTC3(_sbc, 1, 0x70)  # bus=1, addr=0x70
-        t = _SHTC3_DEV.SHTC3_Read_TH()   # °C  (demo: wake, cmd NM, CRC)  # :contentReference[oaicite:3]{index=3}
-        h = _SHTC3_DEV.SHTC3_Read_RH()   # %RH (idem)                    # :contentReference[oaicite:4]{index=4}
-        # Il demo ritorna 0 in caso di CRC error → normalizziamo a None
-        t_c  = round(t, 2)  if t  != 0 else None
-        rh_p = round(h, 1)  if h  != 0 else None
+        t, h = yield from _SHTC3_DEV.SHTC3_TH_RH_JOB()   # °C / %RH (wake, misura, sleep)
+        t_c  = round(t, 2)  if t is not None else None
+        rh_p = round(h, 1)  if h is not None else None
         return t_c, rh_p
     except Exception:
         return None, None
@@ -57,37 +95,66 @@ def read_shtc3():
 
 _LPS22 = None
 
-def read_lps22hb():
+def _lps_init():
+    global _LPS22
+    if _LPS22 is not None:
+        return True
+    if not _HAS_LPS22HB:
+        return False
+    try:
+        _LPS22 = _LPS22HB(bus=get_bus())  # reset + BDU=1 ODR=0      # :contentReference[oaicite:5]{index=5}
+        return True
+    except Exception:
+        _LPS22 = None
+        return False
+
+def read_lps22hb_samples():
     """
-    Ritorna (press_hpa, temp_c) oppure (None, None) se non disponibile.
-    Implementa la stessa logica del demo: one-shot + STATUS + read OUT regs.
+    Ritorna [(press_hpa, temp_c), ...] ([] se nessun campione nuovo) oppure None
+    se il sensore non è disponibile. Sensore in ODR continuo con FIFO: scarica in
+    block read tutti i campioni accumulati dall'ultima chiamata (al massimo gli ultimi 32,
+    cioè ~32 s a 1 Hz: va chiamata almeno ogni ~30 s per non perderne).
     """
-    if not _HAS_LPS22HB:
-        return None, None
-    global _LPS22
+    if not _ready("lps22hb", _lps_init):
+        return None
     try:
-        if _LPS22 is None:
-            _LPS22 = _LPS22HB()  # istanzia SMBus(1) e reset + BDU=1 ODR=0      # :contentReference[oaicite:5]{index=5}
-        # trigger one-shot
-        _LPS22.LPS22HB_START_ONESHOT()                                          # :contentReference[oaicite:6]{index=6}
-        time.sleep(0.02)
-        # status & read
-        st = _LPS22._read_byte(_LPS22HB_mod.LPS_STATUS)                         # :contentReference[oaicite:7]{index=7}
-        p_hpa = None
-        t_c   = None
-        if st & 0x01:  # pressione pronta                                       # :contentReference[oaicite:8]{index=8}
-            xl = _LPS22._read_byte(_LPS22HB_mod.LPS_PRESS_OUT_XL)
-            l  = _LPS22._read_byte(_LPS22HB_mod.LPS_PRESS_OUT_L)
-            h  = _LPS22._read_byte(_LPS22HB_mod.LPS_PRESS_OUT_H)
-            raw = (h<<16)|(l<<8)|xl
-            p_hpa = round(raw/4096.0, 2)                                        # :contentReference[oaicite:9]{index=9}
-        if st & 0x02:  # temperatura pronta                                     # :contentReference[oaicite:10]{index=10}
-            tl = _LPS22._read_byte(_LPS22HB_mod.LPS_TEMP_OUT_L)
-            th = _LPS22._read_byte(_LPS22HB_mod.LPS_TEMP_OUT_H)
-            t_c = round(((th<<8)|tl)/100.0, 2)                                  # :contentReference[oaicite:11]{index=11}
-        return p_hpa, t_c
+        if not _LPS22._continuous:
+            _LPS22.LPS22HB_START_CONTINUOUS(_LPS_ODR_BITS.get(LPS_ODR_HZ, 0x10))
+        samples = _LPS22.LPS22HB_READ_FIFO()
+        if not samples:                       # FIFO vuota (appena avviata): ultimo dato disponibile
+            p, t = _LPS22.LPS22HB_READ_LAST()
+            samples = [(p, t)] if p is not None else []
+        return samples
     except Exception:
+        return None
+
+def lps22hb_stats(samples):
+    """dict(p_mean, p_min, p_max, t_mean, n) da una lista di campioni FIFO, None se vuota."""
+    if not samples:
+        return None
+    ps = [p for p, _ in samples]
+    ts = [t for _, t in samples if t is not None]
+    return dict(
+        p_mean=round(sum(ps)/len(ps), 3), p_min=round(min(ps), 2), p_max=round(max(ps), 2),
+        t_mean=round(sum(ts)/len(ts), 2) if ts else None, n=len(ps)
+    )
+
+def read_lps22hb_stats():
+    """
+    Ritorna dict(p_mean, p_min, p_max, t_mean, n) oppure None se non disponibile
+    (statistiche sui campioni FIFO dall'ultima lettura).
+    """
+    return lps22hb_stats(read_lps22hb_samples())
+
+def read_lps22hb():
+    """
+    Ritorna (press_hpa, temp_c) oppure (None, None) se non disponibile.
+    Valori medi dei campioni FIFO dall'ultima lettura (vedi read_lps22hb_stats).
+    """
+    st = read_lps22hb_stats()
+    if st is None:
         return None, None
+    return round(st["p_mean"], 2), st["t_mean"]
 
 # ---------------------------- ICM20948 MAG -----------------------------------
 
@@ -100,8 +167,10 @@ def _icm_init():
     if not _HAS_ICM:
         return False
     try:
-        _ICM = _ICM20948()
+        _ICM = _ICM20948(bus=get_bus())
         # il demo abilita già AK09916 a 20 Hz nel costruttore                     # :contentReference[oaicite:12]{index=12}
+        mode, mst_odr = _MAG_MODES.get(MAG_ODR_HZ, _MAG_MODES[20])
+        _ICM.icm20948MagStartContinuous(mode, mst_odr)   # SLV0 in auto-lettura una volta sola
         return True
     except Exception:
         _ICM = None
@@ -110,18 +179,113 @@ def _icm_init():
 def read_icm20948_mag():
     """
     Ritorna (mx_counts, my_counts, mz_counts, norm_counts) oppure (None, ..).
-    Usa icm20948MagRead() che popola la lista globale Mag nel modulo demo.
+    Usa la modalità continua (SLV0 in auto-lettura): un block read di
+    EXT_SLV_SENS_DATA invece dei ~100 accessi di icm20948MagRead().
     """
-    if not _icm_init():
+    if not _ready("icm", _icm_init):
         return None, None, None, None
     try:
-        _ICM.icm20948MagRead()              # aggiorna Mag[0..2] con medie/segni  # :contentReference[oaicite:13]{index=13}
-        mx, my, mz = _MAG_BUF[0], _MAG_BUF[1], _MAG_BUF[2]
+        xyz = _ICM.icm20948MagReadBurst()   # aggiorna anche Mag[0..2]
+        if xyz is None:                     # overflow magnetico: campione non valido
+            return None, None, None, None
+        mx, my, mz = xyz
         norm = math.sqrt(mx*mx + my*my + mz*mz)
         return int(mx), int(my), int(mz), float(f"{norm:.2f}")
     except Exception:
         return None, None, None, None
 
+def read_icm20948_mag_raw():
+    """
+    Ritorna (mx, my, mz) in counts oppure None (non pronto / overflow / errore).
+    Variante minima per il campionamento ad alta frequenza (mag_pipeline).
+    """
+    if not _ready("icm", _icm_init):
+        return None
+    try:
+        return _ICM.icm20948MagReadBurst()
+    except Exception:
+        return None
+
+# ---------------------------- Snapshot in pipeline -----------------------------
+
+# Ordine = ordine di avvio: prima chi ha la conversione più lunga (SHTC3), le letture
+# senza attese (FIFO LPS22HB, burst ICM in bank 0) girano durante la sua conversione.
+_SNAPSHOT_JOBS = {
+    "shtc3": shtc3_job,
+    "lps22hb": lambda: as_job(read_lps22hb_samples),
+    "icm": lambda: as_job(read_icm20948_mag),
+}
+
+def read_snapshot(names=("shtc3", "lps22hb", "icm")):
+    """
+    Legge più sensori con un solo giro sul bus: {nome: valore} con gli stessi formati di
+    read_shtc3 / read_lps22hb_samples / read_icm20948_mag. Dura ~ la conversione più lunga.
+    """
+    return run_jobs([(n, _SNAPSHOT_JOBS[n]()) for n in _SNAPSHOT_JOBS if n in names], get_bus())
+
+# ---------------------------- Reinizializzazione ------------------------------
+
+# Attesa massima di un'init in corso (il costruttore ICM20948 da solo dorme ~1 s)
+_INIT_WAIT_S = 5.0
+
+def reset_sensor(name, timeout=_INIT_WAIT_S):
+    """
+    Dimentica l'istanza del driver (name: shtc3/lps22hb/icm): la prossima lettura
+    la ricrea da zero. Aspetta un'eventuale init in corso, al più timeout: oltre,
+    l'init è ferma dentro un bus piantato e il suo lock viene sostituito.
+    """
+    global _SHTC3_DEV, _LPS22, _ICM
+    lock = _INIT_LOCKS[name]
+    if not lock.acquire(timeout=timeout):
+        # il lock vecchio resta al thread bloccato (_ready/_warm rilasciano quello che hanno preso)
+        if _INIT_LOCKS[name] is lock:       # non già sostituito da un altro reset in attesa
+            print(f"[SENS] {name}: init stuck > {timeout:g}s → init lock replaced")
+            _INIT_LOCKS[name] = threading.Lock()
+        lock = _INIT_LOCKS[name]
+        lock.acquire()
+    try:
+        if name == "shtc3":
+            _SHTC3_DEV = None
+        elif name == "lps22hb":
+            _LPS22 = None
+        elif name == "icm":
+            _ICM = None
+    finally:
+        lock.release()
+
+# ---------------------------- Costo bus ---------------------------------------
+
+def i2c_stats():
+    """Contatori del bus condiviso (transazioni/byte/sleep, vedi i2c_bus.I2CStats) o None."""
+    try:
+        return get_bus().stats
+    except Exception:
+        return None
+
+# ---------------------------- Warmup ------------------------------------------
+
+def _warm(lock, init):
+    try:
+        init()
+    finally:
+        lock.release()
+
+def warmup():
+    """
+    Inizializza i tre sensori in parallelo su thread daemon (il costruttore
+    ICM20948 da solo dorme ~1 s). Le letture fatte prima che l'init sia finito
+    ritornano None invece di aspettare.
+    """
+    threads = []
+    for name, init in (("shtc3", _shtc3_init), ("lps22hb", _lps_init), ("icm", _icm_init)):
+        lock = _INIT_LOCKS[name]
+        if not lock.acquire(blocking=False):
+            continue
+        t = threading.Thread(target=_warm, args=(lock, init), name=f"warmup-{name}", daemon=True)
+        t.start()
+        threads.append(t)
+    return threads
+
 # ---------------------------- Quick self-test --------------------------------
 if __name__ == "__main__":
     t, rh = read_shtc3()
@@ -130,6 +294,7 @@ if __name__ == "__main__":
     print({
         "shtc3": {"t_c": t, "rh_pct": rh},
         "lps22hb": {"press_hpa": p, "temp_c": tt},
-        "icm20948": {"mx": mx, "my": my, "mz": mz, "norm_counts": n}
+        "icm20948": {"mx": mx, "my": my, "mz": mz, "norm_counts": n},
+        "i2c": i2c_stats() and i2c_stats().snapshot()
     })
 
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+# Un worker (thread daemon) per sensore, con scadenza rigida sulla lettura.
+# - read() consegna la richiesta al worker e aspetta al più deadline_s
+# - a scadenza (bus lento, init lenta, retry del driver) ritorna l'ultimo valore
+#   buono con la sua età in secondi, senza bloccare il ciclo di campionamento
+# - finché una lettura è ancora in corso non ne accoda altre: risponde subito dalla cache
+# - dopo max_fail fallimenti consecutivi il sensore viene reinizializzato con backoff
+#   esponenziale; se il thread è incastrato se ne avvia uno nuovo (il vecchio viene
+#   abbandonato: è daemon e il suo risultato è scartato)
+# - bus piantato (una chiamata smbus che non ritorna tiene il lock di I2CBus): gli altri
+#   thread escono dal lock a tempo con I2CBusError; il thread nuovo, non quello incastrato,
+#   abbandona il bus, ne apre uno nuovo (reopen_bus) e ricrea i driver prima di leggere
+# - read_all(): i sensori HAT letti insieme in pipeline (sensehat_b_reader.read_snapshot) da un
+#   solo worker con scadenza; i worker per sensore tengono cache, età, contatori e reinit
+
+import os
+import threading
+import time
+
+from i2c_bus import get_bus, reopen_bus
+from sensehat_b_reader import (read_shtc3, read_lps22hb_samples, read_icm20948_mag,
+                               read_snapshot, reset_sensor)
+
+SENSOR_DEADLINE_S = float(os.environ.get("SENSOR_DEADLINE_S", "0.25"))
+SENSOR_MAX_FAIL = int(os.environ.get("SENSOR_MAX_FAIL", "5"))
+SENSOR_MAX_BACKOFF_S = float(os.environ.get("SENSOR_MAX_BACKOFF_S", "300"))
+
+
+class SensorWorker(object):
+
+    def __init__(self, name, fn, valid, reset=None, deadline_s=SENSOR_DEADLINE_S,
+                 max_fail=SENSOR_MAX_FAIL, backoff_s=5.0, max_backoff_s=SENSOR_MAX_BACKOFF_S):
+        self.name = name
+        self.fn = fn
+        self.valid = valid
+        self.reset = reset
+        self.deadline_s = deadline_s
+        self.max_fail = max_fail
+        self.backoff_s = backoff_s
+        self.max_backoff_s = max_backoff_s
+        self._lock = threading.Lock()
+        self._req = threading.Event()
+        self._done = threading.Event()
+        self._gen = 0               # generazione del thread: i risultati di thread abbandonati sono scartati
+        self._thread = None
+        self._busy = False
+        self._busy_since = 0.0
+        self._result = None
+        self._reinit = False
+        self.last = None            # ultimo valore buono
+        self.last_t = None          # monotonic dell'ultimo valore buono
+        self.fails = 0              # fallimenti consecutivi
+        self.timeouts = 0           # contatori cumulativi (il chiamante fa le differenze)
+        self.errors = 0
+        self.reinits = 0
+        self._backoff = backoff_s
+        self._next_reinit = 0.0
+
+    # --- thread ---
+    def _start(self, recover=False):
+        self._gen += 1
+        self._req = threading.Event()
+        self._done = threading.Event()
+        self._busy = False
+        t = threading.Thread(target=self._loop, args=(self._gen, self._req, self._done, recover),
+                             name=f"sensor-{self.name}-{self._gen}", daemon=True)
+        self._thread = t
+        t.start()
+
+    def _loop(self, gen, req, done, recover=False):
+        if recover:                 # sostituisce un thread incastrato: se è fermo nel bus lo si riapre qui
+            try:
+                recover_bus()
+            except Exception as e:
+                print(f"[SENS] {self.name} bus recovery error: {e}")
+        while gen == self._gen:
+            req.wait()
+            req.clear()
+            if gen != self._gen:
+                return
+            if self._reinit and self.reset is not None:
+                self._reinit = False
+                try:
+                    self.reset()
+                except Exception as e:
+                    print(f"[SENS] {self.name} reset error: {e}")
+            try:
+                res = self.fn()
+            except Exception:
+                res = None
+            if gen != self._gen:
+                return              # abbandonato mentre era bloccato: risultato scartato
+            self._result = res
+            done.set()
+
+    # --- API ---
+    def read(self):
+        """
+        Ritorna (valore, età_s): età 0.0 se letto adesso, altrimenti l'ultimo valore
+        buono con la sua età (valore None, età None se non c'è mai stato).
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._thread is None:
+                self._start()
+            if self._busy and not self._done.is_set():
+                # lettura precedente ancora in corso: niente accodamento
+                if now - self._busy_since > max(10 * self.deadline_s, 5.0):
+                    self._fail(now, stuck=True)
+                return self._cached(now)
+            if self._busy:              # completata dopo la scadenza: la consideriamo comunque
+                self._busy = False
+                self._accept(self._result, now)
+            self._done.clear()
+            self._busy = True
+            self._busy_since = now
+            self._req.set()
+            done = self._done
+        if done.wait(self.deadline_s):
+            with self._lock:
+                if done is self._done and self._busy:
+                    self._busy = False
+                    if self._accept(self._result, time.monotonic()):
+                        return self.last, 0.0
+                return self._cached(time.monotonic())
+        with self._lock:
+            self.timeouts += 1
+            self._fail(time.monotonic())
+            return self._cached(time.monotonic())
+
+    def offer(self, res, timeout=False):
+        """Risultato ottenuto altrove (snapshot): stessa contabilità e stesso ritorno di read()."""
+        with self._lock:
+            now = time.monotonic()
+            if timeout:
+                self.timeouts += 1
+                self._fail(now)
+            elif self._accept(res, now):
+                return self.last, 0.0
+            return self._cached(now)
+
+    def _accept(self, res, now):
+        if res is not None and self.valid(res):
+            self.last, self.last_t = res, now
+            self.fails = 0
+            self._backoff = self.backoff_s
+            return True
+        self.errors += 1
+        self._fail(now)
+        return False
+
+    def _fail(self, now, stuck=False):
+        self.fails += 1
+        if self.fails < self.max_fail or now < self._next_reinit:
+            return
+        print(f"[SENS] {self.name}: {self.fails} consecutive failures → reinit "
+              f"(next in ≥{self._backoff:.0f}s){' [thread stuck]' if stuck else ''}")
+        self.reinits += 1
+        self._reinit = True
+        self._next_reinit = now + self._backoff
+        self._backoff = min(self._backoff * 2, self.max_backoff_s)
+        self.fails = 0
+        if self._busy:              # thread incastrato: lo si abbandona e se ne avvia uno nuovo,
+            self._start(recover=True)   # che controlla il bus prima di tutto
+
+    def _cached(self, now):
+        if self.last_t is None:
+            return None, None
+        return self.last, round(now - self.last_t, 1)
+
+    def counters(self):
+        return dict(timeouts=self.timeouts, errors=self.errors, reinits=self.reinits)
+
+
+def _valid_pair(v):
+    return v[0] is not None or v[1] is not None
+
+def _valid_mag(v):
+    return v[0] is not None
+
+# Worker condivisi del processo (thread avviati alla prima lettura)
+WORKERS = {
+    "shtc3": SensorWorker("shtc3", read_shtc3, _valid_pair, lambda: reset_sensor("shtc3")),
+    # FIFO vuota ([]) è una risposta valida: a rate > ODR capita a ogni tick
+    "lps22hb": SensorWorker("lps22hb", read_lps22hb_samples, lambda v: True, lambda: reset_sensor("lps22hb")),
+    "icm": SensorWorker("icm", read_icm20948_mag, _valid_mag, lambda: reset_sensor("icm")),
+}
+
+def recover_bus():
+    """
+    Se il bus condiviso è piantato (lock tenuto oltre I2C_LOCK_TIMEOUT_S) lo abbandona, ne
+    apre uno nuovo e dimentica i driver HAT legati al vecchio. True se l'ha riaperto.
+    Va chiamata da un thread che non sta usando il bus.
+    """
+    bus = get_bus()
+    if not bus.wedged():
+        return False
+    reopen_bus(bus)
+    for n in WORKERS:
+        reset_sensor(n)
+    return True
+
+_SNAPSHOTS = {}
+
+def _snapshot(names):
+    # i reinit richiesti dai worker per sensore si fanno qui, nel thread che usa il bus
+    # (se il thread precedente era incastrato, questo è quello nuovo: vedi recover_bus)
+    for n in names:
+        w = WORKERS[n]
+        if w._reinit and w.reset is not None:
+            w._reinit = False
+            try:
+                w.reset()
+            except Exception as e:
+                print(f"[SENS] {n} reset error: {e}")
+    return read_snapshot(names)
+
+def read_all(names=("shtc3", "lps22hb", "icm")):
+    """
+    {nome: (valore, età_s)} per più sensori letti in un solo giro pipeline sul bus.
+    Su scadenza della snapshot ogni sensore conta un timeout e risponde dalla sua cache.
+    """
+    names = tuple(names)
+    snap = _SNAPSHOTS.get(names)
+    if snap is None:
+        snap = _SNAPSHOTS[names] = SensorWorker("+".join(names), lambda: _snapshot(names),
+                                                lambda v: True)
+    res, age = snap.read()
+    fresh = age == 0.0
+    return {n: WORKERS[n].offer(res.get(n) if fresh else None, timeout=not fresh) for n in names}
+
+def read_one(name):
+    """(valore, età_s) di un solo sensore dal suo worker, con la stessa scadenza di read()."""
+    return WORKERS[name].read()
+
+def faults(prev=None):
+    """Somma timeouts+errori di tutti i worker (assoluta, o dalla snapshot prev)."""
+    cur = {n: w.timeouts + w.errors for n, w in WORKERS.items()}
+    return cur if prev is None else sum(cur[n] - prev.get(n, 0) for n in cur)
+
+
+if __name__ == "__main__":
+    from sensehat_b_reader import warmup
+    warmup()
+    for _ in range(20):
+        t0 = time.monotonic()
+        out = {n: w.read() for n, w in WORKERS.items()}
+        print(f"{(time.monotonic() - t0) * 1000:.0f} ms", out)
+        time.sleep(1)
+    print({n: w.counters() for n, w in WORKERS.items()})
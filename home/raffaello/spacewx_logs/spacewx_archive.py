@@ -1,114 +1,1297 @@
 #!/usr/bin/env python3
-import os, gzip, sqlite3, csv
-from datetime import datetime, timezone, timedelta
+import os, gzip, sqlite3, csv, sys, time, glob, hashlib, calendar, queue, multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, closing, ExitStack
+from datetime import datetime, timezone
+from collections import defaultdict
+from itertools import islice
+from math import fsum
+from statistics import quantiles
+from rf_sketch import merge_strs
+import colblock
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    _HAS_PYARROW = True
+except Exception:
+    _HAS_PYARROW = False
 
 LOGDIR = os.environ.get("LOGDIR", "/home/raffaello/spacewx_logs")
 DB = os.path.join(LOGDIR, "spacewx.db")
 BASE = "wifi_gps_kp_qos"
 
+# Archivio partizionato: spacewx.db è il catalogo (manifest, rollup orari/giornalieri, RF,
+# elenco partizioni); le righe raw e i livelli 1m/5m stanno in un file per mese in PART_DIR.
+# I mesi chiusi da ARCH_SEAL_DAYS giorni vengono sigillati: VACUUM, journal DELETE (un solo
+# file), sola lettura, sha256 nel catalogo. Un backup/VACUUM/verifica tocca un mese alla volta.
+PART_DIR = os.path.join(LOGDIR, "archive")
+ARCH_SEAL_DAYS = int(os.environ.get("ARCH_SEAL_DAYS", "7"))
+# Storico freddo: i mesi sigillati finiti da ARCH_COLD_DAYS giorni tengono raw solo come
+# blocchi compressi per giorno e colonna (colblock, tabella cold); 0 = mai.
+ARCH_COLD_DAYS = int(os.environ.get("ARCH_COLD_DAYS", "365"))
+
+# Copia colonnare opzionale (pyarrow): un Parquet per giorno, tipizzato, zstd, colonne di testo
+# a dizionario, righe ordinate per (band, ts_ms) così ogni row group ha min/max stretti su
+# band e tempo. Le statistiche si scrivono solo per ts_ms, band, kp (footer piccolo).
+ARCH_PARQUET = os.environ.get("ARCH_PARQUET", "0") != "0"
+PARQUET_DIR = os.environ.get("PARQUET_DIR", os.path.join(LOGDIR, "parquet"))
+PARQUET_ROW_GROUP = int(os.environ.get("ARCH_PARQUET_ROW_GROUP", "4096"))
+PARQUET_STATS = ["ts_ms", "band", "kp"]
+
 SCHEMA = """
 PRAGMA journal_mode=WAL;
-CREATE TABLE IF NOT EXISTS raw (
-  ts_iso TEXT, kp REAL, kp_when TEXT,
-  gps_fix TEXT, lat REAL, lon REAL, alt REAL,
-  pdop REAL, hdop REAL, vdop REAL, sv_used INTEGER, sv_tot INTEGER, cn0_mean REAL,
-  mode TEXT, freq INTEGER, noise_dbm REAL, busy_ratio REAL, 
-  scan_n INTEGER, scan_p50 REAL, scan_p10 REAL, scan_p90 REAL, band TEXT,
-  tec REAL, tec_source TEXT,
-  t_c REAL, rh_pct REAL, p_hpa REAL,
-  mag_x_counts REAL, mag_y_counts REAL, mag_z_counts REAL, mag_norm_counts REAL
+-- partizioni mensili: [t0_ms, t1_ms), file relativo a LOGDIR
+CREATE TABLE IF NOT EXISTS partitions (
+  month TEXT PRIMARY KEY, file TEXT, t0_ms INTEGER, t1_ms INTEGER,
+  rows INTEGER, sealed INTEGER DEFAULT 0, sha256 TEXT, sealed_at TEXT, cold INTEGER DEFAULT 0
+);
+-- percentili RSSI da sketch fusi; freq=0 → tutti i canali della banda
+CREATE TABLE IF NOT EXISTS rollup_rf_hourly (
+  hour_utc TEXT, band TEXT, freq INTEGER,
+  n INTEGER, p10 REAL, p50 REAL, p90 REAL, sketch TEXT,
+  PRIMARY KEY (hour_utc, band, freq)
 );
-CREATE INDEX IF NOT EXISTS idx_raw_ts ON raw(ts_iso);
-CREATE INDEX IF NOT EXISTS idx_raw_freq ON raw(freq);
+CREATE TABLE IF NOT EXISTS rollup_rf_daily (
+  day_utc TEXT, band TEXT, freq INTEGER,
+  n INTEGER, p10 REAL, p50 REAL, p90 REAL, sketch TEXT,
+  PRIMARY KEY (day_utc, band, freq)
+);
+-- file giornalieri già importati (path relativo a LOGDIR): ri-eseguire l'import è un no-op;
+-- size/mtime_ns del file hashato: se cambiano la scoperta notturna ricontrolla lo sha256
+CREATE TABLE IF NOT EXISTS ingest_manifest (
+  file TEXT PRIMARY KEY, sha256 TEXT, rows INTEGER, imported_at TEXT,
+  size INTEGER, mtime_ns INTEGER
+);
+-- ore (epoch ms di inizio ora) con righe nuove non ancora aggregate
+CREATE TABLE IF NOT EXISTS rollup_dirty (hour_ms INTEGER PRIMARY KEY);
+"""
+
+# aggregati per (periodo, banda, modo, metrica); band=mode='*' → metriche di ciclo (env/mag/kp…).
+# Livelli 1 min / 5 min / 1 h / 1 d: il web sceglie il più grosso che dà ~N punti (vedi app.py).
+# 1m/5m: chiave t_ms (inizio bucket) e PK per serie → una lettura è una scansione contigua.
+# 1m/5m nelle partizioni, 1h/1d nel catalogo (pochi, coprono tutto lo storico).
+# Nelle partizioni metrica/banda/modo sono id di `dim` (come le dimensioni di rf) e un bucket
+# con un solo valore (n=1: quasi tutte le metriche di ciclo a 1 min) tiene solo mean, le altre
+# statistiche NULL: chi legge usa COALESCE(stat, mean).
+FINE_SCHEMA = "".join(f"""
+CREATE TABLE IF NOT EXISTS {t} (
+  metric_id INTEGER, band_id INTEGER, mode_id INTEGER, t_ms INTEGER,
+  n INTEGER, mean REAL, min REAL, max REAL, p10 REAL, p50 REAL, p90 REAL,
+  PRIMARY KEY (metric_id, band_id, mode_id, t_ms)
+) WITHOUT ROWID;""" for t in ("rollup_1m", "rollup_5m"))
+ROLLUP_SCHEMA = """
 CREATE TABLE IF NOT EXISTS rollup_hourly (
-  hour_utc TEXT PRIMARY KEY,
-  kp_avg REAL, kp_max REAL,
-  tec_avg REAL, tec_max REAL,
-  noise_dbm_avg REAL, busy_ratio_avg REAL
+  hour_utc TEXT, band TEXT, mode TEXT, metric TEXT,
+  n INTEGER, mean REAL, min REAL, max REAL, p10 REAL, p50 REAL, p90 REAL,
+  PRIMARY KEY (hour_utc, band, mode, metric)
 );
 CREATE TABLE IF NOT EXISTS rollup_daily (
-  day_utc TEXT PRIMARY KEY,
-  kp_avg REAL, kp_max REAL,
-  tec_avg REAL, tec_max REAL,
-  noise_dbm_avg REAL, busy_ratio_avg REAL
+  day_utc TEXT, band TEXT, mode TEXT, metric TEXT,
+  n INTEGER, mean REAL, min REAL, max REAL, p10 REAL, p50 REAL, p90 REAL,
+  PRIMARY KEY (day_utc, band, mode, metric)
+);
+CREATE INDEX IF NOT EXISTS idx_rollup_hourly_series ON rollup_hourly(metric, band, mode, hour_utc);
+CREATE INDEX IF NOT EXISTS idx_rollup_daily_series ON rollup_daily(metric, band, mode, day_utc);
+"""
+
+# livelli sotto l'ora: (secondi, tabella)
+ROLLUP_FINE_TIERS = [(60, "rollup_1m"), (300, "rollup_5m")]
+
+# metriche RF: una riga per canale, aggregate per (banda, modo)
+ROLLUP_RF_METRICS = ["noise_dbm", "busy_ratio", "scan_n", "scan_p10", "scan_p50", "scan_p90"]
+# metriche di ciclo: uguali su tutte le righe dello stesso ts, contate una volta per ciclo
+ROLLUP_CYCLE_METRICS = [
+    "kp", "tec", "cn0_mean", "pdop", "hdop", "vdop", "sv_used",
+    "t_c", "t_c_min", "t_c_max", "t_c_std",
+    "rh_pct", "rh_pct_min", "rh_pct_max", "rh_pct_std",
+    "p_hpa", "p_hpa_min", "p_hpa_max", "p_hpa_std",
+    "mag_norm_counts", "mag_norm_min", "mag_norm_max", "mag_norm_std",
+    "mag_bx_ut", "mag_by_ut", "mag_bz_ut", "mag_b_ut", "mag_b_std_ut", "mag_b_min_ut", "mag_b_max_ut",
+    "mag_dbdt_max_nts", "mag_dbdt_rms_nts",
+    "light_lux", "light_cct_k", "vin_mean_v", "vin_min_v", "vin_dips",
+]
+
+HOUR_MS = 3600 * 1000
+DAY_MS = 24 * HOUR_MS
+
+# colonne della prima versione di raw
+RAW_BASE = [
+    ("ts_iso", "TEXT"), ("kp", "REAL"), ("kp_when", "TEXT"),
+    ("gps_fix", "TEXT"), ("lat", "REAL"), ("lon", "REAL"), ("alt", "REAL"),
+    ("pdop", "REAL"), ("hdop", "REAL"), ("vdop", "REAL"),
+    ("sv_used", "INTEGER"), ("sv_tot", "INTEGER"), ("cn0_mean", "REAL"),
+    ("mode", "TEXT"), ("freq", "INTEGER"), ("noise_dbm", "REAL"), ("busy_ratio", "REAL"),
+    ("scan_n", "INTEGER"), ("scan_p50", "REAL"), ("scan_p10", "REAL"), ("scan_p90", "REAL"),
+    ("band", "TEXT"), ("tec", "REAL"), ("tec_source", "TEXT"),
+    ("t_c", "REAL"), ("rh_pct", "REAL"), ("p_hpa", "REAL"),
+    ("mag_x_counts", "REAL"), ("mag_y_counts", "REAL"), ("mag_z_counts", "REAL"),
+    ("mag_norm_counts", "REAL"),
+]
+
+# colonne aggiunte dopo la prima versione dello schema (ALTER TABLE anche su DB esistenti)
+RAW_MIGRATIONS = [
+    ("scan_sketch", "TEXT"),
+    ("gps_n_tpv", "INTEGER"), ("gps_n_3d", "INTEGER"), ("gps_n_2d", "INTEGER"),
+    ("gps_n_nofix", "INTEGER"), ("gps_dropouts", "INTEGER"),
+    ("gps_h_std_m", "REAL"), ("gps_v_std_m", "REAL"), ("gps_h_span_m", "REAL"),
+    ("gps_eph_mean", "REAL"), ("gps_eph_max", "REAL"),
+    ("gps_epv_mean", "REAL"), ("gps_epv_max", "REAL"),
+    ("gps_h_drift_m", "REAL"), ("gps_v_drift_m", "REAL"),
+    ("sky_gps_used", "INTEGER"), ("sky_gps_tot", "INTEGER"), ("sky_gps_cn0", "REAL"),
+    ("sky_glo_used", "INTEGER"), ("sky_glo_tot", "INTEGER"), ("sky_glo_cn0", "REAL"),
+    ("sky_gal_used", "INTEGER"), ("sky_gal_tot", "INTEGER"), ("sky_gal_cn0", "REAL"),
+    ("sky_bds_used", "INTEGER"), ("sky_bds_tot", "INTEGER"), ("sky_bds_cn0", "REAL"),
+    ("sky_cn0_lo_el", "REAL"), ("sky_cn0_hi_el", "REAL"),
+    ("p_hpa_min", "REAL"), ("p_hpa_max", "REAL"),
+    ("t_c_min", "REAL"), ("t_c_max", "REAL"), ("t_c_std", "REAL"),
+    ("rh_pct_min", "REAL"), ("rh_pct_max", "REAL"), ("rh_pct_std", "REAL"),
+    ("p_hpa_std", "REAL"),
+    ("mag_norm_min", "REAL"), ("mag_norm_max", "REAL"), ("mag_norm_std", "REAL"),
+    ("env_n", "INTEGER"),
+    ("mag_bx_ut", "REAL"), ("mag_by_ut", "REAL"), ("mag_bz_ut", "REAL"), ("mag_b_ut", "REAL"),
+    ("mag_b_std_ut", "REAL"), ("mag_b_min_ut", "REAL"), ("mag_b_max_ut", "REAL"),
+    ("mag_dbdt_max_nts", "REAL"), ("mag_dbdt_rms_nts", "REAL"),
+    ("mag_n_1s", "INTEGER"), ("mag_rate_hz", "INTEGER"), ("mag_cpu_pct", "REAL"),
+    ("shtc3_age_s", "REAL"), ("lps_age_s", "REAL"), ("mag_age_s", "REAL"), ("sensor_faults", "INTEGER"),
+    ("light_lux", "REAL"), ("light_lux_min", "REAL"), ("light_lux_max", "REAL"),
+    ("light_cct_k", "INTEGER"), ("light_reads", "INTEGER"),
+    ("vin_mean_v", "REAL"), ("vin_min_v", "REAL"), ("vin_dips", "INTEGER"),
+    ("vaux_mean_v", "REAL"), ("vaux_min_v", "REAL"), ("supply_n", "INTEGER"), ("pi_uv", "INTEGER"),
+    ("ts_ms", "INTEGER"),                 # epoch ms UTC da ts_iso: chiave temporale (vedi iso_ms)
+]
+
+# --- schema normalizzato delle partizioni ---
+# Un ciclo del logger scrive una riga per (modo, canale) ripetendo tutto il resto. Su disco:
+#   rf     una riga per (ts_ms, modo, canale): solo le colonne radio
+#   cycle  una riga per ciclo: ts_iso e id dello slot Kp/TEC
+#   sw     una riga per combinazione Kp/kp_when/TEC/tec_source (cambia ogni 5 min..3 h)
+#   gps    una riga per ciclo: fix, DOP, satelliti, qualità (gps_*, sky_*)
+#   env    una riga per ciclo: tutto il resto (sensori, luce, alimentazione, colonne future)
+#   dim    i testi ripetuti (modo, banda, fix, kp_when, tec_source) come id interi, 0 = NULL
+# raw è una vista con le colonne e i nomi di sempre: le query esistenti non cambiano.
+RAW_ALL = RAW_BASE + RAW_MIGRATIONS
+NORM_DIMS = {"mode", "band", "gps_fix", "kp_when", "tec_source"}
+NORM_RF = ["mode", "freq", "noise_dbm", "busy_ratio", "scan_n", "scan_p50", "scan_p10",
+           "scan_p90", "band", "scan_sketch"]
+NORM_SW = ["kp", "kp_when", "tec", "tec_source"]
+NORM_GPS = [c for c, _ in RAW_ALL
+            if c in ("gps_fix", "lat", "lon", "alt", "pdop", "hdop", "vdop", "sv_used", "sv_tot",
+                     "cn0_mean") or c.startswith(("gps_", "sky_"))]
+NORM_ENV = [c for c, _ in RAW_ALL
+            if c not in NORM_RF + NORM_SW + NORM_GPS + ["ts_iso", "ts_ms"]]
+
+def _norm_cols(names):
+    """Colonne raw → colonne della tabella normalizzata (i testi di NORM_DIMS diventano <col>_id)."""
+    types = dict(RAW_ALL)
+    return [(f"{c}_id", "INTEGER") if c in NORM_DIMS else (c, types[c]) for c in names]
+
+# storico freddo: un blocco colblock per (giorno UTC, colonna di raw), righe in ordine ts_ms, modo, canale
+COLD_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cold (
+  day_ms INTEGER, col TEXT, n INTEGER, data BLOB, PRIMARY KEY (day_ms, col)
 );
 """
+# codifica per colonna: 'T' tempo, 'E' testi a dizionario, 'Z' testi liberi, 'N' numeri
+# (i blocchi 'F' dei mesi congelati prima si leggono ancora)
+COLD_COLS = [(c, "T" if c == "ts_ms" else ("E" if c in NORM_DIMS else "Z") if t == "TEXT" else "N")
+             for c, t in RAW_ALL]
+
+# (tabella, colonne chiave, colonne dati): le colonne dati si aggiungono con ALTER TABLE
+PART_TABLES = [
+    ("cycle", [("ts_ms", "INTEGER PRIMARY KEY")], [("ts_iso", "TEXT"), ("sw_id", "INTEGER")]),
+    ("sw", [("id", "INTEGER PRIMARY KEY")], _norm_cols(NORM_SW)),
+    ("gps", [("ts_ms", "INTEGER PRIMARY KEY")], _norm_cols(NORM_GPS)),
+    ("env", [("ts_ms", "INTEGER PRIMARY KEY")], _norm_cols(NORM_ENV)),
+]
+
+PART_SCHEMA = "PRAGMA journal_mode=WAL;\n" + "".join(
+    f"CREATE TABLE IF NOT EXISTS {t} ({', '.join(f'{c} {ty}' for c, ty in key + data)});\n"
+    for t, key, data in PART_TABLES) + f"""
+CREATE TABLE IF NOT EXISTS dim (id INTEGER PRIMARY KEY, value TEXT NOT NULL UNIQUE);
+-- chiave naturale di raw: modo e canale mancanti valgono 0 (in una PRIMARY KEY niente NULL).
+-- Anche le letture per banda scorrono la PK su ts_ms (il filtro sulla banda toglie al più
+-- metà delle righe dell'intervallo): un indice (band_id, mode_id, ts_ms) costava da un quarto
+-- a metà di rf e il planner non lo usava
+CREATE TABLE IF NOT EXISTS rf (
+  ts_ms INTEGER NOT NULL, {", ".join(f"{c} {t}" for c, t in _norm_cols(NORM_RF))},
+  PRIMARY KEY (ts_ms, mode_id, freq)
+) WITHOUT ROWID;
+DROP INDEX IF EXISTS idx_rf_band_mode_ts;
+""" + FINE_SCHEMA + COLD_SCHEMA
+
+def _raw_view():
+    alias = {**{c: "r" for c in NORM_RF}, **{c: "s" for c in NORM_SW},
+             **{c: "g" for c in NORM_GPS}, **{c: "e" for c in NORM_ENV},
+             "ts_iso": "c", "ts_ms": "r"}
+    sel, joins = [], []
+    for c, _ in RAW_ALL:
+        if c in NORM_DIMS:
+            sel.append(f"d_{c}.value AS {c}")
+            joins.append(f"LEFT JOIN dim d_{c} ON d_{c}.id = {alias[c]}.{c}_id")
+        elif c == "freq":
+            sel.append("NULLIF(r.freq, 0) AS freq")
+        else:
+            sel.append(f"{alias[c]}.{c}")
+    return ("CREATE VIEW raw AS SELECT " + ", ".join(sel) +
+            " FROM rf r JOIN cycle c ON c.ts_ms = r.ts_ms"
+            " LEFT JOIN sw s ON s.id = c.sw_id"
+            " LEFT JOIN gps g ON g.ts_ms = r.ts_ms"
+            " LEFT JOIN env e ON e.ts_ms = r.ts_ms " + " ".join(joins))
+
+RAW_VIEW = _raw_view()
+
+def _ensure_part_columns(conn):
+    """Colonne nuove (RAW_MIGRATIONS) nelle tabelle normalizzate e vista raw allineata."""
+    for t, _, data in PART_TABLES:
+        have = {r[1] for r in conn.execute(f"PRAGMA table_info({t})")}
+        for col, typ in data:
+            if col not in have:
+                conn.execute(f"ALTER TABLE {t} ADD COLUMN {col} {typ}")
+                print(f"[ARCH] migrated {t}: +{col}")
+    have = {r[1] for r in conn.execute("PRAGMA table_info(rf)")}
+    for col, typ in _norm_cols(NORM_RF):
+        if col not in have:
+            conn.execute(f"ALTER TABLE rf ADD COLUMN {col} {typ}")
+            print(f"[ARCH] migrated rf: +{col}")
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE type='view' AND name='raw'").fetchone()
+    if not row or row[0] != RAW_VIEW:
+        with conn:
+            conn.execute("DROP VIEW IF EXISTS raw")
+            conn.execute(RAW_VIEW)
+
+def _ensure_columns(conn):
+    have = {r[1] for r in conn.execute("PRAGMA table_info(raw)")}
+    for col, typ in RAW_MIGRATIONS:
+        if col not in have:
+            conn.execute(f"ALTER TABLE raw ADD COLUMN {col} {typ}")
+            print(f"[ARCH] migrated raw: +{col}")
+
+def iso_ms(s):
+    """ISO 8601 ('Z', '+00:00' o altri offset; senza offset = UTC) → epoch ms UTC, None se illeggibile."""
+    if not s:
+        return None
+    try:
+        dt = datetime.fromisoformat(s.replace("Z", "+00:00"))
+    except (TypeError, ValueError):
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(round(dt.timestamp() * 1000))
+
+def _ensure_time_key(conn):
+    # righe importate prima di ts_ms (o con ts_iso scritto a mano): si ricava da ts_iso
+    conn.create_function("iso_ms", 1, iso_ms, deterministic=True)
+    with conn:
+        n = conn.execute("UPDATE raw SET ts_ms = iso_ms(ts_iso) "
+                         "WHERE ts_ms IS NULL AND ts_iso IS NOT NULL").rowcount
+        conn.execute("DROP INDEX IF EXISTS idx_raw_ts")      # ts_iso testuale: sostituito da ts_ms
+    if n:
+        print(f"[ARCH] migrated raw: ts_ms for {n} rows")
+
+def _text_fine(conn):
+    """rollup_1m/5m con metrica/banda/modo testo (versioni precedenti): da rifare a id di dim."""
+    return "metric" in {r[1] for r in conn.execute("PRAGMA table_info(rollup_1m)")}
+
+def _is_legacy(conn):
+    """raw come tabella (una riga piena per modo/canale): partizioni e DB delle versioni precedenti."""
+    row = conn.execute("SELECT type FROM sqlite_master WHERE name='raw'").fetchone()
+    return bool(row) and row[0] == "table"
+
+def _setup_raw(conn):
+    """Schema normalizzato di una partizione; una raw tabella (versioni precedenti) si converte."""
+    legacy = _is_legacy(conn)
+    if legacy:
+        _ensure_columns(conn)
+        _ensure_time_key(conn)
+        conn.execute("ALTER TABLE raw RENAME TO raw_legacy")
+        conn.commit()
+    if _text_fine(conn):                  # 1m/5m a chiavi testuali: derivati, si rifanno
+        conn.execute("DROP TABLE rollup_1m")
+        conn.execute("DROP TABLE IF EXISTS rollup_5m")
+        conn.commit()
+    conn.executescript(PART_SCHEMA)
+    _ensure_part_columns(conn)
+    if legacy:
+        _normalize_legacy(conn)
+
+def _db_size(conn):
+    return conn.execute("PRAGMA page_count").fetchone()[0] * conn.execute("PRAGMA page_size").fetchone()[0]
+
+def _normalize_legacy(conn):
+    size = _db_size(conn)
+    t0 = time.monotonic()
+    with bulk_txn(conn):
+        cur = conn.cursor()
+        cur.execute(f"SELECT {', '.join(INGEST_COLS)} FROM raw_legacy ORDER BY ts_ms")
+        n, new = insert_rows(conn, cur)
+        conn.execute("DROP TABLE raw_legacy")
+    conn.execute("VACUUM")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    print(f"[ARCH] normalized raw: {n} rows ({n - new} duplicates dropped), "
+          f"{size / 1e6:.1f} → {_db_size(conn) / 1e6:.1f} MB in {time.monotonic() - t0:.1f}s")
+
+# --- partizioni mensili ---
+def month_of(ms):
+    return datetime.fromtimestamp(ms / 1000, timezone.utc).strftime("%Y-%m")
+
+def month_bounds(month):
+    """'YYYY-MM' → (t0_ms, t1_ms) del mese UTC."""
+    y, m = int(month[:4]), int(month[5:7])
+    t0 = calendar.timegm((y, m, 1, 0, 0, 0)) * 1000
+    y, m = (y + 1, 1) if m == 12 else (y, m + 1)
+    return t0, calendar.timegm((y, m, 1, 0, 0, 0)) * 1000
+
+def part_path(month):
+    return os.path.join(PART_DIR, f"spacewx_{month.replace('-', '')}.db")
+
+def read_partition(month, sealed=False):
+    """Connessione in sola lettura (immutable se sigillata: niente lock né file -wal)."""
+    uri = f"file:{part_path(month)}?mode=ro" + ("&immutable=1" if sealed else "")
+    return sqlite3.connect(uri, uri=True)
+
+def open_partition(conn, month):
+    """
+    Connessione in scrittura alla partizione del mese: la crea e la registra nel catalogo se
+    manca; se era sigillata (dati tardivi, rebuild) la riapre: si risigilla al giro dopo.
+    """
+    row = conn.execute("SELECT sealed, cold FROM partitions WHERE month=?", (month,)).fetchone()
+    path = part_path(month)
+    if row and row[0]:
+        os.chmod(path, 0o644)
+        with conn:
+            conn.execute("UPDATE partitions SET sealed=0, sha256=NULL, sealed_at=NULL "
+                         "WHERE month=?", (month,))
+        print(f"[ARCH] reopened sealed partition {month}")
+    os.makedirs(PART_DIR, exist_ok=True)
+    pconn = sqlite3.connect(path)
+    _setup_raw(pconn)
+    if row and row[1]:
+        _thaw(pconn)
+        with conn:
+            conn.execute("UPDATE partitions SET cold=0 WHERE month=?", (month,))
+            n = _mark_dirty(conn, pconn)      # rollup_1m non c'è più: si rifà da raw
+        print(f"[ARCH] thawed cold partition {month} ({n} hours to rebuild)")
+    if row is None:
+        t0, t1 = month_bounds(month)
+        with conn:
+            conn.execute("INSERT INTO partitions(month, file, t0_ms, t1_ms, rows, sealed) "
+                         "VALUES (?,?,?,?,0,0)", (month, os.path.relpath(path, LOGDIR), t0, t1))
+    return pconn
+
+def seal_partition(conn, month):
+    """Mese chiuso: ANALYZE + VACUUM, journal DELETE, file in sola lettura, sha256 nel catalogo."""
+    path = part_path(month)
+    p = sqlite3.connect(path)
+    rows = p.execute("SELECT (SELECT COUNT(*) FROM rf) + "
+                     "IFNULL((SELECT SUM(n) FROM cold WHERE col='ts_ms'), 0)").fetchone()[0]
+    p.execute("ANALYZE")
+    p.commit()
+    p.execute("PRAGMA journal_mode=DELETE")   # un solo file: apribile immutable, copiabile da solo
+    p.execute("VACUUM")
+    p.close()
+    os.chmod(path, 0o444)
+    sha = file_sha256(path)
+    with conn:
+        conn.execute("UPDATE partitions SET sealed=1, rows=?, sha256=?, sealed_at=? WHERE month=?",
+                     (rows, sha, datetime.now(timezone.utc).isoformat(), month))
+    print(f"[ARCH] sealed {month}: {rows} rows, {os.path.getsize(path) / 1e6:.1f} MB, "
+          f"sha256 {sha[:12]}")
+
+def seal_old_partitions(conn, now_ms=None):
+    """Sigilla i mesi finiti da più di ARCH_SEAL_DAYS giorni senza ore ancora da aggregare."""
+    now_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+    cutoff = now_ms - ARCH_SEAL_DAYS * DAY_MS
+    out = []
+    for month, t0, t1 in conn.execute("SELECT month, t0_ms, t1_ms FROM partitions "
+                                      "WHERE sealed=0 AND t1_ms <= ? ORDER BY month",
+                                      (cutoff,)).fetchall():
+        if conn.execute("SELECT 1 FROM rollup_dirty WHERE hour_ms >= ? AND hour_ms < ? LIMIT 1",
+                        (t0, t1)).fetchone():
+            continue
+        seal_partition(conn, month)
+        out.append(month)
+    return out
+
+def cold_columns(p, day_ms, cols=None):
+    """{colonna: valori decodificati} del giorno dallo storico freddo ({} se non c'è)."""
+    q = "SELECT col, data FROM cold WHERE day_ms=?"
+    args = [day_ms]
+    if cols is not None:
+        q += f" AND col IN ({','.join('?' * len(cols))})"
+        args += list(cols)
+    return {c: colblock.decode(d) for c, d in p.execute(q, args)}
+
+def _cold_rows(p, day_ms):
+    """Righe del giorno nel formato raw (colonne RAW_ALL) dallo storico freddo."""
+    cols = cold_columns(p, day_ms)
+    if not cols:
+        return []
+    n = len(cols["ts_ms"])
+    return list(zip(*(colblock.to_python(cols[c], integer=(t == "INTEGER")) if c in cols
+                      else [None] * n for c, t in RAW_ALL)))
+
+def _has_cold(p):
+    return bool(p.execute("SELECT 1 FROM sqlite_master WHERE name='cold'").fetchone())
+
+def _thaw(pconn):
+    """Storico freddo → tabelle normalizzate (dati tardivi o rebuild su un mese freddo)."""
+    days = [r[0] for r in pconn.execute("SELECT DISTINCT day_ms FROM cold ORDER BY day_ms")]
+    with bulk_txn(pconn):
+        for d in days:
+            insert_rows(pconn, _cold_rows(pconn, d), cols=[c for c, _ in RAW_ALL])
+        pconn.execute("DELETE FROM cold")
+
+def freeze_partition(conn, month):
+    """
+    Mese sigillato → storico freddo: ogni giorno di raw diventa un blocco colblock per colonna,
+    le tabelle normalizzate si svuotano e il file si risigilla. rollup_1m si toglie (è il grosso
+    del file e si rifà dai blocchi scongelando; chi legge un mese freddo a 1 min decodifica
+    i blocchi del giorno), rollup_5m resta come righe per i grafici di settimane e mesi.
+    """
+    path = part_path(month)
+    os.chmod(path, 0o644)
+    size = os.path.getsize(path)
+    p = sqlite3.connect(path)
+    p.executescript(COLD_SCHEMA)
+    names = [c for c, _ in COLD_COLS]
+    days = [r[0] for r in p.execute(f"SELECT DISTINCT ts_ms - ts_ms % {DAY_MS} FROM cycle")]
+    with p:
+        for d in days:
+            rows = p.execute(f"SELECT {', '.join(names)} FROM raw WHERE ts_ms >= ? AND ts_ms < ? "
+                             f"ORDER BY ts_ms, mode, freq", (d, d + DAY_MS)).fetchall()
+            p.executemany("INSERT OR REPLACE INTO cold VALUES (?,?,?,?)",
+                          [(d, c, len(rows), colblock.encode(k, v))
+                           for (c, k), v in zip(COLD_COLS, zip(*rows))])
+        for t in ("rf", "cycle", "gps", "env", "rollup_1m"):
+            p.execute(f"DELETE FROM {t}")
+    p.close()
+    with conn:
+        conn.execute("UPDATE partitions SET cold=1 WHERE month=?", (month,))
+    seal_partition(conn, month)
+    print(f"[ARCH] froze {month}: {len(days)} days, "
+          f"{size / 1e6:.1f} → {os.path.getsize(path) / 1e6:.1f} MB")
+
+def freeze_old_partitions(conn, now_ms=None):
+    """Porta nello storico freddo i mesi sigillati finiti da più di ARCH_COLD_DAYS giorni."""
+    if ARCH_COLD_DAYS <= 0:
+        return []
+    now_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+    months = [r[0] for r in conn.execute(
+        "SELECT month FROM partitions WHERE sealed=1 AND cold=0 AND t1_ms <= ? ORDER BY month",
+        (now_ms - ARCH_COLD_DAYS * DAY_MS,))]
+    for month in months:
+        freeze_partition(conn, month)
+    return months
+
+def verify_partitions(conn):
+    """Ricalcola lo sha256 delle partizioni sigillate; ritorna i mesi che non tornano."""
+    bad = []
+    for month, sha in conn.execute("SELECT month, sha256 FROM partitions WHERE sealed=1 "
+                                   "ORDER BY month").fetchall():
+        path = part_path(month)
+        ok = os.path.exists(path) and file_sha256(path) == sha
+        print(f"[ARCH] verify {month}: {'ok' if ok else 'MISMATCH'}")
+        if not ok:
+            bad.append(month)
+    return bad
+
+def mark_all_dirty(conn):
+    """Tutte le ore presenti nelle partizioni da riaggregare (migrazione, o "rebuild" da CLI)."""
+    n = 0
+    for month, sealed in conn.execute("SELECT month, sealed FROM partitions").fetchall():
+        p = read_partition(month, sealed)
+        n += _mark_dirty(conn, p)
+        p.close()
+    return n
+
+def _mark_dirty(conn, p):
+    """Ore con dati nella partizione `p` (anche fredde) segnate sporche nel catalogo."""
+    hours = {r[0] for r in p.execute(f"SELECT DISTINCT ts_ms - ts_ms % {HOUR_MS} FROM cycle")}
+    if _has_cold(p):
+        for (blk,) in p.execute("SELECT data FROM cold WHERE col='ts_ms'"):
+            hours.update(t - t % HOUR_MS for t in colblock.to_python(colblock.decode(blk)))
+    return conn.executemany("INSERT OR IGNORE INTO rollup_dirty VALUES (?)",
+                            [(h,) for h in hours]).rowcount
+
+def _migrate_monolith(conn):
+    """spacewx.db con raw dentro (versioni precedenti): righe spostate nelle partizioni mensili."""
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='raw'").fetchone():
+        return
+    _ensure_columns(conn)
+    _ensure_time_key(conn)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_raw_ts_ms ON raw(ts_ms)")   # letture per mese
+    conn.commit()
+    months = [r[0] for r in conn.execute(
+        "SELECT DISTINCT strftime('%Y-%m', ts_ms / 1000, 'unixepoch') FROM raw "
+        "WHERE ts_ms IS NOT NULL ORDER BY 1")]
+    for month in months:
+        t0, t1 = month_bounds(month)
+        p = open_partition(conn, month)
+        with bulk_txn(p):
+            _, n = insert_rows(p, conn.execute(f"SELECT {', '.join(INGEST_COLS)} FROM raw "
+                                               f"WHERE ts_ms >= ? AND ts_ms < ?", (t0, t1)))
+        p.close()
+        with conn:
+            conn.execute("UPDATE partitions SET rows = rows + ? WHERE month=?", (n, month))
+        print(f"[ARCH] migrated raw → partition {month}: {n} rows")
+    # livelli fini del catalogo (versione non partizionata): si rifanno nelle partizioni
+    with conn:
+        conn.execute("DROP TABLE raw")
+        conn.execute("DROP TABLE IF EXISTS rollup_1m")
+        conn.execute("DROP TABLE IF EXISTS rollup_5m")
+        n = mark_all_dirty(conn)
+    conn.execute("VACUUM")
+    print(f"[ARCH] migrated to {len(months)} monthly partitions ({n} hours to rebuild)")
+
+def _normalize_partitions(conn):
+    """
+    Partizioni con raw ancora tabella, 1m/5m a chiavi testuali o l'indice di banda su rf:
+    convertite (le sigillate si riaprono e risigillano); i livelli fini si rifanno dalle ore
+    segnate sporche. Nelle fredde rf è vuota: l'indice si toglie quando si scongelano.
+    """
+    for month, sealed, cold in conn.execute("SELECT month, sealed, cold FROM partitions").fetchall():
+        if not os.path.exists(part_path(month)):
+            continue
+        p = read_partition(month, sealed)
+        legacy, fine = _is_legacy(p), _text_fine(p)
+        idx = not cold and bool(p.execute("SELECT 1 FROM sqlite_master "
+                                          "WHERE name='idx_rf_band_mode_ts'").fetchone())
+        p.close()
+        if legacy or fine or idx:
+            print(f"[ARCH] normalizing partition {month}")
+            with closing(open_partition(conn, month)) as p, conn:
+                n = _mark_dirty(conn, p) if fine else 0
+            if fine:
+                print(f"[ARCH] rollup_1m/5m of {month} keyed by dim ids ({n} hours to rebuild)")
+
+def _ensure_rollup_tables(conn):
+    have = {r[1] for r in conn.execute("PRAGMA table_info(rollup_hourly)")}
+    if "metric" in have:
+        return
+    # rollup_hourly/daily della prima versione (una colonna per metrica): dati derivati, si rifanno
+    conn.execute("DROP TABLE IF EXISTS rollup_hourly")
+    conn.execute("DROP TABLE IF EXISTS rollup_daily")
+    conn.executescript(ROLLUP_SCHEMA)
+    n = mark_all_dirty(conn)
+    conn.commit()
+    print(f"[ARCH] migrated rollups: per band/mode/metric ({n} hours to rebuild)")
 
 def connect():
+    """Catalogo (spacewx.db); le partizioni si aprono con open_partition/read_partition."""
     conn = sqlite3.connect(DB)
     conn.executescript(SCHEMA)
+    if "cold" not in {r[1] for r in conn.execute("PRAGMA table_info(partitions)")}:
+        conn.execute("ALTER TABLE partitions ADD COLUMN cold INTEGER DEFAULT 0")
+        conn.commit()
+    have = {r[1] for r in conn.execute("PRAGMA table_info(ingest_manifest)")}
+    for col in ("size", "mtime_ns"):      # righe vecchie NULL: si ri-hashano una volta
+        if col not in have:
+            conn.execute(f"ALTER TABLE ingest_manifest ADD COLUMN {col} INTEGER")
+    conn.commit()
+    _migrate_monolith(conn)
+    _normalize_partitions(conn)
+    _ensure_rollup_tables(conn)
+    conn.executescript(ROLLUP_SCHEMA)
     return conn
 
-def import_yesterday(conn):
-    COLS = [
-        "ts_iso","kp","kp_when",
-        "gps_fix","lat","lon","alt",
-        "pdop","hdop","vdop","sv_used","sv_tot","cn0_mean",
-        "mode","freq","noise_dbm","busy_ratio",
-        "scan_n","scan_p50","scan_p10","scan_p90","band",
-        "tec","tec_source","t_c","rh_pct","p_hpa",
-        "mag_x_counts","mag_y_counts","mag_z_counts","mag_norm_counts"
-
-    ]
-    y = datetime.now(timezone.utc) - timedelta(days=1)
-    ypath = os.path.join(LOGDIR, "daily", y.strftime("%Y"), y.strftime("%m"),
-                         f"{BASE}_{y.strftime('%Y%m%d')}.csv.gz")
-    if not os.path.exists(ypath):
-        print(f"[ARCH] missing {ypath}")
-        return 0
+# colonne del CSV giornaliero del logger, nell'ordine di CSV_HEADER (i file vecchi ne hanno un prefisso);
+# all'import si aggiunge ts_ms (INGEST_COLS)
+COLS = [
+    "ts_iso","kp","kp_when",
+    "gps_fix","lat","lon","alt",
+    "pdop","hdop","vdop","sv_used","sv_tot","cn0_mean",
+    "mode","freq","noise_dbm","busy_ratio",
+    "scan_n","scan_p50","scan_p10","scan_p90","band",
+    "tec","tec_source","t_c","rh_pct","p_hpa",
+    "mag_x_counts","mag_y_counts","mag_z_counts","mag_norm_counts",
+    "scan_sketch",
+    "gps_n_tpv","gps_n_3d","gps_n_2d","gps_n_nofix","gps_dropouts",
+    "gps_h_std_m","gps_v_std_m","gps_h_span_m",
+    "gps_eph_mean","gps_eph_max","gps_epv_mean","gps_epv_max",
+    "gps_h_drift_m","gps_v_drift_m",
+    "sky_gps_used","sky_gps_tot","sky_gps_cn0","sky_glo_used","sky_glo_tot","sky_glo_cn0",
+    "sky_gal_used","sky_gal_tot","sky_gal_cn0","sky_bds_used","sky_bds_tot","sky_bds_cn0",
+    "sky_cn0_lo_el","sky_cn0_hi_el",
+    "p_hpa_min","p_hpa_max",
+    "t_c_min","t_c_max","t_c_std","rh_pct_min","rh_pct_max","rh_pct_std",
+    "p_hpa_std","mag_norm_min","mag_norm_max","mag_norm_std","env_n",
+    "mag_bx_ut","mag_by_ut","mag_bz_ut","mag_b_ut","mag_b_std_ut","mag_b_min_ut","mag_b_max_ut",
+    "mag_dbdt_max_nts","mag_dbdt_rms_nts","mag_n_1s","mag_rate_hz","mag_cpu_pct",
+    "shtc3_age_s","lps_age_s","mag_age_s","sensor_faults",
+    "light_lux","light_lux_min","light_lux_max","light_cct_k","light_reads",
+    "vin_mean_v","vin_min_v","vin_dips","vaux_mean_v","vaux_min_v","supply_n","pi_uv"
+]
+
+INGEST_COLS = COLS + ["ts_ms"]
+
+BULK_CHUNK = int(os.environ.get("ARCH_BULK_CHUNK", "5000"))   # righe per executemany
+ARCH_WORKERS = int(os.environ.get("ARCH_WORKERS", str(os.cpu_count() or 1)))   # parser paralleli
+ARCH_DAYS_PER_TXN = int(os.environ.get("ARCH_DAYS_PER_TXN", "8"))   # file per blocco/transazione
+# i parser passano le righe al processo principale a blocchi da ARCH_STREAM_ROWS, su una coda di
+# al più 2 blocchi per worker: in memoria restano ~3 blocchi per worker, non giorni interi
+ARCH_STREAM_ROWS = int(os.environ.get("ARCH_STREAM_ROWS", "1000"))
+
+# PRAGMA durante l'import massivo (ripristinati alla fine): niente fsync per pagina,
+# cache grande, temporanei in RAM. Il WAL resta: il web continua a leggere.
+BULK_PRAGMAS = (("synchronous", "OFF"), ("cache_size", "-65536"), ("temp_store", "MEMORY"))
+
+_NULLS = frozenset(("", "NaN", "nan", "None"))
+
 
-    placeholders = ",".join(["?"]*len(COLS))
-    ins = f"INSERT INTO raw({','.join(COLS)}) VALUES ({placeholders})"
+def _to_float(x):
+    try:
+        return float(x)
+    except ValueError:
+        return None
 
-    rows = 0
-    with gzip.open(ypath, "rt", newline="") as f, conn:
+def _to_int(x):
+    try:
+        return int(x)
+    except ValueError:
+        try:
+            return int(float(x))          # "3.0" scritto da versioni vecchie del logger
+        except ValueError:
+            return None
+
+def raw_types():
+    """{colonna: tipo dichiarato} di raw (REAL/INTEGER/TEXT)."""
+    return dict(RAW_BASE + RAW_MIGRATIONS)
+
+def _converters(types, cols):
+    """
+    Convertitori per colonna dal tipo dichiarato in raw: (veloci, tolleranti).
+    I veloci sono i builtin (float/int/str) e sollevano ValueError su un valore sporco;
+    i tolleranti lo trasformano in None e si usano solo per quella riga.
+    """
+    fast = {"REAL": float, "INTEGER": int}
+    safe = {"REAL": _to_float, "INTEGER": _to_int}
+    return ([fast.get(types.get(c), str) for c in cols],
+            [safe.get(types.get(c), str) for c in cols])
+
+def iter_csv_rows(path, types, cols=COLS, ts_ms=False):
+    """
+    Righe tipizzate (tuple nell'ordine di cols) da un CSV giornaliero, .csv o .csv.gz,
+    in streaming. Le colonne sono mappate per nome dall'header del file (mancanti → None).
+    ts_ms=True: in coda l'epoch ms ricavato da ts_iso (righe per INGEST_COLS).
+    """
+    fast, safe = _converters(types, cols)
+    nulls = _NULLS
+    its = cols.index("ts_iso") if ts_ms else None
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", newline="") as f:
         rdr = csv.reader(f)
-        header = next(rdr, None)  # scarta header del file
+        header = next(rdr, None) or []
+        pos = {c: i for i, c in enumerate(header)}
+        idx = [pos.get(c) for c in cols]
+        width = len(header)
+        prefix = header == cols[:width]   # caso normale: nessun riordino
+        pad = [""] * (len(cols) - width)
         for r in rdr:
-            # Normalizza lunghezza: taglia extra o aggiunge None se mancano campi
-            if len(r) > len(COLS):
-                r = r[:len(COLS)]
-            elif len(r) < len(COLS):
-                r = r + [None]*(len(COLS)-len(r))
-            # Converti "" o "NaN" in None per coerenza col JSON/DB
-            r = [None if (x == "" or x == "NaN") else x for x in r]
-            conn.execute(ins, r)
-            rows += 1
-    print(f"[ARCH] imported {rows} rows from {ypath}")
-    return rows
+            if not r:
+                continue
+            if prefix:
+                vals = r[:width] + pad if len(r) == width else (r + [""] * width)[:width] + pad
+            else:
+                vals = [r[i] if i is not None and i < len(r) else "" for i in idx]
+            try:
+                out = [None if x in nulls else c(x) for c, x in zip(fast, vals)]
+            except ValueError:
+                out = [None if x in nulls else c(x) for c, x in zip(safe, vals)]
+            if its is not None:
+                out.append(iso_ms(out[its]))
+            yield tuple(out)
+
+@contextmanager
+def bulk_txn(conn):
+    """Una transazione (ROLLBACK su eccezione) con BULK_PRAGMAS, ripristinati all'uscita."""
+    conn.commit()                         # i PRAGMA non cambiano dentro una transazione aperta
+    prev = {k: conn.execute(f"PRAGMA {k}").fetchone()[0] for k, _ in BULK_PRAGMAS}
+    for k, v in BULK_PRAGMAS:
+        conn.execute(f"PRAGMA {k}={v}")
+    try:
+        with conn:                        # BEGIN … COMMIT
+            yield conn
+    finally:
+        for k, v in prev.items():
+            conn.execute(f"PRAGMA {k}={v}")
+
+class _NormWriter(object):
+    """
+    Righe nel formato raw (colonne `cols`, con ts_ms) → tabelle normalizzate di una partizione.
+    write(upsert=True): le righe già presenti (stessa chiave) prendono i valori nuovi invece di
+    restare. Un solo writer per partizione: tiene la cache di dim e sw.
+    """
+
+    def __init__(self, conn, cols):
+        self.conn = conn
+        ix = {c: i for i, c in enumerate(cols)}
+        self.i_ts, self.i_iso = ix["ts_ms"], ix.get("ts_iso")
+        self.dim = dict(conn.execute("SELECT value, id FROM dim"))
+        sw = _norm_cols(NORM_SW)
+        self.sw = {tuple(r[1:]): r[0]
+                   for r in conn.execute(f"SELECT id, {', '.join(c for c, _ in sw)} FROM sw")}
+        # per gruppo: (indice nella riga o None, è una dimensione)
+        grp = lambda names: [(ix.get(c), c in NORM_DIMS) for c in names]
+        self.g_rf, self.g_sw = grp(NORM_RF), grp(NORM_SW)
+        self.g_gps, self.g_env = grp(NORM_GPS), grp(NORM_ENV)
+        self.i_freq = NORM_RF.index("freq")
+        self.i_mode = NORM_RF.index("mode")
+        def ins(t, names, key=("ts_ms",)):
+            sql = (f"INSERT {{}}INTO {t}({', '.join(names)}) "
+                   f"VALUES ({', '.join(['?'] * len(names))})")
+            return (sql.format("OR IGNORE "),
+                    sql.format("") + f" ON CONFLICT({', '.join(key)}) DO UPDATE SET " +
+                    ", ".join(f"{c}=excluded.{c}" for c in names if c not in key))
+        names = lambda ns: ["ts_ms"] + [c for c, _ in _norm_cols(ns)]
+        # (cycle, gps, env, rf) per upsert False/True
+        self.sql = list(zip(ins("cycle", ["ts_ms", "ts_iso", "sw_id"]), ins("gps", names(NORM_GPS)),
+                            ins("env", names(NORM_ENV)),
+                            ins("rf", names(NORM_RF), ("ts_ms", "mode_id", "freq"))))
+        self.sql_sw = (f"INSERT INTO sw({', '.join(c for c, _ in sw)}) "
+                       f"VALUES ({', '.join(['?'] * len(sw))})")
+        self.seen = set()                 # (ts, upsert) già scritti in cycle/gps/env
+        self.skipped = 0
+
+    def _id(self, v):
+        if v is None:
+            return 0
+        i = self.dim.get(v)
+        if i is None:
+            i = self.dim[v] = self.conn.execute("INSERT INTO dim(value) VALUES (?)", (v,)).lastrowid
+        return i
+
+    def _pick(self, r, grp):
+        return [(self._id(r[i]) if dim else r[i]) if i is not None else (0 if dim else None)
+                for i, dim in grp]
+
+    def write(self, block, upsert=False):
+        """Scrive un blocco nella transazione corrente; ritorna le righe rf scritte (nuove, o anche aggiornate con upsert)."""
+        rf, cyc, gps, env = [], [], [], []
+        for r in block:
+            ts = r[self.i_ts]
+            if ts is None:                # ts_iso illeggibile: nessuna chiave temporale
+                self.skipped += 1
+                continue
+            if (ts, upsert) not in self.seen:
+                self.seen.add((ts, upsert))
+                key = tuple(self._pick(r, self.g_sw))
+                sw = self.sw.get(key)
+                if sw is None:
+                    sw = self.sw[key] = self.conn.execute(self.sql_sw, key).lastrowid
+                cyc.append((ts, r[self.i_iso] if self.i_iso is not None else None, sw))
+                gps.append([ts] + self._pick(r, self.g_gps))
+                env.append([ts] + self._pick(r, self.g_env))
+            v = self._pick(r, self.g_rf)
+            if v[self.i_freq] is None:
+                v[self.i_freq] = 0
+            rf.append([ts] + v)
+        sql_cycle, sql_gps, sql_env, sql_rf = self.sql[upsert]
+        self.conn.executemany(sql_cycle, cyc)
+        self.conn.executemany(sql_gps, gps)
+        self.conn.executemany(sql_env, env)
+        return self.conn.executemany(sql_rf, rf).rowcount
+
+def insert_rows(conn, rows, cols=INGEST_COLS, chunk=BULK_CHUNK, upsert=False):
+    """
+    Righe nel formato raw → tabelle normalizzate, a blocchi (executemany da `chunk` righe) nella
+    transazione corrente. INSERT OR IGNORE: le righe già presenti (chiave ts_ms, modo, canale)
+    sono saltate, come i dati di ciclo già scritti. upsert=True (file corretto, sha256 cambiato):
+    ON CONFLICT DO UPDATE, le righe presenti prendono i valori del file. Ritorna (lette, nuove).
+    """
+    w = _NormWriter(conn, cols)
+    before = conn.execute("SELECT COUNT(*) FROM rf").fetchone()[0] if upsert else 0
+    n = new = 0
+    it = iter(rows)
+    while True:
+        block = list(islice(it, chunk))
+        if not block:
+            break
+        new += w.write(block, upsert)
+        n += len(block)
+    if w.skipped:
+        print(f"[ARCH] {w.skipped} rows without a readable ts_iso skipped")
+    if upsert:                            # rowcount conta anche gli aggiornamenti
+        new = conn.execute("SELECT COUNT(*) FROM rf").fetchone()[0] - before
+    return n, new
+
+def bulk_insert(conn, rows, cols=INGEST_COLS, chunk=BULK_CHUNK):
+    with bulk_txn(conn):
+        return insert_rows(conn, rows, cols, chunk)
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for blk in iter(lambda: f.read(1 << 20), b""):
+            h.update(blk)
+    return h.hexdigest()
+
+def _manifest_key(path):
+    return os.path.relpath(os.path.abspath(path), LOGDIR)
+
+def _file_day(path):
+    """wifi_gps_kp_qos_YYYYMMDD.csv[.gz] → 'YYYY-MM-DD' (None se il nome non è un giornaliero)."""
+    d = os.path.basename(path)[len(BASE) + 1:len(BASE) + 9]
+    return f"{d[:4]}-{d[4:6]}-{d[6:]}" if len(d) == 8 and d.isdigit() else None
+
+def daily_path(day):
+    return os.path.join(LOGDIR, "daily", day.strftime("%Y"), day.strftime("%m"),
+                        f"{BASE}_{day.strftime('%Y%m%d')}.csv.gz")
+
+def pending_files(conn):
+    """
+    CSV giornalieri compressi (giorni chiusi) da importare, in ordine di data: quelli non ancora
+    nel manifest e quelli con dimensione o mtime diversi da quando sono stati hashati. Per
+    questi decide lo sha256: contenuto cambiato → si reimporta (upsert in catch_up), uguale
+    (file solo toccato) → si aggiorna lo stat nel manifest e non si rilegge più.
+    """
+    known = {r[0]: r[1:] for r in conn.execute(
+        "SELECT file, sha256, size, mtime_ns FROM ingest_manifest")}
+    today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    out, touched = [], []
+    for p in glob.glob(os.path.join(LOGDIR, "daily", "*", "*", f"{BASE}_*.csv.gz")):
+        day = _file_day(p)
+        if not day or day >= today:
+            continue
+        key = _manifest_key(p)
+        if key not in known:
+            out.append(p)
+            continue
+        sha, size, mtime_ns = known[key]
+        st = os.stat(p)
+        if (size, mtime_ns) == (st.st_size, st.st_mtime_ns):
+            continue
+        if file_sha256(p) != sha:
+            out.append(p)
+        else:
+            touched.append((st.st_size, st.st_mtime_ns, key))
+    if touched:
+        with conn:
+            conn.executemany("UPDATE ingest_manifest SET size=?, mtime_ns=? WHERE file=?", touched)
+    return sorted(out, key=os.path.basename)
+
+def _file_msgs(path, types, known_sha=None, rows=ARCH_STREAM_ROWS):
+    """
+    Parsing di un file giornaliero come sequenza di messaggi: ("same", path, sha, stat) se lo
+    sha256 è quello del manifest, altrimenti ("start", path, sha, stat), ("rows", path, blocco
+    di al più `rows` righe tipizzate)…, ("end", path). Lo stat è preso prima dello hash: se il
+    file cambia intanto, la scoperta notturna lo ricontrolla.
+    """
+    st = os.stat(path)
+    st, sha = (st.st_size, st.st_mtime_ns), file_sha256(path)
+    if sha == known_sha:
+        yield ("same", path, sha, st)
+        return
+    yield ("start", path, sha, st)
+    it = iter_csv_rows(path, types, ts_ms=True)
+    while True:
+        block = list(islice(it, rows))
+        if not block:
+            break
+        yield ("rows", path, block)
+    yield ("end", path)
+
+_QUEUE = None                             # nei processi parser: coda verso il principale
+
+def _init_parser(q):
+    global _QUEUE
+    _QUEUE = q
 
+def _parse_file(job):
+    """Nel processo worker: i messaggi di _file_msgs sulla coda (put bloccante se è piena)."""
+    try:
+        for m in _file_msgs(*job):
+            _QUEUE.put(m)
+    except Exception as e:
+        _QUEUE.put(("error", job[0], f"{type(e).__name__}: {e}"))
+
+def _parsed(pool, q, jobs):
+    """Messaggi dei file `jobs`: dai worker via coda (file intercalati, ognuno in ordine) o in linea."""
+    if pool is None:
+        for job in jobs:
+            yield from _file_msgs(*job)
+        return
+    futs = [pool.submit(_parse_file, job) for job in jobs]
+    left = len(jobs)
+    try:
+        while left:
+            m = q.get()
+            if m[0] == "error":
+                raise RuntimeError(f"parsing {m[1]}: {m[2]}")
+            if m[0] in ("same", "end"):
+                left -= 1
+            yield m
+    finally:
+        if left:                          # interrotto: i worker bloccati su put vanno svuotati
+            for f in futs:
+                f.cancel()
+            while not all(f.done() for f in futs):
+                try:
+                    q.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+
+def _by_month(path, rows):
+    """Righe tipizzate (ts_ms in coda) → {mese: righe}; senza ts_ms vanno nel mese del file."""
+    fallback = month_of(iso_ms(_file_day(path))) if _file_day(path) else None
+    out = defaultdict(list)
+    for r in rows:
+        m = month_of(r[-1]) if r[-1] is not None else fallback
+        if m:
+            out[m].append(r)
+    return out
+
+def catch_up(conn, paths=None, workers=ARCH_WORKERS, per_txn=ARCH_DAYS_PER_TXN):
+    """
+    Importa i file giornalieri mancanti o cambiati (pending_files) o `paths`, idempotente: salta
+    i file già nel manifest con lo stesso sha256 e, grazie alla chiave naturale, le righe già
+    presenti. Un file già importato con sha256 diverso (corretto a mano, riscritto) è
+    reimportato in upsert: le righe presenti prendono i valori nuovi e le sue ore restano
+    sporche per i rollup.
+    I file sono processati a blocchi di `per_txn`, in streaming: `workers` processi li leggono
+    in parallelo e passano le righe a blocchi di ARCH_STREAM_ROWS su una coda limitata, il
+    processo principale le inserisce man mano (una transazione per partizione mensile toccata)
+    e solo dopo il COMMIT scrive le righe di manifest nel catalogo. La memoria non dipende
+    dalla lunghezza dei file. Le ore toccate sono segnate sporche prima dell'INSERT:
+    un'interruzione tra i due lascia al più ore da riaggregare in più, mai in meno, e il
+    file si reimporta (senza righe nuove) al giro dopo. Ritorna i giorni con righe nuove o aggiornate.
+    """
+    paths = pending_files(conn) if paths is None else list(paths)
+    if not paths:
+        print("[ARCH] nothing to import")
+        return []
+    known = dict(conn.execute("SELECT file, sha256 FROM ingest_manifest"))
+    types = raw_types()
+    workers = max(1, min(workers, len(paths)))
+    q = multiprocessing.Queue(2 * workers) if workers > 1 else None
+    pool = ProcessPoolExecutor(workers, initializer=_init_parser, initargs=(q,)) if q else None
+    t0, tot, new, days = time.monotonic(), 0, 0, set()
+    try:
+        for i in range(0, len(paths), max(1, per_txn)):
+            chunk = paths[i:i + max(1, per_txn)]
+            done = []                     # (key, sha, righe lette, stat)
+            files = {}                    # path → [sha, stat, cambiato, righe, nuove]
+            rf0, added_m = {}, {}         # mese → righe rf prima del blocco, righe nuove
+            marked_m = defaultdict(set)   # mese → ore segnate sporche da questo blocco
+            keep_m = set()                # mesi con file reimportati: ore sporche da tenere
+            with ExitStack() as stack:
+                parts, writers = {}, {}
+                jobs = [(p, types, known.get(_manifest_key(p))) for p in chunk]
+                for m in _parsed(pool, q, jobs):
+                    kind, path = m[0], m[1]
+                    key = _manifest_key(path)
+                    if kind == "same":
+                        print(f"[ARCH] already imported {key}")
+                    elif kind == "start":
+                        files[path] = [m[2], m[3], key in known, 0, 0]
+                    elif kind == "rows":
+                        f = files[path]
+                        for month, mrows in sorted(_by_month(path, m[2]).items()):
+                            hours = {r[-1] - r[-1] % HOUR_MS for r in mrows if r[-1] is not None}
+                            with conn:
+                                for h in hours:
+                                    if conn.execute("INSERT OR IGNORE INTO rollup_dirty VALUES (?)",
+                                                    (h,)).rowcount:
+                                        marked_m[month].add(h)
+                            if month not in parts:
+                                pconn = stack.enter_context(closing(open_partition(conn, month)))
+                                parts[month] = stack.enter_context(bulk_txn(pconn))
+                                writers[month] = _NormWriter(parts[month], INGEST_COLS)
+                                rf0[month] = pconn.execute("SELECT COUNT(*) FROM rf").fetchone()[0]
+                            written = writers[month].write(mrows, upsert=f[2])
+                            f[3] += len(mrows)
+                            if f[2]:              # valori forse cambiati: le ore restano sporche
+                                keep_m.add(month)
+                            else:
+                                f[4] += written
+                    else:                         # "end"
+                        sha, st, changed, n, added = files.pop(path)
+                        done.append((key, sha, n, st))
+                        tot += n
+                        if (added or changed) and _file_day(path):
+                            days.add(_file_day(path))
+                        if changed:
+                            print(f"[ARCH] re-imported {key} (sha256 changed): {n} rows upserted")
+                        else:
+                            print(f"[ARCH] imported {key}: {n} rows ({added} new)")
+                # righe nuove per partizione (con upsert rowcount conta anche gli aggiornamenti)
+                for month, p in parts.items():
+                    added_m[month] = p.execute("SELECT COUNT(*) FROM rf").fetchone()[0] - rf0[month]
+                    new += added_m[month]
+                    if writers[month].skipped:
+                        print(f"[ARCH] {writers[month].skipped} rows without a readable ts_iso skipped")
+            # partizioni confermate: manifest, conteggi e ore pre-segnate inutili nel catalogo
+            with conn:
+                conn.executemany("INSERT OR REPLACE INTO ingest_manifest VALUES (?,?,?,?,?,?)",
+                                 [(key, sha, n, datetime.now(timezone.utc).isoformat()) + st
+                                  for key, sha, n, st in done])
+                for month, madded in added_m.items():
+                    conn.execute("UPDATE partitions SET rows = rows + ? WHERE month=?",
+                                 (madded, month))
+                    if not madded and month not in keep_m:
+                        conn.executemany("DELETE FROM rollup_dirty WHERE hour_ms=?",
+                                         [(h,) for h in marked_m[month]])
+    finally:
+        if pool:
+            pool.shutdown()
+    dt = max(time.monotonic() - t0, 1e-6)
+    print(f"[ARCH] {len(paths)} files, {tot} rows ({new} new) in {dt:.1f}s "
+          f"({tot / dt:,.0f} rows/s, {workers} workers)")
+    return sorted(days)
+
+def import_file(conn, path):
+    return catch_up(conn, [path], workers=1)
+
+
+def _utc(ms, fmt):
+    return datetime.fromtimestamp(ms / 1000, timezone.utc).strftime(fmt)
+
+def _stats(vals):
+    """(n, mean, min, max, p10, p50, p90) di una lista di valori (percentili esatti, interpolati)."""
+    n = len(vals)
+    if n == 1:
+        v = vals[0]
+        return (1, v, v, v, v, v, v)
+    d = quantiles(vals, n=10, method="inclusive")
+    return (n, fsum(vals) / n, min(vals), max(vals), d[0], d[4], d[8])
+
+def _rollup_day(conn, pconn, day_ms, hours):
+    """
+    Ricalcola da raw (partizione `pconn`) il giorno [day_ms, +24h): la riga giornaliera, le ore
+    in `hours` (catalogo) e i loro bucket da 1 e 5 minuti (partizione). Una sola scansione
+    sull'indice ts_ms; le metriche di ciclo si contano una volta per ts.
+    """
+    have = {r[1] for r in pconn.execute("PRAGMA table_info(raw)")}
+    rf = [m for m in ROLLUP_RF_METRICS if m in have]
+    cyc = [m for m in ROLLUP_CYCLE_METRICS if m in have]
+    cur = pconn.execute(f"""
+        SELECT ts_ms, IFNULL(band,'?'), IFNULL(mode,'?'), {", ".join(rf + cyc)}
+        FROM raw WHERE ts_ms >= ? AND ts_ms < ?
+    """, (day_ms, day_ms + DAY_MS))
+    by_hour = defaultdict(lambda: defaultdict(list))      # (ora, banda, modo) → metrica → valori
+    by_day = defaultdict(lambda: defaultdict(list))       # (banda, modo) → metrica → valori
+    by_fine = [defaultdict(lambda: defaultdict(list)) for _ in ROLLUP_FINE_TIERS]   # (t_ms, banda, modo)
+    steps = [sec * 1000 for sec, _ in ROLLUP_FINE_TIERS]
+    seen = set()
+    nrf = len(rf)
+    for r in cur:
+        ts, band, mode = r[0], r[1], r[2]
+        h = ts - ts % HOUR_MS
+        if h not in hours:                # ore già aggregate: servono solo al giorno
+            accs = (by_day[(band, mode)],)
+        else:
+            accs = (by_day[(band, mode)], by_hour[(h, band, mode)],
+                    *(f[(ts - ts % st, band, mode)] for f, st in zip(by_fine, steps)))
+        for m, v in zip(rf, r[3:3 + nrf]):
+            if v is not None:
+                for a in accs:
+                    a[m].append(v)
+        if ts in seen:
+            continue
+        seen.add(ts)
+        if h not in hours:
+            accs = (by_day[("*", "*")],)
+        else:
+            accs = (by_day[("*", "*")], by_hour[(h, "*", "*")],
+                    *(f[(ts - ts % st, "*", "*")] for f, st in zip(by_fine, steps)))
+        for m, v in zip(cyc, r[3 + nrf:]):
+            if v is not None:
+                for a in accs:
+                    a[m].append(v)
+
+    day = _utc(day_ms, "%Y-%m-%d")
+    conn.execute("DELETE FROM rollup_daily WHERE day_utc=?", (day,))
+    conn.executemany("INSERT INTO rollup_daily VALUES (?,?,?,?,?,?,?,?,?,?,?)",
+                     [(day, b, md, m) + _stats(v)
+                      for (b, md), ms in by_day.items() for m, v in ms.items()])
+    keys = {h: _utc(h, "%Y-%m-%dT%H:00Z") for h in hours}
+    conn.executemany("DELETE FROM rollup_hourly WHERE hour_utc=?", [(k,) for k in keys.values()])
+    conn.executemany("INSERT INTO rollup_hourly VALUES (?,?,?,?,?,?,?,?,?,?,?)",
+                     [(keys[h], b, md, m) + _stats(v)
+                      for (h, b, md), ms in by_hour.items() for m, v in ms.items()])
+    # righe solo aggiunte (mai tolte) a raw: ogni bucket ricalcolato sostituisce il precedente
+    ids = dict(pconn.execute("SELECT value, id FROM dim"))
+    def dim_id(v):
+        i = ids.get(v)
+        if i is None:
+            i = ids[v] = pconn.execute("INSERT INTO dim(value) VALUES (?)", (v,)).lastrowid
+        return i
+    for (_, table), fine in zip(ROLLUP_FINE_TIERS, by_fine):
+        pconn.executemany(f"INSERT OR REPLACE INTO {table} VALUES (?,?,?,?,?,?,?,?,?,?,?)",
+                         [(dim_id(m), dim_id(b), dim_id(md), t) + _fine_stats(v)
+                          for (t, b, md), ms in fine.items() for m, v in ms.items()])
+    return day
+
+def _fine_stats(vals):
+    """_stats per 1m/5m: con un solo valore min/max/percentili NULL (valgono mean)."""
+    if len(vals) == 1:
+        return (1, vals[0], None, None, None, None, None)
+    return _stats(vals)
 
 def rollup(conn):
-    # hourly
-    conn.execute("""
-    INSERT OR REPLACE INTO rollup_hourly
-    SELECT substr(replace(ts_iso, '+00:00','Z'),1,13)||':00Z' AS hour_utc,
-        AVG(kp), MAX(kp),
-        AVG(tec), MAX(tec),
-        AVG(noise_dbm), AVG(busy_ratio), AVG(t_c), AVG(rh_pct), AVG(p_hpa), AVG(mag_norm_counts)
-    FROM raw
-    WHERE ts_iso >= datetime('now','-40 days')
-    GROUP BY 1
-    """)
-    # daily
-    conn.execute("""
-    INSERT OR REPLACE INTO rollup_daily
-    SELECT substr(replace(ts_iso, '+00:00','Z'),1,10) AS day_utc,
-        AVG(kp), MAX(kp),
-        AVG(tec), MAX(tec),
-        AVG(noise_dbm), AVG(busy_ratio), AVG(t_c), AVG(rh_pct), AVG(p_hpa), AVG(mag_norm_counts)
-    FROM raw
-    GROUP BY 1
-    """)
-
-
-def main():
+    """
+    Riaggrega solo le ore in rollup_dirty (e i loro giorni, compresi i percentili RF da sketch),
+    poi le toglie: il costo dipende dai dati nuovi, non dallo storico. Per giorno una transazione
+    sulla partizione (1m/5m) e poi una sul catalogo: se si interrompe in mezzo le ore restano
+    sporche e si ricalcolano (i bucket si sostituiscono). Ritorna i giorni ricalcolati.
+    """
+    by_day = defaultdict(set)
+    for (h,) in conn.execute("SELECT hour_ms FROM rollup_dirty"):
+        by_day[h - h % DAY_MS].add(h)
+    days = []
+    pconn, month = None, None
+    try:
+        for d, hours in sorted(by_day.items()):
+            if month_of(d) != month:
+                if pconn:
+                    pconn.close()
+                month = month_of(d)
+                pconn = open_partition(conn, month)
+            with conn:
+                with pconn:               # 1m/5m confermati prima di togliere le ore sporche
+                    day = _rollup_day(conn, pconn, d, hours)
+                rollup_rf(conn, day, pconn)
+                conn.executemany("DELETE FROM rollup_dirty WHERE hour_ms=?", [(h,) for h in hours])
+            days.append(day)
+    finally:
+        if pconn:
+            pconn.close()
+    return days
+
+
+def _rf_rows(key, band, freq, sk):
+    p10, p50, p90 = sk.percentiles()
+    return (key, band, freq, sk.n, p10, p50, p90, sk.to_str())
+
+def rollup_rf(conn, day, raw_conn=None):
+    """
+    Percentili RSSI orari e giornalieri per (banda, canale) fondendo gli sketch
+    per-minuto del giorno 'day' (YYYY-MM-DD), letti da `raw_conn` (la partizione del mese).
+    Nessun ricalcolo sullo storico.
+    """
+    t0 = iso_ms(day)
+    cur = (raw_conn or conn).execute("""
+        SELECT strftime('%Y-%m-%dT%H:00Z', ts_ms / 1000, 'unixepoch'), band, freq, scan_sketch
+        FROM raw
+        WHERE ts_ms >= ? AND ts_ms < ? AND mode='SCAN' AND scan_sketch IS NOT NULL
+    """, (t0, t0 + 86400000))
+    by_hour = defaultdict(list)
+    for hour, band, freq, sk in cur:
+        by_hour[(hour, band, int(freq or 0))].append(sk)
+        by_hour[(hour, band, 0)].append(sk)
+    if not by_hour:
+        return 0
+
+    hourly = {k: merge_strs(v) for k, v in by_hour.items()}
+    conn.executemany("INSERT OR REPLACE INTO rollup_rf_hourly VALUES (?,?,?,?,?,?,?,?)",
+                     [_rf_rows(h, b, f, sk) for (h, b, f), sk in hourly.items()])
+
+    by_day = defaultdict(list)
+    for (h, b, f), sk in hourly.items():
+        by_day[(b, f)].append(sk.to_str())
+    conn.executemany("INSERT OR REPLACE INTO rollup_rf_daily VALUES (?,?,?,?,?,?,?,?)",
+                     [_rf_rows(day, b, f, merge_strs(v)) for (b, f), v in by_day.items()])
+    return len(hourly)
+
+
+# --- copia Parquet giornaliera ---
+def parquet_path(day):
+    """'YYYY-MM-DD' → PARQUET_DIR/YYYY/MM/BASE_YYYYMMDD.parquet"""
+    return os.path.join(PARQUET_DIR, day[:4], day[5:7], f"{BASE}_{day.replace('-', '')}.parquet")
+
+def _arrow_schema():
+    to = {"REAL": pa.float64(), "INTEGER": pa.int64(), "TEXT": pa.string()}
+    return pa.schema([(c, to[t]) for c, t in RAW_BASE + RAW_MIGRATIONS])
+
+def export_parquet(conn, day):
+    """Riscrive il Parquet del giorno dalla sua partizione (atomico: .tmp + rename). Ritorna le righe."""
+    month = day[:7]
+    row = conn.execute("SELECT sealed FROM partitions WHERE month=?", (month,)).fetchone()
+    if row is None:
+        return 0
+    schema = _arrow_schema()
+    t0 = iso_ms(day)
+    p = read_partition(month, row[0])
+    try:
+        rows = p.execute(f"SELECT {', '.join(schema.names)} FROM raw "
+                         f"WHERE ts_ms >= ? AND ts_ms < ? ORDER BY band, ts_ms",
+                         (t0, t0 + DAY_MS)).fetchall()
+        if not rows and _has_cold(p):
+            ib, it = schema.names.index("band"), schema.names.index("ts_ms")
+            rows = sorted(_cold_rows(p, t0), key=lambda r: (r[ib] or "", r[it]))
+    finally:
+        p.close()
+    if not rows:
+        return 0
+    cols = list(zip(*rows))
+    table = pa.Table.from_arrays([pa.array(v, type=f.type, from_pandas=False)
+                                  for v, f in zip(cols, schema)], schema=schema)
+    path = parquet_path(day)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # un row group non scavalca mai un cambio di banda: min==max su band, salto esatto per banda
+    bands = cols[schema.names.index("band")]
+    cuts = [0] + [i for i in range(1, len(bands)) if bands[i] != bands[i - 1]] + [len(bands)]
+    with pq.ParquetWriter(path + ".tmp", schema, compression="zstd",
+                          use_dictionary=[f.name for f in schema if f.type == pa.string()],
+                          write_statistics=PARQUET_STATS) as w:
+        for a, b in zip(cuts, cuts[1:]):
+            w.write_table(table.slice(a, b - a), row_group_size=PARQUET_ROW_GROUP)
+    os.replace(path + ".tmp", path)
+    return len(rows)
+
+def export_parquet_days(conn, days):
+    if not days:
+        return
+    if not _HAS_PYARROW:
+        print("[ARCH] ARCH_PARQUET=1 but pyarrow is not installed: Parquet export skipped")
+        return
+    t0, n = time.monotonic(), 0
+    for day in days:
+        n += export_parquet(conn, day)
+    print(f"[ARCH] parquet: {len(days)} days, {n} rows in {time.monotonic() - t0:.1f}s")
+
+def all_days(conn):
+    """Giorni UTC con righe in una qualsiasi partizione."""
+    out = set()
+    for month, sealed in conn.execute("SELECT month, sealed FROM partitions").fetchall():
+        p = read_partition(month, sealed)
+        out.update(r[0] for r in p.execute(
+            "SELECT DISTINCT strftime('%Y-%m-%d', ts_ms / 1000, 'unixepoch') FROM cycle"))
+        if _has_cold(p):
+            out.update(_utc(r[0], "%Y-%m-%d") for r in p.execute("SELECT DISTINCT day_ms FROM cold"))
+        p.close()
+    return sorted(out)
+
+def main(paths=None, rebuild=False):
     conn = connect()
-    n = import_yesterday(conn)
-    if n > 0:
-        rollup(conn)
-        conn.commit()
-        print("[ARCH] rollups updated")
+    catch_up(conn, paths)                 # tutti i giorni chiusi mancanti, non solo ieri
+    if rebuild:
+        with conn:
+            mark_all_dirty(conn)
+    t0 = time.monotonic()
+    days = rollup(conn)
+    if days:
+        print(f"[ARCH] rollups updated: {len(days)} days ({days[0]}..{days[-1]}) "
+              f"in {time.monotonic() - t0:.1f}s")
+    if ARCH_PARQUET:
+        export_parquet_days(conn, days)   # i giorni riaggregati sono quelli con righe nuove
+    seal_old_partitions(conn)
+    freeze_old_partitions(conn)
 
 if __name__ == "__main__":
-    main()
+    # python3 spacewx_archive.py                     → import dei giorni mancanti + rollup (timer notturno)
+    # python3 spacewx_archive.py backfill FILE...    → import massivo di CSV giornalieri scelti
+    # python3 spacewx_archive.py rebuild             → riaggrega tutto lo storico
+    # python3 spacewx_archive.py verify              → sha256 delle partizioni sigillate
+    # python3 spacewx_archive.py parquet             → (ri)scrive il Parquet di tutti i giorni
+    if len(sys.argv) >= 3 and sys.argv[1] == "backfill":
+        main(sys.argv[2:])
+    elif len(sys.argv) == 2 and sys.argv[1] == "verify":
+        sys.exit(1 if verify_partitions(connect()) else 0)
+    elif len(sys.argv) == 2 and sys.argv[1] == "parquet":
+        conn = connect()
+        export_parquet_days(conn, all_days(conn))
+    elif len(sys.argv) == 2 and sys.argv[1] == "rebuild":
+        main(rebuild=True)
+    else:
+        main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# Monitor dell'alimentazione (SGM58031 sulla Sense HAT B): l'undervoltage rovina il logging,
+# le righe con cali di tensione vanno riconosciute ed escluse dalle analisi.
+# - ADC in conversione continua a 960 SPS: ogni lettura è l'ultimo campione (1 transazione,
+#   nessuna attesa), il thread legge a SUPPLY_RATE_HZ (default 20 → cali ≥ 50 ms)
+# - più canali (SUPPLY_CHANNELS) letti a turno in pipeline: si legge il canale corrente e si
+#   commuta il mux sul successivo, che converte fino al tick dopo (2 transazioni, zero sleep)
+# - per intervallo: media/min del primo canale (rail 5 V via partitore), numero di cali sotto
+#   SUPPLY_DIP_V (un calo ancora in corso a inizio intervallo conta 1 anche nel successivo:
+#   ogni minuto passato sotto soglia ha vin_dips > 0), media/min del secondo canale se configurato
+# - flag undervoltage del firmware del Pi (hwmon rpi_volt, in0_lcrit_alarm) se disponibile
+#
+# Gli ingressi AIN0..3 sono sul connettore della HAT: il rail va portato con un partitore
+# (es. 10k/10k → rapporto 2.0, fondo scala PGA 4.096 V).
+
+import glob
+import os
+import threading
+import time
+
+from SGM58031 import SGM58031, SGM_CONFIG_PGA_4096, SGM_CONFIG_DR_RATE_960
+from i2c_bus import get_bus
+
+SUPPLY_ENABLE = os.environ.get("SUPPLY_ENABLE", "0") != "0"   # off: serve il partitore su AIN0
+SUPPLY_RATE_HZ = float(os.environ.get("SUPPLY_RATE_HZ", "20"))     # letture/s (tutti i canali)
+SUPPLY_CHANNELS = os.environ.get("SUPPLY_CHANNELS", "0:2.0")       # "ch:partitore[,ch:partitore]"
+SUPPLY_DIP_V = float(os.environ.get("SUPPLY_DIP_V", "4.75"))       # soglia calo sul primo canale
+
+# Campi aggiunti al CSV (in quest'ordine, vedi SupplyMonitor.row())
+SUPPLY_FIELDS = ["vin_mean_v", "vin_min_v", "vin_dips", "vaux_mean_v", "vaux_min_v",
+                 "supply_n", "pi_uv"]
+
+
+def parse_channels(spec):
+    """ "0:2.0,1:1" → [(0, 2.0), (1, 1.0)] (al più 2 canali: vin, vaux)."""
+    out = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        ch, _, div = part.partition(":")
+        out.append((int(ch) & 0x03, float(div or 1.0)))
+    return out[:2]
+
+
+def _uv_alarm_path():
+    for d in glob.glob("/sys/class/hwmon/hwmon*"):
+        try:
+            with open(os.path.join(d, "name")) as f:
+                if f.read().strip() == "rpi_volt":
+                    return os.path.join(d, "in0_lcrit_alarm")
+        except OSError:
+            pass
+    return None
+
+
+class _Acc(object):
+    __slots__ = ("s", "n", "min")
+
+    def __init__(self):
+        self.s = 0.0; self.n = 0; self.min = None
+
+    def push(self, v):
+        self.s += v
+        self.n += 1
+        self.min = v if self.min is None else min(self.min, v)
+
+
+class SupplyMonitor(threading.Thread):
+
+    def __init__(self, rate_hz=SUPPLY_RATE_HZ, channels=SUPPLY_CHANNELS, dip_v=SUPPLY_DIP_V):
+        super().__init__(name="supply", daemon=True)
+        self.period = 1.0 / max(1.0, min(200.0, rate_hz))
+        self.channels = parse_channels(channels) or [(0, 2.0)]
+        self.dip_v = dip_v
+        self.adc = None
+        self._uv_path = _uv_alarm_path()
+        self._lock = threading.Lock()
+        self._halt = threading.Event()
+        self._acc = [_Acc() for _ in self.channels]
+        self._dips = 0
+        self._in_dip = False
+        self._uv = None
+
+    def _init(self):
+        adc = SGM58031(bus=get_bus())
+        adc.SGM58031_START_CONTINUOUS(self.channels[0][0], SGM_CONFIG_PGA_4096, SGM_CONFIG_DR_RATE_960)
+        self.adc = adc
+        self._cur = 0
+        get_bus().sleep(0.003)                # prima conversione (≈1 ms a 960 SPS)
+
+    def _tick(self):
+        adc = self.adc
+        i = self._cur
+        ch, div = self.channels[i]
+        v = adc.SGM58031_READ_CONVERT() * adc.SGM58031_LSB_V() * div
+        if len(self.channels) > 1:            # pipeline: il prossimo canale converte fino al tick dopo
+            self._cur = (i + 1) % len(self.channels)
+            adc.SGM58031_START_CONTINUOUS(self.channels[self._cur][0], SGM_CONFIG_PGA_4096,
+                                          SGM_CONFIG_DR_RATE_960)
+        with self._lock:
+            self._acc[i].push(v)
+            if i == 0:
+                dip = v < self.dip_v
+                if dip and not self._in_dip:
+                    self._dips += 1           # conta i cali (fronti), non i campioni
+                self._in_dip = dip
+
+    def _poll_uv(self):
+        if self._uv_path is None:
+            return
+        try:
+            with open(self._uv_path) as f:
+                uv = int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return
+        with self._lock:
+            self._uv = max(self._uv or 0, uv)
+
+    def run(self):
+        t_next = time.monotonic()
+        t_uv = 0.0
+        while not self._halt.is_set():
+            try:
+                if self.adc is None:
+                    self._init()
+                self._tick()
+            except Exception as e:
+                print(f"[SUPPLY] error: {e} → reinit in 60 s")
+                self.adc = None
+                self._halt.wait(60)
+                t_next = time.monotonic()
+                continue
+            now = time.monotonic()
+            if now - t_uv >= 1.0:
+                t_uv = now
+                self._poll_uv()
+            t_next += self.period
+            delay = t_next - time.monotonic()
+            if delay < 0:                     # in ritardo: riallinea senza raffiche
+                t_next = time.monotonic()
+                delay = 0
+            self._halt.wait(delay)
+
+    def row(self):
+        """Valori SUPPLY_FIELDS sull'intervallo dall'ultima chiamata, poi reset."""
+        with self._lock:
+            acc, self._acc = self._acc, [_Acc() for _ in self.channels]
+            dips, self._dips = self._dips, int(self._in_dip)   # calo a cavallo: segna anche il prossimo
+            uv, self._uv = self._uv, None
+        mean = lambda a: round(a.s / a.n, 3) if a.n else None
+        low = lambda a: round(a.min, 3) if a.min is not None else None
+        vin = acc[0]
+        vaux = acc[1] if len(acc) > 1 else _Acc()
+        return [mean(vin), low(vin), dips if vin.n else None, mean(vaux), low(vaux),
+                sum(a.n for a in acc), uv]
+
+    def stop(self):
+        self._halt.set()
+
+
+if __name__ == "__main__":
+    sm = SupplyMonitor()
+    sm.start()
+    for _ in range(10):
+        time.sleep(5)
+        print(dict(zip(SUPPLY_FIELDS, sm.row())))
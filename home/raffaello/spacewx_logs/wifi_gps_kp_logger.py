@@ -1,13 +1,23 @@
 #!/usr/bin/env python3
 import csv, os, time, json, subprocess, urllib.request
 from datetime import datetime, timezone, timedelta
-from gps3 import gps3
 import math
 from collections import deque, defaultdict  # se già non presenti
 from urllib.parse import quote  # in testa, vicino agli import
 from bisect import bisect_right
-import gzip, shutil
-from sensehat_b_reader import read_shtc3, read_lps22hb, read_icm20948_mag
+import gzip, shutil, threading
+from sensehat_b_reader import lps22hb_stats, i2c_stats, warmup as sensehat_warmup
+from rf_sketch import sketch_of
+from gps_quality import GpsQuality, GPS_QUALITY_FIELDS
+from gpsd_client import GpsdClient
+from gnss_sky import SkyStream, sky_sats, constellation_row, SKY_FIELDS
+from env_sampler import (EnvSampler, ENV_SAMPLE_HZ, ENV_STAT_FIELDS, SENSOR_AGE_FIELDS,
+                         env_values, env_stats_row, sensor_age_row, agg_ages)
+from sensor_workers import read_all, read_one, faults as sensor_faults
+from mag_pipeline import MagPipeline, MAG_RATE_HZ, MAG_FIELDS
+from light_collector import LightCollector, LIGHT_ENABLE, LIGHT_FIELDS
+from supply_monitor import SupplyMonitor, SUPPLY_ENABLE, SUPPLY_FIELDS
+import csv_index
 
 # Endpoint INGV (puoi sovrascriverlo via env se cambia)
 TEC_INGV_URL_TEMPLATE = os.environ.get(
@@ -19,6 +29,10 @@ TEC_INGV_URL_TEMPLATE = os.environ.get(
 LOGDIR = os.path.expanduser("~/spacewx_logs"); os.makedirs(LOGDIR, exist_ok=True)
 CSV = os.path.join(LOGDIR, "wifi_gps_kp_qos.csv")
 KP_CACHE = os.path.join(LOGDIR, ".kp_cache.json")
+GPS_REF_PATH = os.path.join(LOGDIR, ".gps_ref.json")   # posizione di riferimento lungo periodo
+TEC_GRID_CACHE = os.path.join(LOGDIR, ".tec_grid.json") # ultima griglia INGV (warm start)
+STATE_PATH = os.path.join(LOGDIR, ".logger_state.json") # checkpoint: Kp, ultimo SKY
+STATE_MAX_AGE_S = int(os.environ.get("STATE_MAX_AGE_S", "600"))  # SKY più vecchio → non ripristinato
 
 GPSD_HOST = os.environ.get("GPSD_HOST","127.0.0.1")
 GPSD_PORT = int(os.environ.get("GPSD_PORT","2947"))
@@ -29,6 +43,34 @@ KP_URL = "https://services.swpc.noaa.gov/products/noaa-planetary-k-index.json"
 RAW_KEEP_DAYS = int(os.environ.get("RAW_KEEP_DAYS", "7"))   # giorni di raw da tenere
 LOGDIR = os.path.expanduser("~/spacewx_logs")               # già definito nel tuo file
 BASE = "wifi_gps_kp_qos"
+SKY_BASE = "sky"                                            # stream binario per-satellite
+SKY_KEEP_DAYS = int(os.environ.get("SKY_KEEP_DAYS", "90"))  # non va nel DB: retention più lunga
+SKY_EVERY_S = int(os.environ.get("SKY_EVERY_S", "10"))      # al più un record SKY ogni N s
+MAG_BASE = "mag1s"                                          # serie magnetometro calibrata a 1 s
+MAG_KEEP_DAYS = int(os.environ.get("MAG_KEEP_DAYS", "90"))
+# letture inline (ENV_SAMPLE_HZ=0): la FIFO LPS22HB (32 campioni, ~32 s a 1 Hz) si scarica anche
+# ogni LPS_DRAIN_S durante l'attesa del ciclo, così P min/max/media coprono l'intervallo intero
+LPS_DRAIN_S = float(os.environ.get("LPS_DRAIN_S", "20"))
+SCAN_WAIT_S = 10.0                                          # attesa massima di iw scan (timeout di run: 8 s)
+
+# Header unico del CSV giornaliero (nuovi campi sempre in coda)
+CSV_HEADER = [
+    "ts_iso","kp","kp_when",
+    "gps_fix","lat","lon","alt","pdop","hdop","vdop","sv_used","sv_tot","cn0_mean",
+    "mode","freq","noise_dbm","busy_ratio","scan_n","scan_p50","scan_p10","scan_p90","band",
+    "tec","tec_source",
+    "t_c","rh_pct","p_hpa",
+    "mag_x_counts","mag_y_counts","mag_z_counts","mag_norm_counts",
+    "scan_sketch",
+    *GPS_QUALITY_FIELDS,
+    *SKY_FIELDS,
+    "p_hpa_min","p_hpa_max",
+    *ENV_STAT_FIELDS,
+    *MAG_FIELDS,
+    *SENSOR_AGE_FIELDS,
+    *LIGHT_FIELDS,
+    *SUPPLY_FIELDS
+]
 
 # --- aggiungi vicino agli import/util ---
 def _safe_float(x):
@@ -44,37 +86,59 @@ def daily_csv_path(dt_utc=None):
     os.makedirs(daydir, exist_ok=True)
     return os.path.join(daydir, f"{BASE}_{y}{m}{d}.csv")
 
+def daily_sky_path(dt_utc=None):
+    dt_utc = dt_utc or datetime.now(timezone.utc)
+    return os.path.join(os.path.dirname(daily_csv_path(dt_utc)),
+                        f"{SKY_BASE}_{dt_utc.strftime('%Y%m%d')}.bin")
+
+def daily_mag_path(dt_utc=None):
+    dt_utc = dt_utc or datetime.now(timezone.utc)
+    return os.path.join(os.path.dirname(daily_csv_path(dt_utc)),
+                        f"{MAG_BASE}_{dt_utc.strftime('%Y%m%d')}.bin")
+
 def compress_and_remove(path_csv):
     if not os.path.exists(path_csv): return
+    if path_csv.endswith(".csv"):
+        # CSV giornaliero: membri gzip ai confini dell'indice minuto → offset (csv_index.py)
+        csv_index.compress(path_csv)
+        return
     gz = path_csv + ".gz"
     with open(path_csv, "rb") as f_in, gzip.open(gz, "wb") as f_out:
         shutil.copyfileobj(f_in, f_out)
     os.remove(path_csv)
 
 def housekeeping():
-    # 1) comprime il file di ieri se esiste ancora “plain”
+    # 1) comprime i file di ieri (CSV e stream SKY/mag) se esistono ancora “plain”
     yesterday = datetime.now(timezone.utc) - timedelta(days=1)
-    y_csv = daily_csv_path(yesterday)
-    if os.path.exists(y_csv):
-        try:
-            compress_and_remove(y_csv)
-            print(f"[HK] compressed {y_csv}")
-        except Exception as e:
-            print(f"[HK] compress error {y_csv}: {e}")
+    for y_path in (daily_csv_path(yesterday), daily_sky_path(yesterday), daily_mag_path(yesterday)):
+        if os.path.exists(y_path):
+            try:
+                compress_and_remove(y_path)
+                print(f"[HK] compressed {y_path}")
+            except Exception as e:
+                print(f"[HK] compress error {y_path}: {e}")
 
-    # 2) retention: cancella raw .csv.gz più vecchi di RAW_KEEP_DAYS
-    cutoff = datetime.now(timezone.utc) - timedelta(days=RAW_KEEP_DAYS)
+    # 2) retention: cancella raw .csv.gz più vecchi di RAW_KEEP_DAYS (.bin.gz SKY/mag: *_KEEP_DAYS)
+    now = datetime.now(timezone.utc)
     for root, _, files in os.walk(os.path.join(LOGDIR, "daily")):
         for fn in files:
-            if not fn.startswith(BASE) or not fn.endswith(".csv.gz"):
+            if fn.startswith(BASE) and fn.endswith(".csv.gz"):
+                base, ext, keep = BASE, ".csv.gz", RAW_KEEP_DAYS
+            elif fn.startswith(SKY_BASE + "_") and fn.endswith(".bin.gz"):
+                base, ext, keep = SKY_BASE, ".bin.gz", SKY_KEEP_DAYS
+            elif fn.startswith(MAG_BASE + "_") and fn.endswith(".bin.gz"):
+                base, ext, keep = MAG_BASE, ".bin.gz", MAG_KEEP_DAYS
+            else:
                 continue
             p = os.path.join(root, fn)
             try:
                 # parse YYYYMMDD
-                stamp = fn.replace(BASE + "_", "").replace(".csv.gz", "")
+                stamp = fn.replace(base + "_", "").replace(ext, "")
                 dt = datetime.strptime(stamp, "%Y%m%d").replace(tzinfo=timezone.utc)
-                if dt < cutoff:
+                if dt < now - timedelta(days=keep):
                     os.remove(p)
+                    if os.path.exists(csv_index.idx_path(p)):
+                        os.remove(csv_index.idx_path(p))
                     print(f"[HK] removed old raw {p}")
             except Exception:
                 pass
@@ -96,11 +160,15 @@ def fmt_slot(dt_utc):
 
 _INGV_TRIES = int(os.environ.get("TEC_INGV_TRIES", "3"))  # slot da provare: t-0, t-10, t-20...
 _ingv_cache = {}  # rimane
+_ingv_lock = threading.Lock()  # la cache è scritta anche dal download in background ("tec")
+_INGV_CACHE_MAX = 6  # slot tenuti in memoria (1 h)
 
 def _fetch_one_slot(dt_str):
     # cache per singolo slot
-    if dt_str in _ingv_cache:
-        return _ingv_cache[dt_str]
+    with _ingv_lock:
+        obj = _ingv_cache.get(dt_str)
+    if obj:
+        return obj
 
     url = TEC_INGV_URL_TEMPLATE.format(dt=quote(dt_str))
     # log URL interrogato
@@ -163,7 +231,12 @@ def _fetch_one_slot(dt_str):
     step_lon = _approx_step(obj["lons"])
     print(f"[TEC] grid lat[{la0}..{la1}] lon[{lo0}..{lo1}] step≈{step_lat}°×{step_lon}° (n={len(obj['lats'])}x{len(obj['lons'])})")
 
-    _ingv_cache[dt_str] = obj
+    with _ingv_lock:
+        _ingv_cache[dt_str] = obj
+        # tiene solo gli slot più recenti e salva l'ultimo per il warm start
+        for k in sorted(_ingv_cache)[:-_INGV_CACHE_MAX]:
+            _ingv_cache.pop(k, None)
+    save_tec_grid(dt_str, obj)
 
     # log bounds e step
     la0, la1 = obj["lats"][0], obj["lats"][-1]
@@ -171,6 +244,42 @@ def _fetch_one_slot(dt_str):
     print(f"[TEC] grid lat[{la0}..{la1}] lon[{lo0}..{lo1}] step≈0.1° (n={len(obj['lats'])}x{len(obj['lons'])})")
     return obj
 
+def save_tec_grid(dt_str, obj):
+    try:
+        tmp = TEC_GRID_CACHE + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"slot": dt_str,
+                       "points": [[la, lo, v] for (la, lo), v in obj["grid"].items()]}, f)
+        os.replace(tmp, TEC_GRID_CACHE)
+    except Exception:
+        pass
+
+def load_tec_grid():
+    try:
+        with open(TEC_GRID_CACHE, "r") as f:
+            d = json.load(f)
+        grid = {(la, lo): v for la, lo, v in d["points"]}
+        obj = {"grid": grid,
+               "lats": sorted({k[0] for k in grid}),
+               "lons": sorted({k[1] for k in grid})}
+        with _ingv_lock:
+            _ingv_cache[d["slot"]] = obj
+        print(f"[TEC] warm grid restored slot={d['slot']} points={len(grid)}")
+    except Exception:
+        pass
+
+def cached_ingv_grid(dt_utc):
+    # come fetch_ingv_grid_multi ma senza rete: solo slot già in cache
+    dt_try = floor_to_10min(dt_utc)
+    for _ in range(_INGV_TRIES):
+        dt_str = fmt_slot(dt_try)
+        with _ingv_lock:
+            obj = _ingv_cache.get(dt_str)
+        if obj:
+            return obj, dt_str
+        dt_try = dt_try - timedelta(minutes=10)
+    return None, None
+
 def fetch_ingv_grid_multi(dt_utc):
     # prova lo slot corrente (floored), poi indietro di 10 e 20 minuti
     tried = 0
@@ -251,7 +360,8 @@ def bilinear_tec(grid_obj, lat, lon):
 
 
 
-def get_tec_for(lat, lon, ts_iso):
+def get_tec_for(lat, lon, ts_iso, wait=True):
+    """wait=False: usa solo le griglie in cache e scarica lo slot in background (avvio rapido)."""
     # normalizza input
     lat_f = _safe_float(lat)
     lon_f = _safe_float(lon)
@@ -269,7 +379,11 @@ def get_tec_for(lat, lon, ts_iso):
 
     print(f"[TEC] request lat={lat_f:.6f} lon={lon_f:.6f} at {fmt_slot(dt)}Z")
 
-    obj, dt_str = fetch_ingv_grid_multi(dt)
+    if wait:
+        obj, dt_str = fetch_ingv_grid_multi(dt)
+    else:
+        obj, dt_str = cached_ingv_grid(dt)
+        bg_once("tec", fetch_ingv_grid_multi, dt)
     if not obj:
         print(f"[TEC] no grid available for {fmt_slot(floor_to_10min(dt))}Z (tried {_INGV_TRIES} slots back)")
         return (None, None)
@@ -309,6 +423,45 @@ def get_kp():
         cache = load_kp_cache()
         return cache.get("kp"), cache.get("when")
 
+# --- lavori di rete in background (avvio rapido) ---
+_bg_threads = {}
+_net = {}   # risultati dei refresh in background, consumati dal main loop
+
+def bg_once(name, fn, *args):
+    """Avvia fn in un thread daemon se non ce n'è già uno attivo con lo stesso nome."""
+    t = _bg_threads.get(name)
+    if t is not None and t.is_alive():
+        return False
+    t = threading.Thread(target=fn, args=args, name=name, daemon=True)
+    t.start()
+    _bg_threads[name] = t
+    return True
+
+def refresh_kp_bg():
+    _net["kp"] = get_kp()
+
+def scan_bg(wlan):
+    _net["scan"] = scan_stats(wlan)
+
+# --- checkpoint dello stato "caldo" (sopravvive a Restart=always) ---
+def load_state():
+    try:
+        with open(STATE_PATH, "r") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+def save_state(kp, kp_when, last_sky, gps):
+    try:
+        tmp = STATE_PATH + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"ts": time.time(), "kp": kp, "kp_when": kp_when,
+                       "last_sky": {k: v for k, v in last_sky.items() if k != "sats"},
+                       "gps": gps}, f)
+        os.replace(tmp, STATE_PATH)
+    except Exception:
+        pass
+
 def run(cmd, timeout=8):
     return subprocess.check_output(cmd, stderr=subprocess.DEVNULL, timeout=timeout).decode(errors="ignore")
 
@@ -374,14 +527,75 @@ def scan_stats(wlan):
     for f, arr in stats.items():
         arr=sorted([x for x in arr if x is not None])
         if not arr:
-            rows.append(dict(freq=f, n=0, p50=None, p10=None, p90=None))
+            rows.append(dict(freq=f, n=0, p50=None, p10=None, p90=None, sketch=None))
             continue
         def pct(p):
             i=int((p/100)*(len(arr)-1)); return arr[i]
-        rows.append(dict(freq=f, n=len(arr), p50=pct(50), p10=pct(10), p90=pct(90)))
+        # sketch mergeable per canale/minuto → percentili orari/giornalieri esatti "quanto basta"
+        rows.append(dict(freq=f, n=len(arr), p50=pct(50), p10=pct(10), p90=pct(90),
+                         sketch=sketch_of(arr).to_str()))
     return rows
 
 
+def sky_summary(sky):
+    """Riduce un messaggio SKY a DOP, satelliti usati/totali, C/N0 medio e aggregati per costellazione."""
+    sats = sky_sats(sky)
+    sv_tot  = len(sats)
+    sv_used = sum(1 for s in sats if s["used"])
+    cn_vals = [s["cn0"] for s in sats if s["cn0"] is not None]
+    cn0_mean = round(sum(cn_vals)/len(cn_vals), 1) if cn_vals else None
+    return dict(
+        pdop=sky.get('pdop'), hdop=sky.get('hdop'), vdop=sky.get('vdop'),
+        sv_used=sv_used, sv_tot=sv_tot, cn0_mean=cn0_mean,
+        const=constellation_row(sats), sats=sats
+    )
+
+def pump_gps(gpsd, t_end, gps, last_sky, gps_q, sky_stream=None):
+    """
+    Legge da gpsd fino a t_end: aggiorna l'ultimo fix (gps), l'ultimo SKY e
+    alimenta le statistiche di qualità con OGNI TPV ricevuto.
+    GpsdClient.poll() blocca in epoll finché non arrivano dati: niente CPU tra un messaggio e l'altro.
+    """
+    while True:
+        left = t_end - time.time()
+        if left <= 0:
+            break
+        for msg in gpsd.poll(left):
+            cls = msg.get('class')
+
+            # TPV (posizione)
+            if cls == 'TPV':
+                mode = msg.get('mode')
+                gps.update(
+                    fix="3D" if mode == 3 else ("2D" if mode == 2 else "NO"),
+                    lat=msg.get('lat'), lon=msg.get('lon'), alt=msg.get('alt')
+                )
+                gps_q.add_tpv(msg)
+
+            # SKY (sats/DOP)
+            elif cls == 'SKY':
+                last_sky.update(sky_summary(msg))
+                if sky_stream is not None:
+                    sky_stream.write(last_sky["sats"])
+
+def pump_gps_draining(gpsd, t_end, gps, last_sky, gps_q, sky_stream, lps_buf):
+    """
+    pump_gps fino a t_end; con lps_buf (lista, letture inline) ogni LPS_DRAIN_S scarica la FIFO
+    LPS22HB dal worker del sensore (con scadenza) e ne accoda i campioni per il prossimo ciclo.
+    """
+    if lps_buf is None or LPS_DRAIN_S <= 0:
+        pump_gps(gpsd, t_end, gps, last_sky, gps_q, sky_stream)
+        return
+    t_next = time.time() + LPS_DRAIN_S
+    while True:
+        pump_gps(gpsd, min(t_end, t_next), gps, last_sky, gps_q, sky_stream)
+        if time.time() >= t_end:
+            return
+        smp, age = read_one("lps22hb")
+        if age == 0.0 and smp:
+            lps_buf.extend(smp)
+        t_next += LPS_DRAIN_S
+
 def band_of(freq):
     if not freq: return "?"
     if 2400 <= freq <= 2500: return "24"
@@ -395,26 +609,57 @@ def main():
     f = open(cur_path, "a", newline="")
     w = csv.writer(f)
     if newfile:
-        w.writerow([
-            "ts_iso","kp","kp_when",
-            "gps_fix","lat","lon","alt","pdop","hdop","vdop","sv_used","sv_tot","cn0_mean",
-            "mode","freq","noise_dbm","busy_ratio","scan_n","scan_p50","scan_p10","scan_p90","band",
-            "tec","tec_source",
-            "t_c","rh_pct","p_hpa",
-            "mag_x_counts","mag_y_counts","mag_z_counts","mag_norm_counts"
-        ])
+        w.writerow(CSV_HEADER)
 
         f.flush()
+    idx = csv_index.IndexWriter(cur_path, fresh=newfile)   # minuto → offset, per le letture a intervallo
 
     # --- gpsd ---
-    gps_socket = gps3.GPSDSocket()
-    data_stream = gps3.DataStream()
-    gps_socket.connect(GPSD_HOST, GPSD_PORT)
-    gps_socket.watch()
-
-    kp = kp_when = None
+    gpsd = GpsdClient(GPSD_HOST, GPSD_PORT)
+    gps = dict(fix="NO", lat=None, lon=None, alt=None)
+    gps_q = GpsQuality(GPS_REF_PATH)
+
+    # --- warm start: sensori in parallelo, Kp/TEC/SKY/fix dal checkpoint, rete in background ---
+    # Prima riga entro ~1 s dall'avvio: con SKY e fix dal checkpoint il primo ciclo non aspetta
+    # gpsd, le letture sensori hanno scadenza (SENSOR_DEADLINE_S, None finché l'init non è
+    # finito), iw scan gira in background e al primo ciclo non si aspetta se la SURVEY (iw
+    # survey dump, pochi ms) ha già dato righe. Avvio a freddo: +1.2 s di pump GPS.
+    sensehat_warmup()
+    mag = None
+    if MAG_RATE_HZ > 0:
+        mag = MagPipeline(MAG_RATE_HZ, daily_mag_path)   # unico lettore del magnetometro
+        mag.start()
+    env = None
+    if ENV_SAMPLE_HZ > 0:
+        env = EnvSampler(ENV_SAMPLE_HZ, mag_reader=mag.latest_counts if mag else None)
+        env.start()                        # unico lettore I2C (oltre al mag) da qui in poi
+    faults_snap = sensor_faults()
+    light = None
+    if LIGHT_ENABLE:
+        light = LightCollector()           # TCS34725: legge solo su interrupt di soglia
+        light.start()
+    supply = None
+    if SUPPLY_ENABLE:
+        supply = SupplyMonitor()           # SGM58031 in continua: cali di alimentazione
+        supply.start()
+    state = load_state()
+    cache = load_kp_cache()
+    kp = state.get("kp", cache.get("kp"))
+    kp_when = state.get("kp_when", cache.get("when"))
     last_kp = 0
-    last_sky = dict(pdop=None, hdop=None, vdop=None, sv_used=None, sv_tot=None, cn0_mean=None)
+    last_sky = dict(pdop=None, hdop=None, vdop=None, sv_used=None, sv_tot=None, cn0_mean=None,
+                    const=[None]*len(SKY_FIELDS), sats=[])
+    warm = time.time() - state.get("ts", 0) < STATE_MAX_AGE_S
+    if warm and state.get("last_sky"):
+        last_sky.update(state["last_sky"])
+    warm_gps = warm and bool(state.get("last_sky")) and bool(state.get("gps"))
+    if warm_gps:
+        gps.update(state["gps"])           # ultimo fix (≤ STATE_MAX_AGE_S): solo per il primo ciclo
+    load_tec_grid()
+    first_cycle = True
+    lps_buf = [] if env is None else None   # campioni FIFO scaricati durante l'attesa (inline)
+    i2c_snap = None
+    sky_stream = SkyStream(daily_sky_path, SKY_EVERY_S)
     last_housekeeping_minute = None
 
     while True:
@@ -427,25 +672,25 @@ def main():
                 f.close()
             except Exception:
                 pass
-            # comprime il file del giorno appena chiuso
+            # comprime il file del giorno appena chiuso (e il relativo stream SKY)
             try:
                 compress_and_remove(cur_path)
             except Exception as e:
                 print(f"[HK] compress error at rollover {cur_path}: {e}")
+            sky_stream.close()
+            try:
+                compress_and_remove(daily_sky_path(datetime.now(timezone.utc) - timedelta(days=1)))
+            except Exception as e:
+                print(f"[HK] compress error at rollover (sky): {e}")
 
             # riapre il nuovo giorno e riscrive l'header
             cur_path = new_path
+            fresh = not os.path.exists(cur_path)
             f = open(cur_path, "a", newline="")
             w = csv.writer(f)
-            w.writerow([
-                "ts_iso","kp","kp_when",
-                "gps_fix","lat","lon","alt","pdop","hdop","vdop","sv_used","sv_tot","cn0_mean",
-                "mode","freq","noise_dbm","busy_ratio","scan_n","scan_p50","scan_p10","scan_p90","band",
-                "tec","tec_source",
-                "t_c","rh_pct","p_hpa",
-                "mag_x_counts","mag_y_counts","mag_z_counts","mag_norm_counts"
-            ])
+            w.writerow(CSV_HEADER)
             f.flush()
+            idx = csv_index.IndexWriter(cur_path, fresh=fresh)
 
         # 2) Housekeeping leggero: una volta all’ora al minuto 1
         now_minute = datetime.utcnow().minute
@@ -458,79 +703,28 @@ def main():
 
         # 3) Refresh Kp ogni 5 minuti (con cache di fallback)
         if now - last_kp > 300:
-            kp, kp_when = get_kp()
+            bg_once("kp", refresh_kp_bg)
             last_kp = now
-
-        # 4) Raccogli TPV e SKY ~1.2s
-        gps_fix = "NO"; lat = lon = alt = None
-        got_tpv = got_sky = False
-        t_end = now + 1.2
-        while time.time() < t_end:
-            try:
-                raw = next(gps_socket)
-            except StopIteration:
-                break
-            if not raw:
-                continue
-            data_stream.unpack(raw)
-
-            # TPV (posizione)
-            if data_stream.TPV:
-                tpv = data_stream.TPV
-                if isinstance(tpv, str):
-                    try: tpv = json.loads(tpv)
-                    except Exception: tpv = {}
-                mode = tpv.get('mode')
-                lat  = tpv.get('lat')
-                lon  = tpv.get('lon')
-                alt  = tpv.get('alt')
-                gps_fix = "3D" if mode == 3 else ("2D" if mode == 2 else "NO")
-                got_tpv = True
-
-            # SKY (sats/DOP)
-            if data_stream.SKY:
-                sky = data_stream.SKY
-                if isinstance(sky, str):
-                    try: sky = json.loads(sky)
-                    except Exception: sky = {}
-
-                pdop = sky.get('pdop')
-                hdop = sky.get('hdop')
-                vdop = sky.get('vdop')
-
-                sats = sky.get('satellites') or []
-                norm_sats = []
-                if isinstance(sats, list):
-                    for s in sats:
-                        if isinstance(s, str):
-                            try: s = json.loads(s)
-                            except Exception: s = None
-                        if isinstance(s, dict): norm_sats.append(s)
-
-                sv_tot  = len(norm_sats)
-                sv_used = sum(1 for s in norm_sats if s.get('used') in (True, 1, 'true', 'True'))
-
-                cn_vals = []
-                for s in norm_sats:
-                    v = s.get('ss') or s.get('cn0') or s.get('cn') or s.get('snr')
-                    if v is None: continue
-                    try: cn_vals.append(float(v))
-                    except Exception: pass
-
-                cn0_mean = round(sum(cn_vals)/len(cn_vals), 1) if cn_vals else None
-
-                last_sky.update(dict(
-                    pdop=pdop, hdop=hdop, vdop=vdop,
-                    sv_used=sv_used, sv_tot=sv_tot, cn0_mean=cn0_mean
-                ))
-                got_sky = True
+        if "kp" in _net:
+            kp, kp_when = _net.pop("kp")
+
+        # 4) iw scan in background (gira insieme a pump GPS e sensori, raccolto al passo 7), poi
+        #    TPV e SKY ~1.2s (il resto dell'intervallo è coperto dal pump in coda al ciclo);
+        #    primo ciclo con SKY e fix dal checkpoint: niente attesa
+        _net.pop("scan", None)                 # risultato di uno scan non raccolto: vecchio
+        bg_once("scan", scan_bg, WLAN)
+        if not (first_cycle and warm_gps):
+            gps.update(fix="NO", lat=None, lon=None, alt=None)
+            pump_gps(gpsd, now + 1.2, gps, last_sky, gps_q, sky_stream)
+        gps_fix, lat, lon, alt = gps["fix"], gps["lat"], gps["lon"], gps["alt"]
 
         # 5) TEC per la posizione corrente
         ts = now_iso()
         if gps_fix == "NO":
             tec_val, tec_src = (None, None)
         else:
-            tec_val, tec_src = get_tec_for(lat, lon, ts)
+            # al primo ciclo niente attesa sulla rete: griglia dal checkpoint, download in background
+            tec_val, tec_src = get_tec_for(lat, lon, ts, wait=not first_cycle)
 
         print(f"[TEC] value={tec_val} source={tec_src}")
 
@@ -540,18 +734,62 @@ def main():
         TEMP_OFFSET_C = float(os.environ.get("TEMP_OFFSET_C", "0.0"))  # es: -3.5
 
 
-        t_sht, rh_pct = read_shtc3()           # °C / %RH (SHTC3)
-        p_hpa, t_lps  = read_lps22hb()         # hPa / °C  (LPS22HB)
-        # fusione semplice se entrambi presenti
-        if t_sht is not None and t_lps is not None:
-            t_c = 0.7*t_sht + 0.3*t_lps
+        if env is not None:
+            # aggregati del campionatore continuo (ENV_SAMPLE_HZ) sull'intervallo appena chiuso
+            agg = env.collect()
+            t_c, rh_pct, p_hpa, p_min, p_max, mx, my, mz, mnorm = env_values(agg, TEMP_OFFSET_C)
+            env_row = env_stats_row(agg, TEMP_OFFSET_C)
+            ages = agg_ages(agg)
         else:
-            t_c = t_sht if t_sht is not None else t_lps
-        if t_c is not None:
-            t_c = round(t_c + TEMP_OFFSET_C, 2)
-
-
-        mx, my, mz, mnorm = read_icm20948_mag()   # counts (ICM-20948/AK09916)
+            # letture inline: snapshot in pipeline con scadenza, su timeout ultimo valore buono + età
+            vals = read_all(("shtc3", "lps22hb") + (() if mag else ("icm",)))
+            sht, a_sht = vals["shtc3"]             # °C / %RH (SHTC3)
+            t_sht, rh_pct = sht or (None, None)
+            smp, a_lps = vals["lps22hb"]
+            # i campioni FIFO valgono solo per l'intervallo in cui sono stati scaricati: quelli
+            # scaricati durante l'attesa più, se fresca (età 0), la lista della snapshot; su
+            # scadenza la lista in cache è di un intervallo passato e resta fuori
+            smp = lps_buf + (smp if a_lps == 0.0 and smp else [])
+            lps_buf.clear()
+            lps = lps22hb_stats(smp) or {}   # hPa / °C, media FIFO + min/max
+            p_hpa, t_lps = lps.get("p_mean"), lps.get("t_mean")
+            p_hpa = round(p_hpa, 2) if p_hpa is not None else None
+            p_min, p_max = lps.get("p_min"), lps.get("p_max")
+            # fusione semplice se entrambi presenti
+            if t_sht is not None and t_lps is not None:
+                t_c = 0.7*t_sht + 0.3*t_lps
+            else:
+                t_c = t_sht if t_sht is not None else t_lps
+            if t_c is not None:
+                t_c = round(t_c + TEMP_OFFSET_C, 2)
+
+            mg, a_mag = mag.latest_counts() if mag else vals["icm"]   # counts (ICM-20948/AK09916)
+            mx, my, mz, mnorm = mg or (None,) * 4
+            env_row = env_stats_row(None)
+            ages = {"shtc3": a_sht, "lps22hb": a_lps, "icm": a_mag}
+        n_faults = sensor_faults(faults_snap)
+        faults_snap = sensor_faults()
+        age_row = sensor_age_row(ages, n_faults)
+        # serie magnetometro calibrata a 1 min (media della serie 1 s + dB/dt)
+        mag_row = mag.row() if mag else [None] * len(MAG_FIELDS)
+        light_row = light.row() if light else [None] * len(LIGHT_FIELDS)
+        supply_row = supply.row() if supply else [None] * len(SUPPLY_FIELDS)
+
+        # costo I2C dall'ultimo ciclo (campionatore + letture inline)
+        st = i2c_stats()
+        if st is not None:
+            if i2c_snap is not None:
+                c = st.since(i2c_snap)
+                print(f"[I2C] tx={c['tx']} rd={c['rd']}B wr={c['wr']}B sleeps={c['n_sleep']} ({c['sleep_s']}s)")
+            i2c_snap = st.snapshot()
+
+        # 5b) Qualità GPS su tutti i TPV dell'intervallo appena chiuso
+        gq_row = gps_q.row()
+        gps_q.reset()
+        gps_q.save_ref()
+
+        # indice del CSV: offset della prima riga di ogni minuto, prima di scrivere le righe
+        idx.mark(f, ts)
 
         # 6) SURVEY (se supportato)
         survey_rows = survey_sample(WLAN)
@@ -565,12 +803,24 @@ def main():
                 None, None, None, None, band_of(surv["freq"]),
                 tec_val, tec_src,
                 t_c, rh_pct, p_hpa,
-                mx, my, mz, mnorm
+                mx, my, mz, mnorm,
+                None,
+                *gq_row,
+                *last_sky["const"],
+                p_min, p_max,
+                *env_row,
+                *mag_row,
+                *age_row,
+                *light_row,
+                *supply_row
             ])
             f.flush()
 
-        # 7) SCAN a banda larga
-        for row in scan_stats(WLAN):
+        # 7) SCAN a banda larga (partito al passo 4); al primo ciclo, se la SURVEY ha dato righe,
+        #    non si aspettano i secondi di iw scan: la prima riga è già scritta
+        if not (first_cycle and survey_rows):
+            _bg_threads["scan"].join(SCAN_WAIT_S)
+        for row in _net.pop("scan", []):
             w.writerow([
                 ts, kp, kp_when,
                 gps_fix, lat, lon, alt,
@@ -580,11 +830,23 @@ def main():
                 row["n"], row["p50"], row["p10"], row["p90"], band_of(row["freq"]),
                 tec_val, tec_src,
                 t_c, rh_pct, p_hpa,
-                mx, my, mz, mnorm
+                mx, my, mz, mnorm,
+                row["sketch"],
+                *gq_row,
+                *last_sky["const"],
+                p_min, p_max,
+                *env_row,
+                *mag_row,
+                *age_row,
+                *light_row,
+                *supply_row
             ])
         f.flush()
+        save_state(kp, kp_when, last_sky, gps)
+        first_cycle = False
 
-        time.sleep(60)
+        # 8) Attesa fino al prossimo ciclo continuando a leggere gpsd (TPV per le statistiche)
+        pump_gps_draining(gpsd, time.time() + 60, gps, last_sky, gps_q, sky_stream, lps_buf)
 
 
 if __name__ == "__main__":
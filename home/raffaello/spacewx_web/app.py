@@ -1,11 +1,17 @@
 #!/usr/bin/env python3
-import os, json, sqlite3
+import os, io, sys, json, sqlite3
 from datetime import datetime, timezone, timedelta, date  
 from flask import Flask, jsonify, render_template, request
 import pandas as pd
 import math
 import traceback
 
+try:
+    import pyarrow.parquet as pq
+    _HAS_PYARROW = True
+except Exception:
+    _HAS_PYARROW = False
+
 APP_BUILD = "latestmix-2025-09-13-00:xx"
 print(f"[APP] build={APP_BUILD}")
 
@@ -20,6 +26,21 @@ TITLE     = os.environ.get("TITLE", "Space Weather QoS")
 LOGDIR    = os.environ.get("LOGDIR", "/home/raffaello/spacewx_logs")
 DB_PATH   = os.environ.get("DB_PATH", "/home/raffaello/spacewx_logs/spacewx.db")
 BASE_NAME = os.environ.get("CSV_BASENAME", "wifi_gps_kp_qos")  # coerente con logger
+PARQUET_DIR = os.environ.get("PARQUET_DIR", os.path.join(LOGDIR, "parquet"))   # ARCH_PARQUET=1
+# codec dello storico freddo dell'archivio (colblock.py, accanto a spacewx_archive.py)
+ARCHIVE_LIB = os.environ.get("ARCHIVE_LIB", os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                         "..", "spacewx_logs"))
+try:
+    sys.path.append(ARCHIVE_LIB)
+    import colblock
+    _HAS_COLBLOCK = True
+except Exception:
+    _HAS_COLBLOCK = False
+try:
+    import csv_index                  # indice minuto → offset dei CSV giornalieri (dal logger)
+    _HAS_CSV_INDEX = True
+except Exception:
+    _HAS_CSV_INDEX = False
 TODAY_UTC = lambda: datetime.now(timezone.utc).date()
 
 print(f"[APP] LOGDIR={LOGDIR}")
@@ -36,11 +57,43 @@ RF_METRICS  = ["noise_dbm", "busy_ratio", "scan_p50", "scan_p90", "scan_p10"]
 GPS_METRICS = ["hdop", "vdop", "pdop", "cn0_mean", "sv_used", "tec"]  # estendibile
 # Campi ambientali e magnetometro (opz.)
 ENV_METRICS = ["t_c", "rh_pct", "p_hpa"]
+ENV_STAT_COLUMNS = [                           # aggregati per intervallo (stesso ordine del CSV del logger)
+    "p_hpa_min", "p_hpa_max",
+    "t_c_min", "t_c_max", "t_c_std",
+    "rh_pct_min", "rh_pct_max", "rh_pct_std",
+    "p_hpa_std",
+    "mag_norm_min", "mag_norm_max", "mag_norm_std", "env_n",
+]
 MAG_COLUMNS = ["mag_x_counts", "mag_y_counts", "mag_z_counts", "mag_norm_counts"]
+# Magnetometro calibrato (pipeline ad alta frequenza, serie a 1 min dalla serie a 1 s)
+MAG_CAL_COLUMNS = [
+    "mag_bx_ut", "mag_by_ut", "mag_bz_ut", "mag_b_ut", "mag_b_std_ut",
+    "mag_b_min_ut", "mag_b_max_ut",
+    "mag_dbdt_max_nts", "mag_dbdt_rms_nts",
+    "mag_n_1s", "mag_rate_hz", "mag_cpu_pct",
+]
+# Età (s) dell'ultimo valore buono per sensore (>0: riga con valore in cache) + guasti nel minuto
+SENSOR_AGE_COLUMNS = ["shtc3_age_s", "lps_age_s", "mag_age_s", "sensor_faults"]
+# Luce (TCS34725, letture su interrupt di soglia): lux medio/min/max, temperatura di colore
+LIGHT_COLUMNS = ["light_lux", "light_lux_min", "light_lux_max", "light_cct_k", "light_reads"]
+# Alimentazione (SGM58031 in continua + flag undervoltage del Pi): righe con cali escluse dalle evidenze
+SUPPLY_COLUMNS = ["vin_mean_v", "vin_min_v", "vin_dips", "vaux_mean_v", "vaux_min_v", "supply_n", "pi_uv"]
+SUPPLY_DIP_V = float(os.environ.get("SUPPLY_DIP_V", "4.75"))   # stessa soglia del logger
+# Qualità GPS per intervallo (statistiche su tutti i TPV del minuto)
+GPS_QUALITY_COLUMNS = [
+    "gps_n_tpv", "gps_n_3d", "gps_n_2d", "gps_n_nofix", "gps_dropouts",
+    "gps_h_std_m", "gps_v_std_m", "gps_h_span_m",
+    "gps_eph_mean", "gps_eph_max", "gps_epv_mean", "gps_epv_max",
+    "gps_h_drift_m", "gps_v_drift_m"
+]
+# Aggregati SKY per costellazione (GPS/GLONASS/Galileo/BeiDou) e per elevazione
+SKY_COLUMNS = [
+    f"sky_{c}_{k}" for c in ("gps", "glo", "gal", "bds") for k in ("used", "tot", "cn0")
+] + ["sky_cn0_lo_el", "sky_cn0_hi_el"]
 AK09916_UT_PER_COUNT = 0.15  # ICM-20948 magnetometer (AK09916): ~0.15 µT/LSB
 # usiamo SEMPRE snake case minuscolo per le metriche
 MAG_METRIC_NAME = "mag_norm_ut"
-OTHER_METRICS = [MAG_METRIC_NAME]  # derivata dai counts
+OTHER_METRICS = [MAG_METRIC_NAME, "mag_b_ut", "mag_dbdt_max_nts"]  # counts → µT + pipeline calibrata
 
 
 def _storm_mask(df: pd.DataFrame) -> pd.Series:
@@ -52,6 +105,17 @@ def _storm_mask(df: pd.DataFrame) -> pd.Series:
     # Se non c’è nessuna info, tutto False → niente evidenze
     return m
 
+def _power_glitch_mask(df: pd.DataFrame) -> pd.Series:
+    # righe registrate durante un calo di alimentazione (ADC o flag undervoltage del Pi);
+    # anche vin_min_v sotto soglia, per le righe scritte prima che i cali lunghi contassero
+    m = pd.Series(False, index=df.index)
+    for col in ("vin_dips", "pi_uv"):
+        if col in df.columns:
+            m |= pd.to_numeric(df[col], errors="coerce").fillna(0).gt(0)
+    if "vin_min_v" in df.columns:
+        m |= pd.to_numeric(df["vin_min_v"], errors="coerce").lt(SUPPLY_DIP_V)
+    return m
+
 def _median_or_none(series: pd.Series) -> float | None:
     try:
         s = pd.to_numeric(series, errors="coerce").dropna()
@@ -66,6 +130,9 @@ def compute_evidence(df: pd.DataFrame) -> list[dict]:
     # mask storm/quiet
     storm = _storm_mask(df)
     quiet = ~storm
+    # niente evidenze da righe con alimentazione instabile
+    glitch = _power_glitch_mask(df)
+    storm, quiet = storm & ~glitch, quiet & ~glitch
 
     out = []
 
@@ -135,26 +202,153 @@ def compute_evidence(df: pd.DataFrame) -> list[dict]:
     return out
 
 
-def _read_db_range(start_iso, end_iso):
+def _iso_ms(s):
+    t = pd.Timestamp(s)
+    t = t.tz_localize("UTC") if t.tzinfo is None else t.tz_convert("UTC")
+    return int(t.value // 1_000_000)
+
+
+def _db_sources(con, lo_ms, hi_ms):
+    """
+    Schemi da interrogare per [lo_ms, hi_ms): le partizioni mensili del catalogo che si
+    sovrappongono, attaccate una alla volta come "part" (sola lettura, immutable se sigillate:
+    niente lock, niente limite di ATTACH); "main" se l'archivio non è partizionato.
+    """
+    if not con.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='partitions'").fetchone():
+        yield "main"
+        return
+    parts = con.execute("SELECT file, sealed FROM partitions WHERE t0_ms < ? AND t1_ms > ? "
+                        "ORDER BY t0_ms", (hi_ms, lo_ms)).fetchall()
+    for f, sealed in parts:
+        path = os.path.join(os.path.dirname(DB_PATH), f)
+        if not os.path.exists(path):
+            print(f"[DB] partition missing: {path}")
+            continue
+        con.execute("ATTACH DATABASE ? AS part",
+                    (f"file:{path}?mode=ro" + ("&immutable=1" if sealed else ""),))
+        try:
+            yield "part"
+        finally:
+            con.execute("DETACH DATABASE part")
+
+
+def _parquet_paths(lo_ms, hi_ms):
+    """File Parquet giornalieri che coprono [lo_ms, hi_ms); None se ne manca anche uno solo."""
+    day = datetime.fromtimestamp(lo_ms / 1000, timezone.utc).date()
+    last = datetime.fromtimestamp((hi_ms - 1) / 1000, timezone.utc).date()
+    paths = []
+    while day <= last:
+        path = os.path.join(PARQUET_DIR, day.strftime("%Y"), day.strftime("%m"),
+                            f"{BASE_NAME}_{day.strftime('%Y%m%d')}.parquet")
+        if not os.path.exists(path):
+            return None
+        paths.append(path)
+        day += timedelta(days=1)
+    return paths
+
+
+def _read_parquet_range(start_iso, end_iso, band=None, columns=None):
+    """
+    Come _read_db_range ma dalla copia Parquet dell'archivio: solo le colonne richieste e solo i
+    row group le cui statistiche (ts_ms, band) intersecano il filtro. Colonne già tipizzate.
+    None se pyarrow manca o un giorno dell'intervallo non ha il file: si legge da SQLite.
+    """
+    if not _HAS_PYARROW:
+        return None
+    lo, hi = _iso_ms(start_iso), _iso_ms(end_iso)
+    paths = _parquet_paths(lo, hi)
+    if not paths:
+        return None
+    try:
+        schema = pq.read_schema(paths[-1])          # il più recente: colonne nuove come null nei vecchi
+        cols = [c for c in (columns or CSV_COLUMNS) if c in schema.names] + ["ts_ms"]
+        filters = [("ts_ms", ">=", lo), ("ts_ms", "<", hi)]
+        if band is not None:
+            filters += [("band", "=", str(band)), ("mode", "in", ["SURVEY", "SCAN"])]
+        df = pq.read_table(paths, columns=cols, filters=filters, schema=schema).to_pandas()
+    except Exception as e:
+        print(f"[PARQUET] ERROR reading {paths[0]}..: {e}")
+        return None
+    df = df.sort_values("ts_ms", kind="stable").reset_index(drop=True)   # file ordinati per banda
+    print(f"[PARQUET] rows={len(df)} from {start_iso} to {end_iso} ({len(paths)} files)")
+    return df
+
+
+def _read_cold(con, db, lo_ms, hi_ms, band, cols):
+    """
+    Righe di una partizione nello storico freddo (blocchi colblock per giorno e colonna) in
+    [lo_ms, hi_ms): si leggono solo i blocchi delle colonne richieste, decodifica NumPy.
+    """
+    if db == "main" or not con.execute(
+            f"SELECT 1 FROM {db}.sqlite_master WHERE name='cold'").fetchone():
+        return pd.DataFrame()
+    if not _HAS_COLBLOCK:
+        print(f"[DB] cold partition skipped: colblock not found in {ARCHIVE_LIB}")
+        return pd.DataFrame()
+    need = list(dict.fromkeys(list(cols) + ["ts_ms", "band", "mode"]))
+    days = {}
+    for d, c, data in con.execute(
+            f"SELECT day_ms, col, data FROM {db}.cold WHERE day_ms >= ? AND day_ms < ? "
+            f"AND col IN ({','.join('?' * len(need))})", [lo_ms - lo_ms % 86400000, hi_ms] + need):
+        days.setdefault(d, {})[c] = colblock.decode(data)
+    frames = []
+    for d in sorted(days):
+        df = pd.DataFrame(days[d])
+        m = (df["ts_ms"] >= lo_ms) & (df["ts_ms"] < hi_ms)
+        if band is not None:
+            m &= (df["band"] == str(band)) & df["mode"].isin(["SURVEY", "SCAN"])
+        frames.append(df.loc[m, [c for c in cols if c in df.columns]])
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def _is_cold(con, db):
+    """La partizione attaccata come db è nello storico freddo (raw solo a blocchi colblock)."""
+    return db != "main" and bool(con.execute(
+        f"SELECT 1 FROM {db}.sqlite_master WHERE name='cold'").fetchone()) and bool(
+        con.execute(f"SELECT 1 FROM {db}.cold LIMIT 1").fetchone())
+
+
+def _read_db_range(start_iso, end_iso, band=None, columns=None):
+    """
+    Righe di raw in [start, end), solo dalle partizioni mensili che lo coprono. Con ts_ms
+    (epoch ms UTC, archivio migrato) la scansione è sull'indice intero, indipendente dal
+    formato/offset di ts_iso; band filtra le righe dell'intervallo. columns: sottoinsieme di
+    CSV_COLUMNS da leggere (None = tutte). Se c'è la copia Parquet di tutti i giorni si usa quella.
+    """
+    df_pq = _read_parquet_range(start_iso, end_iso, band, columns)
+    if df_pq is not None:
+        return df_pq
     if not os.path.exists(DB_PATH):
         print(f"[DB] not found: {DB_PATH}")
         return pd.DataFrame()
     try:
-        con = sqlite3.connect(DB_PATH)
-        q = """
-        SELECT ts_iso, kp, kp_when, gps_fix, lat, lon, alt,
-            pdop, hdop, vdop, sv_used, sv_tot, cn0_mean,
-            mode, freq, noise_dbm, busy_ratio, scan_n, scan_p50, scan_p10, scan_p90, band,
-            tec, tec_source,
-            t_c, rh_pct, p_hpa,
-            mag_x_counts, mag_y_counts, mag_z_counts, mag_norm_counts
-        FROM raw
-        WHERE ts_iso >= ? AND ts_iso < ?
-        ORDER BY ts_iso ASC
-        """
-
-        df_db = pd.read_sql_query(q, con, params=[start_iso, end_iso])
+        con = sqlite3.connect(DB_PATH, uri=True)
+        lo, hi = _iso_ms(start_iso), _iso_ms(end_iso)
+        frames = []
+        for db in _db_sources(con, lo, hi):
+            # solo le colonne del CSV presenti nel DB (l'archivio migra lo schema di notte)
+            have = {r[1] for r in con.execute(f"PRAGMA {db}.table_info(raw)")}
+            cols = [c for c in (columns or CSV_COLUMNS) if c in have]
+            if "ts_ms" in have:
+                cols.append("ts_ms")
+                where, params, order = "ts_ms >= ? AND ts_ms < ?", [lo, hi], "ts_ms"
+            else:
+                where, params, order = "ts_iso >= ? AND ts_iso < ?", [start_iso, end_iso], "ts_iso"
+            if band is not None and "band" in have:
+                # solo le righe RF (SURVEY/SCAN) della banda; la scansione resta sulla PK ts_ms
+                where = "band = ? AND mode IN ('SURVEY','SCAN') AND " + where
+                params = [str(band)] + params
+            q = f"""
+            SELECT {", ".join(cols)}
+            FROM {db}.raw
+            WHERE {where}
+            ORDER BY {order} ASC
+            """
+            frames.append(pd.read_sql_query(q, con, params=params))
+            frames.append(_read_cold(con, db, lo, hi, band, cols))      # mesi nello storico freddo
         con.close()
+        frames = [f for f in frames if not f.empty]
+        df_db = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
         df_db = _coerce_numeric(df_db)   # Trasforma in numero gli n/a
         print(f"[DB] rows={len(df_db)} from {start_iso} to {end_iso}")
         return df_db
@@ -168,6 +362,124 @@ def _read_db_range(start_iso, end_iso):
         return pd.DataFrame()
 
 
+# --- Serie dai livelli dell'archivio (rollup_1m/5m/hourly/daily di spacewx_archive) ---
+# (secondi, tabella, chiave) dal più fine al più grosso
+SERIES_TIERS = [
+    (60, "rollup_1m", "t_ms"),
+    (300, "rollup_5m", "t_ms"),
+    (3600, "rollup_hourly", "hour_utc"),
+    (86400, "rollup_daily", "day_utc"),
+]
+# metriche RF: aggregate per (banda, modo); tutte le altre sono di ciclo (band=mode='*')
+_RF_MODE = {"noise_dbm": "SURVEY", "busy_ratio": "SURVEY", "scan_n": "SCAN",
+            "scan_p10": "SCAN", "scan_p50": "SCAN", "scan_p90": "SCAN"}
+
+
+def pick_tier(span_s, points):
+    """Il livello più grosso che dà ancora almeno ~points/2 punti su span_s secondi."""
+    for tier in reversed(SERIES_TIERS):
+        if span_s / tier[0] >= points / 2:
+            return tier
+    return SERIES_TIERS[0]
+
+
+def _read_tier(tier, metric, band, mode, start, end, stat):
+    """[(datetime UTC, valore)] del livello in [start, end), bucket iniziale compreso; None se assente."""
+    sec, table, key = tier
+    if not os.path.exists(DB_PATH):
+        return None
+    if key == "t_ms":
+        step = sec * 1000
+        lo, hi = _iso_ms(start) // step * step, _iso_ms(end)
+        conv = lambda k: datetime.fromtimestamp(k / 1000, timezone.utc)
+    else:
+        fmt = "%Y-%m-%dT%H:00Z" if sec == 3600 else "%Y-%m-%d"
+        lo, hi = start.strftime(fmt), end.strftime(fmt)
+        conv = lambda k: datetime.strptime(k, fmt).replace(tzinfo=timezone.utc)
+    if key == "t_ms":                     # partizioni: chiavi id di dim, n=1 solo in mean
+        dim = "(SELECT id FROM {db}.dim WHERE value = ?)"
+        q = (f"SELECT t_ms, COALESCE({stat}, mean) FROM {{db}}.{table} "
+             f"WHERE metric_id = {dim} AND band_id = {dim} AND mode_id = {dim} "
+             f"AND t_ms >= ? AND t_ms < ? ORDER BY t_ms")
+    else:
+        q = (f"SELECT {key}, {stat} FROM {{db}}.{table} "
+             f"WHERE metric = ? AND band = ? AND mode = ? AND {key} >= ? AND {key} < ? ORDER BY {key}")
+    try:
+        con = sqlite3.connect(DB_PATH, uri=True)
+        if key == "t_ms":                 # 1m/5m stanno nelle partizioni mensili
+            rows = []
+            for db in _db_sources(con, lo, hi):
+                if table == "rollup_1m" and _is_cold(con, db):
+                    rows = None               # mese freddo: niente 1m, il chiamante legge i blocchi
+                    break
+                rows += con.execute(q.format(db=db), (metric, band, mode, lo, hi)).fetchall()
+        else:
+            rows = con.execute(q.format(db="main"), (metric, band, mode, lo, hi)).fetchall()
+        con.close()
+    except sqlite3.Error as e:
+        print(f"[DB] tier {table}: {e}")
+        return None
+    if rows is None:
+        return None
+    return [(conv(k), v) for k, v in rows if v is not None]
+
+
+def _csv_tier_points(metric, band, mode, start, end, sec, stat):
+    """Parte di oggi (non ancora archiviata) dal CSV, ricampionata al passo del livello."""
+    path = daily_csv_path_for_date(TODAY_UTC())
+    if not os.path.exists(path):
+        return []
+    df = _coerce_numeric(_parse_ts(_read_csv_range(path, start, end)))
+    if metric not in df.columns:
+        return []
+    df = df[(df["ts"] >= pd.Timestamp(start)) & (df["ts"] < pd.Timestamp(end))]
+    if mode == "*":
+        df = df.drop_duplicates("ts")          # metriche di ciclo: una volta per ciclo
+    else:
+        df = df[(df["mode"].astype(str) == mode) & (df["band"] == str(band))]
+    s = df.set_index("ts")[metric].dropna()
+    if s.empty:
+        return []
+    r = s.resample(f"{sec}s")
+    s = (r.median() if stat == "p50" else r.mean()).dropna()
+    return [(t.to_pydatetime(), float(v)) for t, v in s.items()]
+
+
+def series_tiered(metric, band, start, end, points, agg=""):
+    """
+    Serie di ~points punti su [start, end) dal livello scelto con pick_tier: il costo non
+    dipende dalla lunghezza dell'intervallo. Storico dal DB, oggi dal CSV al passo del livello.
+    None se l'archivio non ha i livelli (o la metrica): il chiamante usa il percorso grezzo.
+    """
+    src, scale = (("mag_norm_counts", AK09916_UT_PER_COUNT) if metric == "mag_norm_ut"
+                  else (metric, 1.0))
+    mode = _RF_MODE.get(src)
+    if mode is None:
+        band = mode = "*"
+    elif band is None:
+        return None
+    stat = "p50" if agg == "median" else "mean"
+    tier = pick_tier((end - start).total_seconds(), points)
+    start_today = datetime.combine(TODAY_UTC(), datetime.min.time(), tzinfo=timezone.utc)
+    pts = []
+    if start < start_today:
+        db = _read_tier(tier, src, band, mode, start, min(end, start_today), stat)
+        if not db:
+            return None
+        pts += db
+    if end > start_today:
+        pts += _csv_tier_points(src, band, mode, max(start, start_today), end, tier[0], stat)
+    return {"points": [[t.isoformat(), float(v) * scale] for t, v in pts], "tier": tier[1]}
+
+
+def _series_range(day, minutes):
+    if day is not None:
+        start = datetime.combine(day, datetime.min.time(), tzinfo=timezone.utc)
+        return start, start + timedelta(days=1)
+    now = datetime.now(timezone.utc)
+    return now - timedelta(minutes=minutes), now
+
+
 def none_if_nan(x):
     try:
         return None if (x is None or not math.isfinite(float(x))) else float(x)
@@ -194,11 +506,20 @@ CSV_COLUMNS = [
     "mode","freq","noise_dbm","busy_ratio","scan_n","scan_p50","scan_p10","scan_p90",
     "band","tec","tec_source",
     "t_c","rh_pct","p_hpa",
-    "mag_x_counts","mag_y_counts","mag_z_counts","mag_norm_counts"
+    "mag_x_counts","mag_y_counts","mag_z_counts","mag_norm_counts",
+    "scan_sketch",
+    *GPS_QUALITY_COLUMNS,
+    *SKY_COLUMNS,
+    *ENV_STAT_COLUMNS,
+    *MAG_CAL_COLUMNS,
+    *SENSOR_AGE_COLUMNS,
+    *LIGHT_COLUMNS,
+    *SUPPLY_COLUMNS
 ]
 
 
-def _read_csv_robust(path: str) -> pd.DataFrame:
+def _read_csv_robust(path) -> pd.DataFrame:
+    # path: file o buffer (righe già ritagliate da _read_csv_range)
     # 1° tentativo: usare l’header del file
     try:
         return pd.read_csv(
@@ -210,6 +531,8 @@ def _read_csv_robust(path: str) -> pd.DataFrame:
         )
     except Exception as e:
         print(f"[CSV] header=0 failed: {e}")
+    if hasattr(path, "seek"):
+        path.seek(0)
     # 2° tentativo: forziamo i nomi e skippiamo righe ‘sporche’
     try:
         return pd.read_csv(
@@ -226,6 +549,23 @@ def _read_csv_robust(path: str) -> pd.DataFrame:
         return pd.DataFrame()
 
 
+def _read_csv_range(path: str, start: datetime, end: datetime) -> pd.DataFrame:
+    """
+    Solo le righe dei minuti tra start ed end, via indice <file>.idx del logger (seek all'offset
+    del primo minuto, per i .gz al membro gzip); senza indice il file intero.
+    Il chiamante filtra comunque su ts: ai bordi restano righe dei minuti parziali.
+    """
+    if _HAS_CSV_INDEX:
+        try:
+            data = csv_index.read_range(path, start.timestamp(), end.timestamp())
+        except Exception as e:
+            print(f"[CSV] index read failed {path}: {e}")
+            data = None
+        if data is not None:
+            return _read_csv_robust(io.BytesIO(data))
+    return _read_csv_robust(path)
+
+
 # --- Normalizzazioni / util ---
 def _normalize_band(s):
     if s is None: return None
@@ -253,6 +593,10 @@ def _parse_ts(df):
         )
     else:
         df["ts"] = pd.NaT
+    if "ts_ms" in df.columns:
+        # righe dal DB: chiave intera UTC, vale anche dove ts_iso ha un altro formato/offset
+        ms = pd.to_datetime(pd.to_numeric(df["ts_ms"], errors="coerce"), unit="ms", utc=True)
+        df["ts"] = ms.fillna(df["ts"])
     return df
 
 
@@ -262,7 +606,14 @@ NUMERIC_COLS = [
     "noise_dbm", "busy_ratio", "scan_n", "scan_p50", "scan_p10", "scan_p90",
     "lat", "lon", "alt", "tec", "freq",
     "t_c", "rh_pct", "p_hpa",
-    "mag_x_counts","mag_y_counts","mag_z_counts","mag_norm_counts"
+    "mag_x_counts","mag_y_counts","mag_z_counts","mag_norm_counts",
+    *GPS_QUALITY_COLUMNS,
+    *SKY_COLUMNS,
+    *ENV_STAT_COLUMNS,
+    *MAG_CAL_COLUMNS,
+    *SENSOR_AGE_COLUMNS,
+    *LIGHT_COLUMNS,
+    *SUPPLY_COLUMNS
 ]
 
 
@@ -270,10 +621,13 @@ def _coerce_numeric(df: pd.DataFrame) -> pd.DataFrame:
     if df is None or df.empty:
         return df
     # Trasforma stringhe 'n/a', 'NA', '' in NaN in modo robusto
-    df = df.replace({"n/a": None, "N/A": None, "NA": None, "": None})
+    # (solo colonne testuali: quelle già tipizzate, da Parquet/SQLite, non si toccano)
+    obj = df.select_dtypes(include=["object", "string"]).columns
+    if len(obj):
+        df[obj] = df[obj].replace({"n/a": None, "N/A": None, "NA": None, "": None})
     # Forza colonne numeriche dove presenti
     for c in NUMERIC_COLS:
-        if c in df.columns:
+        if c in df.columns and not pd.api.types.is_numeric_dtype(df[c]):
             df[c] = pd.to_numeric(df[c], errors="coerce")
     # Normalizza band a stringa (usata per filtri testuali)
     if "band" in df.columns:
@@ -287,12 +641,22 @@ def _coerce_numeric(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 # --- Loader composito: DB (storico) + CSV (oggi) ---
-def load_df(minutes=None, max_rows=250_000, specific_day: date | None = None):
+# colonne sempre lette dall'archivio quando il chiamante ne chiede solo alcune
+LOAD_KEY_COLUMNS = ["ts_iso", "mode", "freq", "band"]
+
+
+def load_df(minutes=None, max_rows=250_000, specific_day: date | None = None, band=None,
+            columns=None):
     """
     Se specific_day è valorizzato, carica solo [specific_day 00:00Z, specific_day+1 00:00Z).
     Altrimenti usa la finestra scorrevole 'minutes' (default 3 giorni).
+    band ("24"/"58"): solo le righe di quella banda (dal DB via indice band/mode/ts_ms).
+    columns: colonne che servono al chiamante (più LOAD_KEY_COLUMNS); lo storico legge solo
+    quelle (Parquet: solo quelle colonne su disco). None = tutte.
     """
     now = datetime.now(timezone.utc)
+    if columns is not None:
+        columns = LOAD_KEY_COLUMNS + [c for c in columns if c not in LOAD_KEY_COLUMNS]
 
     if specific_day:
         start = datetime.combine(specific_day, datetime.min.time(), tzinfo=timezone.utc)
@@ -300,15 +664,18 @@ def load_df(minutes=None, max_rows=250_000, specific_day: date | None = None):
         frames = []
 
         # --- DB storico per quel giorno
-        df_db = _read_db_range(start.isoformat(), end.isoformat())
+        df_db = _read_db_range(start.isoformat(), end.isoformat(), band, columns)
         if not df_db.empty:
             frames.append(df_db)
 
-        # --- CSV del giorno (tipicamente solo oggi; ieri di solito è già nel DB)
+        # --- CSV del giorno (tipicamente solo oggi; ieri di solito è già nel DB,
+        #     altrimenti il .csv.gz compresso dal logger)
         csv_path = daily_csv_path_for_date(specific_day)
+        if not os.path.exists(csv_path) and df_db.empty:
+            csv_path += ".gz"
         if os.path.exists(csv_path):
             try:
-                frames.append(_read_csv_robust(csv_path))
+                frames.append(_read_csv_range(csv_path, start, end))
             except Exception as e:
                 print(f"[CSV] ERROR reading {csv_path}: {e}")
 
@@ -323,6 +690,8 @@ def load_df(minutes=None, max_rows=250_000, specific_day: date | None = None):
         df = df[mask]
         if "band" in df.columns:
             df["band"] = df["band"].astype(str)
+            if band is not None:
+                df = df[df["band"] == str(band)]
         if len(df) > max_rows:
             df = df.tail(max_rows)
         return df.reset_index(drop=True)
@@ -336,7 +705,7 @@ def load_df(minutes=None, max_rows=250_000, specific_day: date | None = None):
 
     # --- DB storico da cutoff fino a inizio oggi (se la finestra sconfina nel passato)
     if os.path.exists(DB_PATH) and cutoff < start_today:
-        df_db = _read_db_range(cutoff.isoformat(), start_today.isoformat())
+        df_db = _read_db_range(cutoff.isoformat(), start_today.isoformat(), band, columns)
         if not df_db.empty:
             frames.append(df_db)
 
@@ -344,7 +713,7 @@ def load_df(minutes=None, max_rows=250_000, specific_day: date | None = None):
     csv_today = daily_csv_path_for_date(now.date())
     if os.path.exists(csv_today):
         try:
-            frames.append(_read_csv_robust(csv_today))
+            frames.append(_read_csv_range(csv_today, max(cutoff, start_today), now))
         except Exception as e:
             print(f"[CSV] ERROR reading {csv_today}: {e}")
 
@@ -362,6 +731,8 @@ def load_df(minutes=None, max_rows=250_000, specific_day: date | None = None):
         df = df[mask]
     if "band" in df.columns:
         df["band"] = df["band"].astype(str)
+        if band is not None:
+            df = df[df["band"] == str(band)]
     if len(df) > max_rows:
         df = df.tail(max_rows)
     return df.reset_index(drop=True)
@@ -526,7 +897,7 @@ def api_latest():
 def api_gps_track():
     day = parse_day_param(request.args.get("day"))
     minutes = int(request.args.get("minutes", "180"))
-    df = load_df(minutes=minutes, specific_day=day)
+    df = load_df(minutes=minutes, specific_day=day, columns=["lat", "lon"])
 
     if df.empty or "lat" not in df.columns or "lon" not in df.columns:
         return jsonify({"ok": True, "points": []})
@@ -549,8 +920,20 @@ def api_series():
     minutes = int(request.args.get("minutes", "4320"))
     agg     = (request.args.get("agg") or "").strip().lower()
     window  = (request.args.get("window") or "").strip().lower()
+    points  = int(request.args.get("points", "0"))
 
-    df = load_df(minutes=minutes, specific_day=day)
+    # ?points=N: serie dai livelli dell'archivio, ~N punti qualunque sia l'intervallo
+    if points > 0 and (metric in _RF_MODE or metric == "kp"):
+        start, end = _series_range(day, minutes)
+        res = series_tiered(metric, band, start, end, points, agg)
+        if res is not None and not res["points"] and metric in ("noise_dbm", "busy_ratio"):
+            res = series_tiered("scan_p50", band, start, end, points, agg) or res
+        if res is not None:
+            return jsonify({"ok": True, **res})
+
+    # filtro banda già nella query (kp non dipende dalla banda)
+    df = load_df(minutes=minutes, specific_day=day, band=band if metric != "kp" else None,
+                 columns=[metric, "scan_p50"])
 
     if df.empty:
         return jsonify({"ok": True, "points": []})
@@ -601,8 +984,15 @@ def api_series_gps():
     minutes = int(request.args.get("minutes", "4320"))
     agg     = (request.args.get("agg") or "").strip().lower()
     window  = (request.args.get("window") or "").strip().lower()
+    points  = int(request.args.get("points", "0"))
 
-    df = load_df(minutes=minutes, specific_day=day)
+    if points > 0:
+        res = series_tiered(metric, None, *_series_range(day, minutes), points, agg)
+        if res is not None:
+            return jsonify({"ok": True, **res})
+
+    df = load_df(minutes=minutes, specific_day=day,
+                 columns=["mag_norm_counts" if metric == "mag_norm_ut" else metric])
 
     if df.empty:
         return jsonify({"ok": True, "points": []})
@@ -635,6 +1025,35 @@ def api_series_gps():
 
     return jsonify({"ok": True, "points": out})
 
+@app.get("/api/rf_percentiles")
+def api_rf_percentiles():
+    """
+    Percentili RSSI orari/giornalieri da sketch fusi (rollup_rf_* dell'archivio).
+    ?band=24|58 &res=hour|day &days=N &freq=MHz (default 0 = tutta la banda)
+    """
+    band = _normalize_band(request.args.get("band")) or "24"
+    res  = (request.args.get("res") or "hour").strip().lower()
+    days = int(request.args.get("days", "7"))
+    freq = int(request.args.get("freq", "0"))
+    table, key = ("rollup_rf_daily", "day_utc") if res == "day" else ("rollup_rf_hourly", "hour_utc")
+    since = (datetime.now(timezone.utc) - timedelta(days=days)).strftime("%Y-%m-%dT%H")
+    if not os.path.exists(DB_PATH):
+        return jsonify({"ok": True, "points": []})
+    try:
+        con = sqlite3.connect(DB_PATH)
+        rows = con.execute(
+            f"SELECT {key}, n, p10, p50, p90 FROM {table} "
+            f"WHERE band = ? AND freq = ? AND {key} >= ? ORDER BY {key} ASC",
+            (band, freq, since[:10] if res == "day" else since)
+        ).fetchall()
+        con.close()
+    except Exception as e:
+        print(f"[DB] ERROR reading {table}: {e}")
+        return jsonify({"ok": True, "points": []})
+    out = [{"t": t, "n": n, "p10": p10, "p50": p50, "p90": p90} for t, n, p10, p50, p90 in rows]
+    return jsonify({"ok": True, "points": out})
+
+
 @app.get("/api/glossary")
 def api_glossary():
     G = [
@@ -655,9 +1074,32 @@ def api_glossary():
         {"field":"tec_source","label":"Sorgente TEC","desc":"Modello/servizio e timestamp del dato TEC."},
         {"field":"t_c","label":"Temperatura (°C)","desc":"Temperatura ambiente locale dal sensore."},
         {"field":"rh_pct","label":"Umidità (%)","desc":"Umidità relativa."},
-        {"field":"p_hpa","label":"Pressione (hPa)","desc":"Pressione atmosferica al livello del sensore."},
+        {"field":"p_hpa","label":"Pressione (hPa)","desc":"Pressione atmosferica al livello del sensore (media dei campioni FIFO: intervallo intero col campionatore continuo, altrimenti gli ultimi ~32 s)."},
+        {"field":"p_hpa_min/p_hpa_max","label":"Pressione min/max (hPa)","desc":"Estremi dei campioni di pressione (stessa copertura di p_hpa)."},
+        {"field":"*_min/*_max/*_std","label":"Statistiche ambientali","desc":"Minimo, massimo e deviazione standard di temperatura, umidità, pressione e norma magnetica sui campioni continui (1–5 Hz) del minuto."},
+        {"field":"env_n","label":"Campioni ambientali","desc":"Numero di campioni raccolti dal campionatore continuo nell'intervallo."},
         {"field":"mag_*_counts","label":"Magnetometro (counts)","desc":"Valori grezzi X/Y/Z e norma (per analisi differenziali)."},
         {"field":"mag_norm_uT","label":"Campo magnetico (µT)","desc":"Norma del campo convertita in microtesla (≈0,15 µT/LSB)."},
+        {"field":"mag_b*_ut","label":"Campo calibrato (µT)","desc":"Componenti e norma del campo con correzione hard/soft-iron, media del minuto dalla serie a 1 s (campionamento 10–100 Hz)."},
+        {"field":"mag_dbdt_max_nts/mag_dbdt_rms_nts","label":"dB/dt (nT/s)","desc":"Variazione del vettore campo tra secondi consecutivi: massimo e RMS nel minuto. Picchi indicano pulsazioni o improvvisi inizi di tempesta."},
+        {"field":"*_age_s","label":"Età dato sensore (s)","desc":"Secondi dall'ultima lettura riuscita di SHTC3, LPS22HB e magnetometro: se alta, il valore della riga è l'ultimo buono in cache (sensore lento o bloccato)."},
+        {"field":"sensor_faults","label":"Guasti sensori","desc":"Letture scadute o fallite nel minuto (i sensori che falliscono di continuo vengono reinizializzati con backoff)."},
+        {"field":"light_lux/_min/_max","label":"Illuminamento (lux)","desc":"Luce ambiente dal TCS34725: media pesata sul tempo e min/max del minuto. Distingue giorno/notte e passaggi di nubi; il sensore viene letto solo quando il valore esce di ±15% (con persistenza)."},
+        {"field":"light_cct_k","label":"Temperatura di colore (K)","desc":"Temperatura di colore correlata dell'ultima lettura: più alta con cielo coperto/ombra, più bassa all'alba e al tramonto."},
+        {"field":"light_reads","label":"Letture luce","desc":"Letture del sensore di luce nel minuto (0 = luce stabile, nessun interrupt)."},
+        {"field":"vin_mean_v/vin_min_v","label":"Tensione alimentazione (V)","desc":"Rail 5 V letto dall'ADC SGM58031 (partitore su AIN0) in conversione continua: media e minimo del minuto."},
+        {"field":"vin_dips","label":"Cali di tensione","desc":"Numero di cali sotto 4,75 V nel minuto. Le righe con cali o con undervoltage del Pi sono escluse dal confronto quiete/tempesta."},
+        {"field":"pi_uv","label":"Undervoltage Pi","desc":"Allarme di sottotensione del firmware del Raspberry Pi nel minuto (1 = presente)."},
+        {"field":"mag_rate_hz/mag_cpu_pct","label":"Pipeline magnetometro","desc":"Frequenza di campionamento effettiva e CPU usata dal thread (si riduce da sola oltre il budget)."},
+        {"field":"gps_n_tpv/3d/2d/nofix","label":"TPV nell'intervallo","desc":"Numero di TPV ricevuti nel minuto e ripartizione per tipo di fix."},
+        {"field":"gps_dropouts","label":"Perdite di fix","desc":"Transizioni fix→nessun fix nel minuto."},
+        {"field":"gps_h_std_m/gps_v_std_m","label":"Jitter posizione (m)","desc":"Deviazione standard orizzontale/verticale della posizione nel minuto."},
+        {"field":"gps_h_span_m","label":"Escursione orizzontale (m)","desc":"Diagonale del box min/max lat/lon nel minuto."},
+        {"field":"gps_eph_*/gps_epv_*","label":"Errore stimato (m)","desc":"Media e massimo di eph/epv dichiarati dal ricevitore."},
+        {"field":"sky_{gps,glo,gal,bds}_used/tot","label":"Satelliti per costellazione","desc":"Usati / visti per GPS, GLONASS, Galileo e BeiDou."},
+        {"field":"sky_{gps,glo,gal,bds}_cn0","label":"C/N₀ per costellazione","desc":"C/N₀ medio (dB-Hz) dei satelliti della costellazione."},
+        {"field":"sky_cn0_lo_el/hi_el","label":"C/N₀ per elevazione","desc":"C/N₀ medio dei satelliti sotto/sopra 30° di elevazione (percorso ionosferico lungo vs corto)."},
+        {"field":"gps_h_drift_m/gps_v_drift_m","label":"Deriva dal riferimento (m)","desc":"Scostamento della posizione media del minuto dalla posizione di riferimento di lungo periodo."},
     ]
     return jsonify({"ok": True, "items": G})
 
@@ -169,6 +169,9 @@ if (nextDayBtn){ nextDayBtn.addEventListener('click', () => shiftDay(+1)); }
 
 
 
+// punti per grafico: il server sceglie il livello 1m/5m/1h/1d dell'archivio più adatto
+const SERIES_POINTS = 500;
+
 async function fetchJSON(url){
   const r = await fetch(url);
   const txt = await r.text();
@@ -204,6 +207,7 @@ async function loadSeries(metric, opts={}){
     band: opts.band,
     agg:  opts.agg,
     window: opts.window,
+    points: opts.points,
     day: currentDay || undefined,
     minutes: currentDay ? 1440 : (opts.minutes || 4320)
   });
@@ -216,6 +220,7 @@ async function loadSeriesGps(metric, opts={}){
     metric,
     agg:  opts.agg,
     window: opts.window,
+    points: opts.points,
     day: currentDay || undefined,
     minutes: currentDay ? 1440 : (opts.minutes || 4320)
   });
@@ -311,29 +316,30 @@ async function refreshAll(){
     const shortM       = currentDay ? 1440 : 180;
     const agg          = currentDay ? "median" : "";
     const win          = currentDay ? "5min"  : "";
+    const points       = SERIES_POINTS;   // livelli dell'archivio: ~N punti per grafico
 
     const tasks = [
       ['summary',     loadSummary()],
       ['latest',      fetchJSON('/api/latest')],
       ['glossary',    fetchJSON('/api/glossary')],
-      ['tec',         loadSeriesGps("tec",      { agg, window: win, minutes: minutesParam })],
-      ['hdop',        loadSeriesGps("hdop",     { agg, window: win, minutes: minutesParam })],
-      ['pdop',        loadSeriesGps("pdop",     { agg, window: win, minutes: minutesParam })],
-      ['vdop',        loadSeriesGps("vdop",     { agg, window: win, minutes: minutesParam })],
-      ['cn0',         loadSeriesGps("cn0_mean", { agg, window: win, minutes: minutesParam })],
-      ['sv_used',     loadSeriesGps("sv_used",  { agg, window: win, minutes: minutesParam })],
-      ['noise24',     loadSeries("noise_dbm", { band:"24", agg, window: win, minutes: minutesParam })],
-      ['noise58',     loadSeries("noise_dbm", { band:"58", agg, window: win, minutes: minutesParam })],
-      ['scan24',      loadSeries("scan_p50",  { band:"24", agg, window: win, minutes: minutesParam })],
-      ['scan58',      loadSeries("scan_p50",  { band:"58", agg, window: win, minutes: minutesParam })],
-      ['busy24',      loadSeries("busy_ratio", { band:"24", agg, window: win, minutes: minutesParam })],
-      ['busy58',      loadSeries("busy_ratio", { band:"58", agg, window: win, minutes: minutesParam })],
-      ['kp',          loadSeries("kp",        { minutes: minutesParam })],
+      ['tec',         loadSeriesGps("tec",      { agg, window: win, minutes: minutesParam, points })],
+      ['hdop',        loadSeriesGps("hdop",     { agg, window: win, minutes: minutesParam, points })],
+      ['pdop',        loadSeriesGps("pdop",     { agg, window: win, minutes: minutesParam, points })],
+      ['vdop',        loadSeriesGps("vdop",     { agg, window: win, minutes: minutesParam, points })],
+      ['cn0',         loadSeriesGps("cn0_mean", { agg, window: win, minutes: minutesParam, points })],
+      ['sv_used',     loadSeriesGps("sv_used",  { agg, window: win, minutes: minutesParam, points })],
+      ['noise24',     loadSeries("noise_dbm", { band:"24", agg, window: win, minutes: minutesParam, points })],
+      ['noise58',     loadSeries("noise_dbm", { band:"58", agg, window: win, minutes: minutesParam, points })],
+      ['scan24',      loadSeries("scan_p50",  { band:"24", agg, window: win, minutes: minutesParam, points })],
+      ['scan58',      loadSeries("scan_p50",  { band:"58", agg, window: win, minutes: minutesParam, points })],
+      ['busy24',      loadSeries("busy_ratio", { band:"24", agg, window: win, minutes: minutesParam, points })],
+      ['busy58',      loadSeries("busy_ratio", { band:"58", agg, window: win, minutes: minutesParam, points })],
+      ['kp',          loadSeries("kp",        { minutes: minutesParam, points })],
       ['track',       loadGpsTrack(shortM)],
-      ['temp',   loadSeriesGps("t_c",   { agg, window: win, minutes: minutesParam })],
-      ['hum',    loadSeriesGps("rh_pct",{ agg, window: win, minutes: minutesParam })],
-      ['press',  loadSeriesGps("p_hpa",{ agg, window: win, minutes: minutesParam })],
-      ['mag',    loadSeriesGps("mag_norm_ut",{ agg, window: win, minutes: minutesParam })],
+      ['temp',   loadSeriesGps("t_c",   { agg, window: win, minutes: minutesParam, points })],
+      ['hum',    loadSeriesGps("rh_pct",{ agg, window: win, minutes: minutesParam, points })],
+      ['press',  loadSeriesGps("p_hpa",{ agg, window: win, minutes: minutesParam, points })],
+      ['mag',    loadSeriesGps("mag_norm_ut",{ agg, window: win, minutes: minutesParam, points })],
 
     ];
 